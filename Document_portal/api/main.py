@@ -1,16 +1,23 @@
 from fastapi import FastAPI,UploadFile,File,Form,HTTPException,Request
-from fastapi.responses import JSONResponse,HTMLResponse
+from fastapi.responses import FileResponse,JSONResponse,HTMLResponse,StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from typing import Dict,List,Any,Optional
 from pathlib import Path
 import os
-from src.document_analyzer.data_analysis import DocumentAnalyzer
-from src.document_ingestion.data_ingestion import DocHandler,DocumentComparator,ChatIngestor
-from src.document_compare.document_comparator import DocumentComparatorLLM
-from src.document_chat.retrieval import ConversationalRAG
+import json
+from src.document_ingestion.metadata_index import build_filter
 from utils.document_ops import FastAPIFileAdapter,read_pdf_via_handler
+from utils.admission import AdmissionController,AdmissionMiddleware,process_metrics
+from utils.config_loader import load_config
+from utils.profiling import FORMATS,Profiler,ProfilingMiddleware,profiled,profiled_stream
+from utils.session_affinity import SessionAffinityMiddleware,SessionRouter
+from utils.warmup import Warmup
+
+# The pipeline modules (LangChain, FAISS, provider SDKs, PyMuPDF, pandas) are
+# imported inside the handlers, so the app starts serving /health at once;
+# Warmup imports them, builds the clients and loads hot indexes before /ready.
 
 
 FAISS_BASE = os.getenv("FAISS_BASE", "faiss_index")
@@ -18,10 +25,23 @@ UPLOAD_BASE = os.getenv("UPLOAD_BASE", "data")
 FAISS_INDEX_NAME = os.getenv("FAISS_INDEX_NAME", "index")  # <--- keep consistent with save_local()
 
 app = FastAPI(title="Document Portal API", version="0.1")
+warmup = Warmup(faiss_base=FAISS_BASE)
+CONFIG = load_config()
+# CLUSTER_NODES/NODE_URL set: session-scoped chat requests go to the node holding the index
+affinity = SessionRouter.from_env(CONFIG)
+# per-endpoint concurrency limits and priority queues in front of the LLM-bound handlers
+admission = AdmissionController.from_config(CONFIG)
+# PROFILING_TOKEN set: "X-Profile: <token>" samples that request, /admin/profile a time window
+profiler = Profiler.from_config(CONFIG)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+# last added runs first: CORS, then affinity (forwarded requests are admitted on the owner), then admission,
+# then profiling (only requests this node actually serves are profiled)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(SessionAffinityMiddleware, router=affinity)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,12 +57,71 @@ async def serve_ui(request: Request):
     resp.headers["Cache-Control"] = "no-store"
     return resp
 
+@app.on_event("startup")
+def start_warmup() -> None:
+    if os.getenv("WARMUP", "1") == "0":
+        warmup.skip()
+    else:
+        warmup.start()
+
 @app.get("/health")
 def health() -> Dict[str, str]:
     return {"status": "ok", "service": "document-portal"}
 
+@app.get("/ready")
+def ready() -> Any:
+    """Readiness: 200 once warmup finished, 503 (with progress) before that or if it failed."""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.report())
+
+@app.get("/cluster")
+def cluster() -> Dict[str, Any]:
+    """Session-affinity ring as this node sees it: members, unreachable nodes, routing counters."""
+    return affinity.report()
+
+@app.get("/metrics")
+def metrics() -> Dict[str, Any]:
+    """Admission queue depth/wait times plus the LLM gateway, router, batcher and index writer counters."""
+    return process_metrics(admission)
+
+def _profiling_access(request: Request) -> None:
+    if not profiler.enabled:
+        raise HTTPException(status_code=404,detail="Profiling is disabled (set PROFILING_TOKEN)")
+    if not profiler.authorized(request.headers.get("x-profile")):
+        raise HTTPException(status_code=403,detail="Missing or wrong X-Profile token")
+
+@app.post("/admin/profile")
+def start_profile(request: Request, seconds: float=Form(10.0), format: Optional[str]=Form(None)) -> Any:
+    """Sample every thread for ``seconds`` (capped by profiling.max_seconds); the file is written when it ends."""
+    _profiling_access(request)
+    if format is not None and format not in FORMATS:
+        raise HTTPException(status_code=400,detail=f"format must be one of {sorted(FORMATS)}")
+    profile=profiler.start("window",label="window",seconds=max(0.1,seconds),fmt=format)
+    if profile is None:
+        raise HTTPException(status_code=429,detail="Too many profiles running, retry later")
+    return {"profile":profile.name,"format":profile.format,"seconds":round(profile.deadline-profile.started,3)}
+
+@app.get("/admin/profiles")
+def list_profiles(request: Request) -> Dict[str, Any]:
+    """Running profiles, profiler counters and the saved profile files, newest first."""
+    _profiling_access(request)
+    return profiler.report()
+
+@app.get("/admin/profiles/{name}")
+def download_profile(name: str, request: Request) -> Any:
+    _profiling_access(request)
+    path=next((p for p in profiler.files() if p.name==name),None)
+    if path is None:
+        raise HTTPException(status_code=404,detail=f"No profile named {name}")
+    media_type="application/json" if name.endswith(FORMATS["speedscope"]) else "text/plain"
+    return FileResponse(path,media_type=media_type,filename=name)
+
+# Pipeline handlers do blocking I/O and LLM calls, so they are plain `def`
+# endpoints: FastAPI runs them in its threadpool instead of on the event loop.
 @app.post("/analyze")
-async def analyze_document(file: UploadFile=File(...))-> Any:
+@profiled
+def analyze_document(file: UploadFile=File(...))-> Any:
+    from src.document_ingestion.data_ingestion import DocHandler
+    from src.document_analyzer.data_analysis import DocumentAnalyzer
     try:
         dh=DocHandler()
         saved_path=dh.save_pdf(FastAPIFileAdapter(file))
@@ -55,7 +134,10 @@ async def analyze_document(file: UploadFile=File(...))-> Any:
         raise HTTPException(status_code=500,detail=f"Analysis failed : {e}")
     
 @app.post("/compare")
-async def compare_documents(reference: UploadFile=File(...),actual: UploadFile=File(...))-> Any:
+@profiled
+def compare_documents(reference: UploadFile=File(...),actual: UploadFile=File(...))-> Any:
+    from src.document_ingestion.data_ingestion import DocumentComparator
+    from src.document_compare.document_comparator import DocumentComparatorLLM
     try:
         dc=DocumentComparator()
         ref_path,act_path=dc.save_uploaded_files(FastAPIFileAdapter(reference),FastAPIFileAdapter(actual))
@@ -67,54 +149,157 @@ async def compare_documents(reference: UploadFile=File(...),actual: UploadFile=F
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Document comparison failed: {e}")
     
+@app.post("/compare/bulk")
+@profiled
+def compare_bulk(
+    reference: UploadFile=File(...),
+    candidates: List[UploadFile]=File(...),
+    max_concurrency: int=Form(4)
+)-> Any:
+    """
+    One reference vs N candidates in one job. Streams NDJSON: one line per
+    candidate as its comparison finishes, then a summary line.
+    """
+    from src.document_ingestion.data_ingestion import DocumentComparator
+    from src.document_compare.document_comparator import DocumentComparatorLLM
+    try:
+        dc=DocumentComparator()
+        ref_path,cand_paths=dc.save_bulk_files(FastAPIFileAdapter(reference),[FastAPIFileAdapter(c) for c in candidates])
+        ref_text=dc.read_pdf(ref_path)  # extracted once, shared by every candidate
+        comp=DocumentComparatorLLM()
+        results=comp.compare_many(
+            ref_path.name,ref_text,
+            [(p.name,lambda p=p: dc.read_pdf(p)) for p in cand_paths],
+            max_concurrency=max(1,min(max_concurrency,32)),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Bulk comparison failed: {e}")
+
+    def stream():
+        failed=0
+        for result in results:
+            failed+=result["status"]!="ok"
+            yield json.dumps(result,default=str)+"\n"
+        yield json.dumps({"done":True,"session_id":dc.session_id,"candidates":len(cand_paths),"failed":failed})+"\n"
+
+    # the comparisons are consumed after the handler returns; keep sampling the thread that streams them
+    return StreamingResponse(profiled_stream(stream()),media_type="application/x-ndjson")
+
 @app.post("/chat/index")
-async def chat_build_index(
+@profiled
+def chat_build_index(
     files: List[UploadFile]=File(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool=Form(True),
     chunk_size : int = Form(1000),
     chunk_overlap : int = Form(100),
-    k: int=Form(5)
+    k: int=Form(5),
+    replace: bool=Form(False)
 ) ->Any:
+    from src.document_ingestion.data_ingestion import ChatIngestor
     try:
         wrapped=[FastAPIFileAdapter(f) for f in files]
         ci=ChatIngestor(
             temp_base=UPLOAD_BASE,
             faiss_base=FAISS_BASE,
             use_session_dirs=use_session_dirs,
-            session_id=session_id or None
+            # a new session gets an id this node owns, so its queries are routed here
+            session_id=session_id or affinity.new_session_id()
         )
-        ci.built_retriever(wrapped,chunk_size=chunk_size,chunk_overlap=chunk_overlap,k=k)
-        return {"session_id":ci.session_id,"k":k,"use_session_dirs":use_session_dirs}
+        ci.built_retriever(wrapped,chunk_size=chunk_size,chunk_overlap=chunk_overlap,k=k,replace=replace)
+        return {"session_id":ci.session_id,"k":k,"use_session_dirs":use_session_dirs,"replace":replace}
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Indexing failed: {e}")
+
+@app.delete("/chat/index/documents")
+def chat_delete_document(
+    doc_id: str,
+    session_id: Optional[str]=None,
+    use_session_dirs: bool=True
+) ->Any:
+    """Drop one uploaded file (by its original name) from a session index."""
+    from src.document_ingestion.data_ingestion import ChatIngestor
+    try:
+        if use_session_dirs and not session_id:
+            raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs=True")
+        index_dir=os.path.join(FAISS_BASE,session_id) if use_session_dirs else FAISS_BASE
+        if not os.path.isdir(index_dir):
+            raise HTTPException(status_code=404,detail=f"Faiss_index not found at : {index_dir}")
+        ci=ChatIngestor(
+            temp_base=UPLOAD_BASE,
+            faiss_base=FAISS_BASE,
+            use_session_dirs=use_session_dirs,
+            session_id=session_id
+        )
+        removed=ci.delete_document(doc_id)
+        return {"session_id":session_id,"doc_id":doc_id,"removed":removed}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Delete failed: {e}")
     
 @app.post("/chat/query")
-async def chat_query(
+@profiled
+def chat_query(
     question : str=Form(...),
     session_id: Optional[str]=Form(None),
     use_session_dirs :bool=Form(True),
-    k: int=Form(5)
+    k: int=Form(5),
+    search_type: str=Form("similarity"),
+    fetch_k: Optional[int]=Form(None),
+    lambda_mult: Optional[float]=Form(None),
+    sources: Optional[str]=Form(None),
+    file_types: Optional[str]=Form(None),
+    page_from: Optional[int]=Form(None),
+    page_to: Optional[int]=Form(None),
+    uploaded_after: Optional[str]=Form(None),
+    uploaded_before: Optional[str]=Form(None)
 )->Any:
+    from src.document_chat.retrieval import ConversationalRAG
+    from utils.llm_gateway import INTERACTIVE,llm_priority
     try:
         if use_session_dirs and not session_id:
             raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs=True")
         
         index_dir=os.path.join(FAISS_BASE,session_id) if use_session_dirs else FAISS_BASE
         if not os.path.isdir(index_dir):
-            raise HTTPException(status_code=404,details=f"Faiss_index not found at : {index_dir}")
+            raise HTTPException(status_code=404,detail=f"Faiss_index not found at : {index_dir}")
         
+        # sources/file_types: comma-separated; pages 1-based; upload times ISO-8601 or epoch seconds
+        try:
+            metadata_filter=build_filter(sources,file_types,page_from,page_to,uploaded_after,uploaded_before)
+        except ValueError as e:
+            raise HTTPException(status_code=400,detail=f"Invalid filter: {e}")
+
+        # search_type=mmr: k diverse chunks out of the fetch_k nearest (lambda_mult 1 = relevance only)
+        retriever_cfg=CONFIG.get("retriever",{}) or {}
+        fetch_k=fetch_k or int(retriever_cfg.get("fetch_k",20))
+        lambda_mult=float(retriever_cfg.get("lambda_mult",0.5)) if lambda_mult is None else lambda_mult
+        if search_type not in ("similarity","mmr"):
+            raise HTTPException(status_code=400,detail="search_type must be 'similarity' or 'mmr'")
+        if not 1<=k<=100 or not 1<=fetch_k<=1000 or not 0.0<=lambda_mult<=1.0:
+            raise HTTPException(status_code=400,detail="need 1 <= k <= 100, 1 <= fetch_k <= 1000, 0 <= lambda_mult <= 1")
+
         rag=ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir)
+        rag.load_retriever_from_faiss(index_dir,k=k,search_type=search_type,fetch_k=fetch_k,
+                                      lambda_mult=lambda_mult,metadata_filter=metadata_filter)
 
-        response=rag.invoke(question,chat_history=[])
+        # interactive: jumps ahead of analyze/compare calls queued on the rate limiter
+        with llm_priority(INTERACTIVE):
+            response=rag.invoke(question,chat_history=[])
 
         return {
             "answer": response,
             "session_id":session_id,
             "k":k,
-            "engine": "LCEL-RAG"
+            "search_type":search_type,
+            "filter":metadata_filter,
+            # document-level questions are answered from the ingest-time summaries without retrieval
+            "engine": "doc-summary" if rag.last_route else "LCEL-RAG",
+            "route": rag.last_route["intent"] if rag.last_route else None
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Query failed: {e}")
     
@@ -0,0 +1 @@
+"""Offline benchmark suite: fake models, synthetic corpora and scenario runner."""
@@ -0,0 +1,65 @@
+"""
+Offline benchmark suite.
+
+    python -m benchmarks                               # all scenarios vs. stored baseline
+    python -m benchmarks --scenarios ingest,rag_invoke --iterations 20
+    python -m benchmarks --update-baseline             # re-record benchmarks/baseline.json
+
+Exit code is 1 when any metric regresses beyond the tolerance.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from benchmarks.corpus import CorpusSpec
+from benchmarks.runner import DEFAULT_BASELINE, compare_to_baseline, load_baseline, quiet_logs, run_all
+from benchmarks.scenarios import SCENARIOS
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Document Portal offline benchmarks")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenario names")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--docs", type=int, default=6, help="documents in the synthetic corpus")
+    parser.add_argument("--pages", type=int, default=4, help="pages per synthetic document")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="also write results JSON here")
+    parser.add_argument("--verbose", action="store_true", help="keep INFO logs from the pipeline")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        quiet_logs()
+
+    spec = CorpusSpec(n_docs=args.docs, pages_per_doc=args.pages, seed=args.seed)
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    results = run_all(names, spec, iterations=args.iterations, warmup=args.warmup,
+                      llm_latency_s=args.llm_latency_ms / 1000.0,
+                      embedding_latency_s=args.embedding_latency_ms / 1000.0)
+
+    print(f"{'scenario':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>10}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<16}{r['throughput_ops_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['peak_rss_mb']:>10}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, load_baseline(args.baseline), tolerance=args.tolerance)
+    for reg in regressions:
+        print(f"REGRESSION {reg['scenario']}.{reg['metric']}: {reg['current']} (baseline {reg['baseline']}, limit {reg['limit']})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
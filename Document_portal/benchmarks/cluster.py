@@ -0,0 +1,103 @@
+"""
+Local multi-node run of ``api.main:app`` with session affinity.
+
+Starts the stub provider and ``--nodes`` uvicorn processes on free ports,
+each with its own ``FAISS_BASE`` and the same ``CLUSTER_NODES``. Builds
+``--sessions`` indexes through the nodes in turn, then queries every session
+through every node and reports which node served each query (it must be the
+session's owner), the latency of local vs forwarded queries and the routing
+counters from ``GET /cluster``. With ``--stop-one`` the last node is then
+stopped and its sessions are queried again to show the failover.
+
+    python -m benchmarks.cluster --nodes 3 --sessions 6
+    python -m benchmarks.cluster --nodes 3 --mode redirect
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.loadtest import Workload, _free_port, start_api, stub_env, wait_healthy
+from benchmarks.runner import summarize
+from benchmarks.stub_server import StubBehaviour, start_stub_server
+
+QUESTION = "What does the report say about supplier risk?"
+
+
+def run(n_nodes: int, n_sessions: int, mode: str, stop_one: bool, latency_ms: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="docportal_cluster_") as tmp:
+        work = Path(tmp)
+        server, _, stub_url = start_stub_server(StubBehaviour(latency_ms=latency_ms, jitter_ms=0.0,
+                                                              embedding_latency_ms=5.0))
+        urls = [f"http://127.0.0.1:{_free_port()}" for _ in range(n_nodes)]
+        procs = []
+        try:
+            for i, url in enumerate(urls):
+                env = stub_env(stub_url, work / f"node{i}")
+                env.update(CLUSTER_NODES=",".join(urls), NODE_URL=url, AFFINITY_MODE=mode, WARMUP="0")
+                procs.append(start_api(int(url.rsplit(":", 1)[1]), env))
+            for url in urls:
+                wait_healthy(url)
+            workload = Workload(work)
+            clients = [httpx.Client(base_url=url, timeout=120.0, follow_redirects=True) for url in urls]
+
+            sessions: Dict[str, str] = {}           # session id -> node that built it
+            for i in range(n_sessions):
+                resp = workload.chat_index(clients[i % n_nodes])
+                resp.raise_for_status()
+                sessions[resp.json()["session_id"]] = resp.headers["x-served-by"]
+
+            def query_all(targets: List[httpx.Client]) -> Dict[str, Any]:
+                hits, latencies = 0, {"local": [], "routed": []}
+                statuses: Dict[int, int] = {}
+                for session, owner in sessions.items():
+                    for client in targets:
+                        started = time.perf_counter()
+                        resp = client.post("/chat/query", data={"question": QUESTION, "session_id": session})
+                        elapsed = time.perf_counter() - started
+                        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                        hits += resp.headers.get("x-served-by") == owner
+                        latencies["local" if str(client.base_url).rstrip("/") == owner else "routed"].append(elapsed)
+                return {"queries": sum(statuses.values()), "served_by_owner": hits, "statuses": statuses,
+                        **{k: summarize(v, sum(v)) for k, v in latencies.items() if v}}
+
+            report: Dict[str, Any] = {"nodes": urls, "mode": mode, "sessions": len(sessions),
+                                      "owners": {u: list(sessions.values()).count(u) for u in urls},
+                                      "queries": query_all(clients)}
+            if stop_one and n_nodes > 1:
+                procs[-1].terminate()
+                procs[-1].wait(timeout=10)
+                report["after_stopping"] = {"stopped": urls[-1], "queries": query_all(clients[:-1])}
+            report["cluster"] = [c.get("/cluster").json() for c in clients[:-1 if stop_one else None]]
+            for c in clients:
+                c.close()
+            return report
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+            server.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.cluster")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=6)
+    parser.add_argument("--mode", choices=["forward", "redirect"], default="forward")
+    parser.add_argument("--stop-one", action="store_true", help="stop the last node and query again")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub LLM latency")
+    args = parser.parse_args(argv)
+    report = run(args.nodes, args.sessions, args.mode, args.stop_one, args.latency_ms)
+    print(json.dumps(report, indent=2))
+    return 0 if report["queries"]["served_by_owner"] == report["queries"]["queries"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
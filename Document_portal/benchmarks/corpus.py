@@ -0,0 +1,131 @@
+"""
+Synthetic PDF / DOCX / TXT corpora of configurable size.
+
+Generation is seeded so two runs with the same arguments produce the same
+files (byte-identical for TXT/DOCX, text-identical for PDF).
+"""
+from __future__ import annotations
+import random
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Sequence
+from xml.sax.saxutils import escape
+
+import fitz
+
+_VOCAB = (
+    "revenue market growth quarter policy contract supplier vendor risk compliance audit "
+    "attention transformer model training dataset latency throughput index retrieval "
+    "customer region product pricing forecast budget invoice payment clause liability "
+    "security access control report analysis summary author publisher revision section"
+).split()
+
+
+@dataclass
+class CorpusSpec:
+    n_docs: int = 6
+    pages_per_doc: int = 4
+    paragraphs_per_page: int = 4
+    sentences_per_paragraph: int = 5
+    kinds: Sequence[str] = ("pdf", "docx", "txt")
+    seed: int = 7
+
+
+class LocalUpload:
+    """Mimic an uploaded file (``.name`` + ``.getbuffer()``) for a file on disk."""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.name = self.path.name
+
+    def getbuffer(self) -> bytes:
+        return self.path.read_bytes()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_VOCAB) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def _pages(rng: random.Random, spec: CorpusSpec, title: str) -> List[str]:
+    pages = []
+    for p in range(spec.pages_per_doc):
+        paras = [" ".join(_sentence(rng) for _ in range(spec.sentences_per_paragraph))
+                 for _ in range(spec.paragraphs_per_page)]
+        header = f"{title} - Page {p + 1}"
+        pages.append(header + "\n\n" + "\n\n".join(paras))
+    return pages
+
+
+def _write_pdf(path: Path, pages: List[str]):
+    with fitz.open() as doc:
+        for text in pages:
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+        doc.save(str(path))
+
+
+def _write_docx(path: Path, pages: List[str]):
+    body = "".join(
+        f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(line)}</w:t></w:r></w:p>"
+        for text in pages for line in text.split("\n")
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in (("[Content_Types].xml", content_types), ("_rels/.rels", rels),
+                           ("word/document.xml", document)):
+            zf.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data)
+
+
+def generate_corpus(out_dir: Path, spec: CorpusSpec = CorpusSpec()) -> List[Path]:
+    """Write ``spec.n_docs`` documents into ``out_dir`` cycling through ``spec.kinds``."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec.seed)
+    paths: List[Path] = []
+    for i in range(spec.n_docs):
+        kind = spec.kinds[i % len(spec.kinds)]
+        title = f"Synthetic Report {i + 1}"
+        pages = _pages(rng, spec, title)
+        path = out_dir / f"doc_{i + 1:04d}.{kind}"
+        if kind == "pdf":
+            _write_pdf(path, pages)
+        elif kind == "docx":
+            _write_docx(path, pages)
+        elif kind == "txt":
+            path.write_text("\n\n".join(pages), encoding="utf-8")
+        else:
+            raise ValueError(f"Unsupported corpus kind: {kind}")
+        paths.append(path)
+    return paths
+
+
+def revise_pdf(src: Path, dst: Path, seed: int = 11, edits: int = 2):
+    """Copy a PDF, rewriting ``edits`` random pages; used by the comparison scenario."""
+    rng = random.Random(seed)
+    with fitz.open(str(src)) as doc:
+        pages = [doc.load_page(i).get_text() for i in range(doc.page_count)]  # type: ignore
+    for idx in rng.sample(range(len(pages)), k=min(edits, len(pages))):
+        pages[idx] = pages[idx] + "\n" + _sentence(rng)
+    _write_pdf(dst, pages)
+    return dst
@@ -0,0 +1,127 @@
+"""
+Offline stand-ins for the embedding model and the LLM.
+
+Both plug into the pipeline through ``ModelLoader`` so the benchmarked code
+paths are exactly the ones used in production, minus the network.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import re
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from utils.config_loader import load_config
+from utils.model_loader import ModelLoader
+from logger import custom_logger
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings (feature hashing + L2 norm).
+    Texts sharing words land close together, so retrieval behaves sensibly.
+    """
+    backend = "hashing"
+
+    def __init__(self, dim: int = 384, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+
+    @property
+    def model(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for tok in _TOKEN_RE.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) == 0 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._embed(text)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model that answers from a script instead of a provider.
+
+    If ``responses`` is given they are returned in a round-robin fashion.
+    Otherwise the reply is chosen from the prompt: analysis prompts get a
+    valid ``Metadata`` JSON, comparison prompts a ``SummaryResponse`` list,
+    rewrite prompts echo the question and QA prompts quote the context.
+    """
+    responses: Optional[List[str]] = None
+    latency_s: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def _script(self, messages: List[BaseMessage]) -> str:
+        if self.responses:
+            return self.responses[(self.calls - 1) % len(self.responses)]
+        text = "\n".join(str(m.content) for m in messages)
+        if "Analyze this document" in text:
+            return json.dumps({
+                "Summary": ["Synthetic benchmark document."],
+                "Title": "Synthetic Report",
+                "Author": ["Benchmark Bot"],
+                "DateCreated": "2024-01-01",
+                "LastModifiedDate": "2024-01-02",
+                "Publisher": "Document Portal",
+                "Language": "English",
+                "PageCount": text.count("--- Page "),
+                "SentimentTone": "Neutral",
+            })
+        if "Compare the content in two PDFs" in text:
+            pages = max(1, len(set(re.findall(r"--- Page (\d+) ---", text))))
+            return json.dumps([{"Page": str(p), "Changes": "NO CHANGE"} for p in range(1, pages + 1)])
+        if "rewrite the query" in text:
+            return str(messages[-1].content)
+        first = str(messages[0].content).split("\n\n", 1)
+        context = first[1] if len(first) > 1 else ""
+        return (context.strip().split(". ")[0][:200] or "I don't know.") + "."
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._script(messages)))])
+
+
+class FakeModelLoader(ModelLoader):
+    """ModelLoader that needs no API keys and never touches the network."""
+    def __init__(self, embedding_dim: int = 384, llm_latency_s: float = 0.0, embedding_latency_s: float = 0.0):
+        self.log = custom_logger.CustomLogger().get_logger(__name__)
+        self.config = load_config()
+        self.api_keys = {}
+        self.embedding_dim = embedding_dim
+        self.llm_latency_s = llm_latency_s
+        self.embedding_latency_s = embedding_latency_s
+
+    def load_embeddings(self):
+        return HashingEmbeddings(dim=self.embedding_dim, latency_s=self.embedding_latency_s)
+
+    def load_llm(self):
+        return ScriptedChatModel(latency_s=self.llm_latency_s)
@@ -0,0 +1,226 @@
+"""
+HTTP load harness for ``api.main:app``.
+
+Starts the stub provider and a local uvicorn, then drives ``/analyze``,
+``/compare``, ``/chat/index`` and ``/chat/query`` with a closed-loop load at
+each concurrency level and records throughput and latency percentiles per
+level, i.e. the concurrency-vs-throughput and concurrency-vs-p99 curves.
+
+    python -m benchmarks.loadtest --concurrency 1,2,4,8,16 --duration 15 --latency-ms 400 --rps 30
+    python -m benchmarks.loadtest --target http://127.0.0.1:8080   # existing server, real providers
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.corpus import CorpusSpec, generate_corpus, revise_pdf
+from benchmarks.runner import summarize
+from benchmarks.stub_server import StubBehaviour, start_stub_server
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("analyze", "compare", "chat_index", "chat_query")
+_MIME = {".pdf": "application/pdf", ".txt": "text/plain",
+         ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _file(path: Path):
+    return (path.name, path.read_bytes(), _MIME.get(path.suffix.lower(), "application/octet-stream"))
+
+
+class Workload:
+    """Builds the request for each endpoint from a synthetic corpus."""
+    def __init__(self, work: Path, n_docs: int = 3, pages: int = 4):
+        paths = generate_corpus(work / "corpus", CorpusSpec(n_docs=n_docs, pages_per_doc=pages))
+        pdfs = [p for p in paths if p.suffix == ".pdf"]
+        self.pdf = pdfs[0]
+        self.revised = revise_pdf(self.pdf, work / "corpus" / "revised.pdf")
+        self.chat_files = paths
+        self.session_id: Optional[str] = None
+
+    def prepare(self, client: httpx.Client):
+        """Build one index up-front so /chat/query has something to hit."""
+        resp = self.chat_index(client)
+        resp.raise_for_status()
+        self.session_id = resp.json()["session_id"]
+
+    def analyze(self, client: httpx.Client) -> httpx.Response:
+        return client.post("/analyze", files={"file": _file(self.pdf)})
+
+    def compare(self, client: httpx.Client) -> httpx.Response:
+        return client.post("/compare", files={"reference": _file(self.pdf), "actual": _file(self.revised)})
+
+    def chat_index(self, client: httpx.Client) -> httpx.Response:
+        return client.post("/chat/index", files=[("files", _file(p)) for p in self.chat_files],
+                           data={"use_session_dirs": "true", "chunk_size": "1000", "chunk_overlap": "100", "k": "5"})
+
+    def chat_query(self, client: httpx.Client) -> httpx.Response:
+        return client.post("/chat/query", data={"question": "What does the report say about supplier risk?",
+                                                "session_id": self.session_id, "use_session_dirs": "true", "k": "5"})
+
+
+def run_level(base_url: str, call: Callable[[httpx.Client], httpx.Response], concurrency: int,
+              duration_s: float, timeout_s: float = 120.0) -> Dict[str, Any]:
+    """Closed loop: ``concurrency`` workers issue requests back-to-back for ``duration_s``."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration_s
+
+    def worker():
+        with httpx.Client(base_url=base_url, timeout=timeout_s) as client:
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    code = str(call(client).status_code)
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    statuses[code] = statuses.get(code, 0) + 1
+                    if code == "200":
+                        latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    total = sum(statuses.values())
+    point: Dict[str, Any] = {"concurrency": concurrency, "requests": total}
+    if latencies:
+        point.update(summarize(latencies, wall))
+    point["throughput_rps"] = round(len(latencies) / wall, 3) if wall > 0 else 0.0
+    point["error_rate"] = round(1 - len(latencies) / total, 4) if total else 0.0
+    point["statuses"] = statuses
+    return point
+
+
+def start_api(port: int, env: Dict[str, str], workers: int = 1) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=str(PROJECT_ROOT), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_healthy(base_url: str, timeout_s: float = 60.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"API did not become healthy at {base_url} within {timeout_s}s")
+
+
+def stub_env(stub_url: str, work: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "LLM_PROVIDER": "openai",
+        "LLM_FALLBACK_PROVIDERS": "",     # the placeholder keys below must never be called
+        "EMBEDDING_PROVIDER": "openai",
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_API_KEY": "stub",
+        "GOOGLE_API_KEY": env.get("GOOGLE_API_KEY") or "stub",
+        "GROQ_API_KEY": env.get("GROQ_API_KEY") or "stub",
+        "FAISS_BASE": str(work / "faiss_index"),
+        "UPLOAD_BASE": str(work / "data"),
+        "DATA_STORAGE_PATH": str(work / "document_analysis"),
+    })
+    return env
+
+
+def write_curves(curves: Dict[str, List[Dict[str, Any]]], out_dir: Path):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "loadtest.json").write_text(json.dumps(curves, indent=2), encoding="utf-8")
+    fields = ["endpoint", "concurrency", "requests", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate"]
+    with open(out_dir / "loadtest.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for endpoint, points in curves.items():
+            for p in points:
+                writer.writerow({"endpoint": endpoint, **p})
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--target", help="existing server URL; skips starting stub + uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local app")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub LLM latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--rps", type=float, default=None, help="stub provider rate limit")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--out", type=Path, default=Path("loadtest_results"))
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    curves: Dict[str, List[Dict[str, Any]]] = {}
+
+    with tempfile.TemporaryDirectory(prefix="docportal_load_") as tmp:
+        work = Path(tmp)
+        server = proc = None
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            behaviour = StubBehaviour(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                      embedding_latency_ms=args.embedding_latency_ms, rps=args.rps,
+                                      burst=args.burst, error_rate=args.error_rate)
+            server, _, stub_url = start_stub_server(behaviour)
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            proc = start_api(port, stub_env(stub_url, work), workers=args.workers)
+        try:
+            wait_healthy(base_url)
+            workload = Workload(work)
+            with httpx.Client(base_url=base_url, timeout=120.0) as client:
+                workload.prepare(client)
+            for endpoint in endpoints:
+                call = getattr(workload, endpoint)
+                curves[endpoint] = []
+                for level in levels:
+                    point = run_level(base_url, call, level, args.duration)
+                    curves[endpoint].append(point)
+                    print(f"{endpoint:<11} c={level:<4} rps={point['throughput_rps']:<9} "
+                          f"p99={point.get('p99_ms', '-')}ms errors={point['error_rate']}")
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+            if server is not None:
+                server.shutdown()
+
+    write_curves(curves, args.out)
+    print(f"Curves written to {args.out}/loadtest.json and loadtest.csv")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import json
+import logging
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.corpus import CorpusSpec
+from benchmarks.fakes import FakeModelLoader
+from benchmarks.scenarios import SCENARIOS, Scenario
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(latencies_s: List[float], wall_s: float) -> Dict[str, float]:
+    lat_ms = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    return {
+        "iterations": int(lat_ms.size),
+        "throughput_ops_s": round(lat_ms.size / wall_s, 3) if wall_s > 0 else 0.0,
+        "mean_ms": round(float(lat_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 3),
+    }
+
+
+def run_scenario(scenario: Scenario, work: Path, spec: CorpusSpec, loader: FakeModelLoader,
+                 iterations: int = 10, warmup: int = 1) -> Dict[str, float]:
+    state = scenario.setup(work, spec, loader)
+    for _ in range(warmup):
+        scenario.run(state)
+    latencies: List[float] = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        scenario.run(state)
+        latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - wall_start
+    result = summarize(latencies, wall)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_all(names: List[str], spec: CorpusSpec, iterations: int = 10, warmup: int = 1,
+            llm_latency_s: float = 0.0, embedding_latency_s: float = 0.0) -> Dict[str, Any]:
+    loader = FakeModelLoader(llm_latency_s=llm_latency_s, embedding_latency_s=embedding_latency_s)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="docportal_bench_") as tmp:
+        for name in names:
+            if name not in SCENARIOS:
+                raise ValueError(f"Unknown scenario '{name}'. Available: {sorted(SCENARIOS)}")
+            work = Path(tmp) / name
+            work.mkdir(parents=True, exist_ok=True)
+            results[name] = run_scenario(SCENARIOS[name], work, spec, loader, iterations, warmup)
+    return {
+        "corpus": {"n_docs": spec.n_docs, "pages_per_doc": spec.pages_per_doc, "seed": spec.seed},
+        "iterations": iterations,
+        "scenarios": results,
+    }
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = 0.25, rss_tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Return one entry per regressed metric. Latency and RSS regress when they grow
+    beyond the tolerance, throughput when it drops below it.
+    """
+    regressions: List[Dict[str, Any]] = []
+    checks = (("p95_ms", 1 + tolerance, "higher"), ("p99_ms", 1 + tolerance, "higher"),
+              ("throughput_ops_s", 1 - tolerance, "lower"), ("peak_rss_mb", 1 + rss_tolerance, "higher"))
+    for name, cur in results.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for metric, factor, bad in checks:
+            if metric not in base or metric not in cur or not base[metric]:
+                continue
+            limit = base[metric] * factor
+            if (bad == "higher" and cur[metric] > limit) or (bad == "lower" and cur[metric] < limit):
+                regressions.append({"scenario": name, "metric": metric, "baseline": base[metric],
+                                    "current": cur[metric], "limit": round(limit, 3)})
+    return regressions
+
+
+def load_baseline(path: Optional[Path]) -> Dict[str, Any]:
+    if path and Path(path).exists():
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    return {}
+
+
+def quiet_logs():
+    """
+    Keep per-call INFO logging from dominating the measurements. Must run before
+    the first CustomLogger, whose basicConfig call is then a no-op.
+    """
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
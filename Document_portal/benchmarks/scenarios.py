@@ -0,0 +1,114 @@
+"""
+Repeatable benchmark scenarios for the four pipelines exposed by the API.
+
+Each scenario has a ``setup`` (untimed) that returns a state object and a
+``run`` that performs one timed operation against that state.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from langchain_core.documents import Document
+
+from benchmarks.corpus import CorpusSpec, LocalUpload, generate_corpus, revise_pdf
+from benchmarks.fakes import FakeModelLoader
+from src.document_analyzer.data_analysis import DocumentAnalyzer
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_compare.document_comparator import DocumentComparatorLLM
+from src.document_ingestion.data_ingestion import ChatIngestor, DocHandler, DocumentComparator, FaissManager
+
+
+@dataclass
+class Scenario:
+    name: str
+    setup: Callable[[Path, CorpusSpec, FakeModelLoader], Any]
+    run: Callable[[Any], Any]
+
+
+def _setup_ingest(work: Path, spec: CorpusSpec, loader: FakeModelLoader) -> Dict[str, Any]:
+    paths = generate_corpus(work / "corpus", spec)
+    return {"work": work, "uploads": [LocalUpload(p) for p in paths], "loader": loader}
+
+
+def _run_ingest(state: Dict[str, Any]):
+    ci = ChatIngestor(
+        temp_base=str(state["work"] / "data"),
+        faiss_base=str(state["work"] / "faiss_index"),
+        use_session_dirs=True,
+        model_loader=state["loader"],
+    )
+    return ci.built_retriever(state["uploads"], chunk_size=1000, chunk_overlap=200, k=5)
+
+
+def _setup_rag(work: Path, spec: CorpusSpec, loader: FakeModelLoader) -> Dict[str, Any]:
+    state = _setup_ingest(work, spec, loader)
+    ci = ChatIngestor(
+        temp_base=str(work / "data"),
+        faiss_base=str(work / "faiss_index"),
+        use_session_dirs=True,
+        session_id="bench_rag",
+        model_loader=loader,
+    )
+    ci.built_retriever(state["uploads"], chunk_size=1000, chunk_overlap=200, k=5)
+    rag = ConversationalRAG(session_id="bench_rag", model_loader=loader)
+    rag.load_retriever_from_faiss(str(ci.faiss_dir), k=5)
+    return {"rag": rag, "question": "What does the report say about revenue growth and supplier risk?"}
+
+
+def _run_rag(state: Dict[str, Any]):
+    return state["rag"].invoke(state["question"], chat_history=[])
+
+
+def _setup_analyze(work: Path, spec: CorpusSpec, loader: FakeModelLoader) -> Dict[str, Any]:
+    pdf_spec = CorpusSpec(n_docs=1, pages_per_doc=spec.pages_per_doc, paragraphs_per_page=spec.paragraphs_per_page,
+                          sentences_per_paragraph=spec.sentences_per_paragraph, kinds=("pdf",), seed=spec.seed)
+    pdf = generate_corpus(work / "analyze", pdf_spec)[0]
+    handler = DocHandler(data_dir=str(work / "document_analysis"), session_id="bench_analyze")
+    return {"handler": handler, "pdf": str(pdf), "analyzer": DocumentAnalyzer(model_loader=loader)}
+
+
+def _run_analyze(state: Dict[str, Any]):
+    text = state["handler"].read_pdf(state["pdf"])
+    return state["analyzer"].analyze_document(text)
+
+
+def _setup_compare(work: Path, spec: CorpusSpec, loader: FakeModelLoader) -> Dict[str, Any]:
+    pdf_spec = CorpusSpec(n_docs=1, pages_per_doc=spec.pages_per_doc, paragraphs_per_page=spec.paragraphs_per_page,
+                          sentences_per_paragraph=spec.sentences_per_paragraph, kinds=("pdf",), seed=spec.seed)
+    ref = generate_corpus(work / "compare", pdf_spec)[0]
+    act = revise_pdf(ref, work / "compare" / "doc_0001_v2.pdf")
+    return {"work": work, "ref": LocalUpload(ref), "act": LocalUpload(act),
+            "comparator": DocumentComparatorLLM(model_loader=loader)}
+
+
+def _run_compare(state: Dict[str, Any]):
+    dc = DocumentComparator(base_dir=str(state["work"] / "document_compare"))
+    dc.save_uploaded_files(state["ref"], state["act"])
+    return state["comparator"].compare_documents(dc.combine_documents())
+
+
+def _setup_incremental(work: Path, spec: CorpusSpec, loader: FakeModelLoader) -> Dict[str, Any]:
+    """A large shared index (500 chunks per corpus doc) that small uploads are added to."""
+    fm = FaissManager(work / "shared_index", loader)
+    n = spec.n_docs * 500
+    fm.load_or_create(texts=[f"base chunk {i} revenue supplier contract {i % 97}" for i in range(n)],
+                      metadatas=[{"source": f"base_{i // 50}.pdf", "page": i % 50} for i in range(n)])
+    return {"fm": fm, "batch": 0}
+
+
+def _run_incremental(state: Dict[str, Any]):
+    state["batch"] += 1
+    b = state["batch"]
+    docs = [Document(page_content=f"upload {b} chunk {i} pricing forecast", metadata={"source": f"upload_{b}.pdf", "page": i})
+            for i in range(5)]
+    return state["fm"].add_documents(docs)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "ingest": Scenario("ingest", _setup_ingest, _run_ingest),
+    "rag_invoke": Scenario("rag_invoke", _setup_rag, _run_rag),
+    "analyze": Scenario("analyze", _setup_analyze, _run_analyze),
+    "compare": Scenario("compare", _setup_compare, _run_compare),
+    "incremental_add": Scenario("incremental_add", _setup_incremental, _run_incremental),
+}
@@ -0,0 +1,203 @@
+"""
+Local stand-in for an OpenAI-compatible provider (chat + embeddings).
+
+Point the API at it with ``LLM_PROVIDER=openai EMBEDDING_PROVIDER=openai
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``. Latency, rate limits and error
+rates are configurable so load tests can reproduce provider behaviour.
+
+    python -m benchmarks.stub_server --port 9100 --latency-ms 300 --jitter-ms 100 --rps 20 --error-rate 0.02
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from benchmarks.fakes import HashingEmbeddings, ScriptedChatModel
+
+
+@dataclass
+class StubBehaviour:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    embedding_latency_ms: float = 0.0
+    rps: Optional[float] = None          # token-bucket rate limit; None = unlimited
+    burst: int = 10
+    error_rate: float = 0.0
+    embedding_dim: int = 384
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> Tuple[bool, float]:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True, 0.0
+            return False, (1.0 - self.tokens) / self.rate
+
+
+def _to_messages(raw: List[Dict[str, Any]]) -> List[BaseMessage]:
+    kinds = {"system": SystemMessage, "assistant": AIMessage}
+    out: List[BaseMessage] = []
+    for m in raw:
+        content = m.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        out.append(kinds.get(m.get("role"), HumanMessage)(content=content))
+    return out
+
+
+class StubProvider:
+    """Holds behaviour and counters; one instance is shared by all handler threads."""
+    def __init__(self, behaviour: StubBehaviour):
+        self.behaviour = behaviour
+        self.bucket = _TokenBucket(behaviour.rps, behaviour.burst) if behaviour.rps else None
+        self.embedder = HashingEmbeddings(dim=behaviour.embedding_dim)
+        self.chat = ScriptedChatModel()
+        self.rng = random.Random(behaviour.seed)
+        self.rng_lock = threading.Lock()
+        self.counters = {"chat": 0, "embeddings": 0, "rate_limited": 0, "errors": 0}
+        self.counter_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self.counter_lock:
+            self.counters[key] += 1
+
+    def gate(self, base_latency_ms: float) -> Tuple[Optional[Tuple[int, Dict[str, Any], Dict[str, str]]], float]:
+        """Return ``(error_response, delay_ms)``; the error is set when the call is throttled or should fail."""
+        if self.bucket is not None:
+            ok, wait = self.bucket.try_acquire()
+            if not ok:
+                self._count("rate_limited")
+                error = {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}
+                return (429, error, {"Retry-After": f"{wait:.3f}"}), 0.0
+        with self.rng_lock:
+            fail = self.rng.random() < self.behaviour.error_rate
+            jitter = self.rng.uniform(-self.behaviour.jitter_ms, self.behaviour.jitter_ms)
+        if fail:
+            self._count("errors")
+            return (500, {"error": {"message": "Injected provider error", "type": "server_error"}}, {}), 0.0
+        return None, max(0.0, base_latency_ms + jitter)
+
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("chat")
+        messages = _to_messages(body.get("messages", []))
+        content = self.chat._script(messages)
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        return {
+            "id": f"chatcmpl-stub-{self.counters['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()),
+                      "total_tokens": prompt_tokens + len(content.split())},
+        }
+
+    def embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("embeddings")
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        vectors = self.embedder.embed_documents([str(i) for i in inputs])
+        return {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+
+def _handler_for(provider: StubProvider):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # keep load tests quiet
+            pass
+
+        def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                return self._send(200, provider.counters)
+            self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            route = self.path.rstrip("/")
+            if route.endswith("/chat/completions"):
+                work, latency_ms = provider.chat_completion, provider.behaviour.latency_ms
+            elif route.endswith("/embeddings"):
+                work, latency_ms = provider.embeddings, provider.behaviour.embedding_latency_ms
+            else:
+                return self._send(404, {"error": {"message": f"unknown route {self.path}"}})
+            rejected, delay_ms = provider.gate(latency_ms)
+            if rejected:
+                return self._send(*rejected)
+            if delay_ms:
+                time.sleep(delay_ms / 1000.0)
+            self._send(200, work(body))
+
+    return Handler
+
+
+def start_stub_server(behaviour: StubBehaviour, host: str = "127.0.0.1", port: int = 0):
+    """Start the stub in a daemon thread; returns ``(server, provider, base_url)``."""
+    provider = StubProvider(behaviour)
+    server = ThreadingHTTPServer((host, port), _handler_for(provider))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, provider, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.stub_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=None)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    args = parser.parse_args(argv)
+    behaviour = StubBehaviour(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              embedding_latency_ms=args.embedding_latency_ms, rps=args.rps, burst=args.burst,
+                              error_rate=args.error_rate, embedding_dim=args.embedding_dim)
+    server, _, base_url = start_stub_server(behaviour, args.host, args.port)
+    print(f"Stub provider listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
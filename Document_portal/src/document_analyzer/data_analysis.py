@@ -1,11 +1,12 @@
 import sys
+from typing import Optional
 from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exceptions.custom_exception import DocumentPortalException
 from model.models import *
 
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.output_parsers import OutputFixingParser
+from utils.structured_output import TolerantJsonParser, structured_llm
+from src.document_analyzer.text_compressor import ExtractiveCompressor
 from prompts.prompt_library import PROMPT_REGISTRY
 
 
@@ -14,16 +15,18 @@ class DocumentAnalyzer:
     Analyzes documents using a pre-trained model.
     Automatically logs all actions and supports session-based organization.
     """
-    def __init__(self):
+    def __init__(self,model_loader: Optional[ModelLoader]=None):
         self.log=CustomLogger().get_logger(__name__)
         try:
-            self.loader=ModelLoader()
+            self.loader=model_loader or ModelLoader()
             self.llm=self.loader.load_llm()
 
-            self.parser=JsonOutputParser(pydantic_object=Metadata)
-            self.fixing_parser= OutputFixingParser.from_llm(parser=self.parser,llm=self.llm)
+            # JSON is constrained at generation where the provider supports it and
+            # repaired locally otherwise -- no second LLM call to fix the output
+            self.parser=TolerantJsonParser(pydantic_object=Metadata)
 
             self.prompt=PROMPT_REGISTRY['document_analysis']
+            self.compressor=self._build_compressor()
 
             self.log.info("Document Analyzer initialized successfully.")
 
@@ -31,13 +34,23 @@ class DocumentAnalyzer:
             self.log.error(f"Error in initialize DocumentAnalyzer: {e}")
             raise DocumentPortalException("Error in DocumentAnalyzer initialization",sys)
 
+    def _build_compressor(self) -> Optional[ExtractiveCompressor]:
+        cfg=(getattr(self.loader,"config",None) or {}).get("analysis_compression",{}) or {}
+        if not cfg.get("enabled",True):
+            return None
+        return ExtractiveCompressor(token_budget=int(cfg.get("token_budget",6000)),
+                                    pinned_share=float(cfg.get("pinned_share",0.3)),
+                                    lead_sentences=int(cfg.get("lead_sentences",8)))
+
     def analyze_document(self,document_text: str) -> dict:
         """
         Analyze a document's text and extract structured metadata and summary.
         """
         try:
-            chain= self.prompt | self.llm | self.fixing_parser
+            chain= self.prompt | structured_llm(self.llm,Metadata) | self.parser
             self.log.info("Metadata analysis chain initialized.")
+            if self.compressor is not None:
+                document_text=self.compressor.compress(document_text)
 
             response=chain.invoke({
                 "format_instructions": self.parser.get_format_instructions(),
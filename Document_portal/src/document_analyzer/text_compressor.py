@@ -0,0 +1,191 @@
+"""
+Local extractive compression of a document before metadata analysis.
+
+``DocHandler.read_pdf`` hands the analyzer every page of a file; most of it
+does not help fill ``Metadata``. Above ``token_budget`` the text is reduced
+to its most informative sentences, without any model download:
+
+1. recurring page headers/footers are stripped (``ChunkDeduplicator.strip_furniture``),
+2. lines are joined into sentences,
+3. sentences are scored with TextRank over TF-IDF cosine similarity; the
+   similarity graph is never materialised, each power iteration is two
+   sparse products (``X @ (X.T @ v)``) done with ``np.bincount``,
+4. sentences carrying metadata cues (title, author, dates, publisher,
+   copyright, version) and the first lines of the document are kept
+   verbatim, up to ``pinned_share`` of the budget,
+5. the best remaining sentences fill the budget and everything is emitted
+   in document order under its page marker.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.chunk_dedup import ChunkDeduplicator
+from utils.tokens import count_tokens
+
+_PAGE_RE = re.compile(r"^\s*--- Page (\d+) ---\s*$", re.M)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""a an and are as at be by for from has have in is it its of on or that the this to was
+were will with which not but their they these those been can may also such than into our we you""".split())
+_MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_CUE_RE = re.compile(
+    r"\b(?:title|author|authors|written by|prepared by|edited by|by\s+[A-Z][a-z]+|published|publisher|"
+    r"publication|copyright|all rights reserved|date|dated|revised|revision|version|edition|issued|"
+    r"created|modified|isbn|issn|doi)\b|©|\(c\)\s*\d{4}|"
+    r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}[/.]\d{1,2}[/.]\d{2,4}\b|\b" + _MONTHS + r"\s+(?:\d{1,2},?\s+)?\d{4}\b",
+    re.I)
+
+
+def _pages(text: str) -> List[Tuple[int, str]]:
+    """(page number, text) pairs from ``--- Page N ---`` markers; one page 1 if there are none."""
+    marks = list(_PAGE_RE.finditer(text))
+    if not marks:
+        return [(1, text)]
+    return [(int(m.group(1)), text[m.end():marks[i + 1].start() if i + 1 < len(marks) else len(text)])
+            for i, m in enumerate(marks)]
+
+
+def _sentences(page: str, short_line: int = 60) -> List[str]:
+    """
+    Sentences of a page. PDF text breaks lines mid-sentence, so lines are
+    joined unless the line ends a sentence or is short (a heading, a label).
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in page.split("\n"):
+        line = line.strip()
+        if not line:
+            if current:
+                blocks.append(" ".join(current))
+                current = []
+            continue
+        current.append(line)
+        if line[-1] in ".!?:" or len(line) < short_line:
+            blocks.append(" ".join(current))
+            current = []
+    if current:
+        blocks.append(" ".join(current))
+    return [s.strip() for b in blocks for s in _SENTENCE_RE.split(b) if s.strip()]
+
+
+def _tfidf(sentences: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """L2-normalised TF-IDF rows as COO triplets (rows, cols, values)."""
+    vocab: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    for i, s in enumerate(sentences):
+        for w in _WORD_RE.findall(s.lower()):
+            if w not in _STOPWORDS and len(w) > 1:
+                rows.append(i)
+                cols.append(vocab.setdefault(w, len(vocab)))
+    if not rows:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+    n = len(sentences)
+    pairs = np.unique(np.asarray(rows, np.int64) * len(vocab) + np.asarray(cols, np.int64), return_counts=True)
+    r, c = np.divmod(pairs[0], len(vocab))
+    tf = 1.0 + np.log(pairs[1].astype(np.float64))
+    df = np.bincount(c, minlength=len(vocab))
+    vals = tf * (np.log((1.0 + n) / (1.0 + df[c])) + 1.0)
+    norms = np.sqrt(np.bincount(r, weights=vals * vals, minlength=n))
+    return r, c, vals / np.where(norms > 0, norms, 1.0)[r]
+
+
+def textrank(sentences: List[str], damping: float = 0.85, iterations: int = 30) -> np.ndarray:
+    """TextRank centrality of each sentence on the TF-IDF cosine graph (self-loops excluded)."""
+    n = len(sentences)
+    r, c, v = _tfidf(sentences)
+    if not n or not v.size:
+        return np.full(n, 1.0 / max(n, 1))
+    vocab = int(c.max()) + 1
+    unit = np.zeros(n)
+    unit[np.unique(r)] = 1.0            # rows with any term have unit norm: S_ii = 1
+
+    def similarity(x: np.ndarray) -> np.ndarray:      # (X X^T - I_nonempty) x
+        xt = np.bincount(c, weights=v * x[r], minlength=vocab)
+        return np.bincount(r, weights=v * xt[c], minlength=n) - unit * x
+
+    degree = similarity(np.ones(n))
+    inv_degree = np.where(degree > 1e-12, 1.0 / np.maximum(degree, 1e-12), 0.0)
+    score = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        dangling = score[degree <= 1e-12].sum()
+        nxt = (1.0 - damping) / n + damping * (similarity(score * inv_degree) + dangling / n)
+        if np.abs(nxt - score).sum() < 1e-6:
+            return nxt
+        score = nxt
+    return score
+
+
+class ExtractiveCompressor:
+    def __init__(self, token_budget: int = 6000, pinned_share: float = 0.3, lead_sentences: int = 8,
+                 furniture: Optional[ChunkDeduplicator] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.token_budget = token_budget
+        self.pinned_share = pinned_share
+        self.lead_sentences = lead_sentences
+        self.furniture = furniture or ChunkDeduplicator()
+
+    def compress(self, text: str) -> str:
+        """``text`` itself when it fits the budget, else its extract (see module docstring)."""
+        before = count_tokens(text)
+        if before <= self.token_budget:
+            return text
+        pages = _pages(text)
+        docs, _ = self.furniture.strip_furniture(
+            [Document(page_content=body, metadata={"source": "document", "page": p}) for p, body in pages])
+
+        sentences: List[str] = []
+        page_of: List[int] = []
+        seen = set()
+        for (page, _), doc in zip(pages, docs):
+            for s in _sentences(doc.page_content):
+                if s.lower() not in seen:           # repeated boilerplate sentences
+                    seen.add(s.lower())
+                    sentences.append(s)
+                    page_of.append(page)
+        if not sentences:
+            return text
+
+        tokens = np.fromiter((count_tokens(s) + 1 for s in sentences), dtype=np.int64, count=len(sentences))
+        pinned = [i for i, s in enumerate(sentences) if i < self.lead_sentences or _CUE_RE.search(s)]
+        header = f"[Extract of a {len(pages)}-page document]"
+        budget = self.token_budget - count_tokens(header)
+        marker = count_tokens("\n--- Page 0000 ---") + 1
+
+        keep = np.zeros(len(sentences), dtype=bool)
+        pages_used = set()
+        used = 0
+
+        def take(i: int, limit: float) -> bool:
+            nonlocal used
+            cost = int(tokens[i]) + (0 if page_of[i] in pages_used else marker)
+            if used + cost > limit:
+                return False
+            keep[i] = True
+            pages_used.add(page_of[i])
+            used += cost
+            return True
+
+        for i in pinned:
+            take(i, budget * self.pinned_share)
+        for i in np.argsort(-textrank(sentences), kind="stable"):
+            if not keep[i]:
+                take(i, budget)
+
+        out = [header]
+        current_page = None
+        for i in np.flatnonzero(keep):
+            if page_of[i] != current_page:
+                current_page = page_of[i]
+                out.append(f"\n--- Page {current_page} ---")
+            out.append(sentences[i])
+        compressed = "\n".join(out)
+        self.log.info("Document text compressed for analysis", tokens_before=before,
+                      tokens_after=count_tokens(compressed), sentences_kept=int(keep.sum()),
+                      sentences_total=len(sentences), pinned=int(keep[pinned].sum()) if pinned else 0)
+        return compressed
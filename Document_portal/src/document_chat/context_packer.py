@@ -0,0 +1,186 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from utils.tokens import count_tokens, truncate_to_tokens
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class Passage:
+    text: str
+    source: Optional[str]
+    page: Any
+    rank: int                       # best (lowest) retriever rank among merged chunks
+    start: Optional[int] = None     # character offset in the page, when the splitter recorded it
+    ranks: List[int] = field(default_factory=list)
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def _suffix_prefix_overlap(a: str, b: str, min_overlap: int) -> int:
+    """Length of the longest suffix of ``a`` that is also a prefix of ``b`` (0 if < min_overlap)."""
+    if len(a) < min_overlap or len(b) < min_overlap:
+        return 0
+    probe = b[:min_overlap]
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)} if words else set()
+    return set(zip(words, words[1:], words[2:]))
+
+
+class ContextPacker:
+    """
+    Turn retrieved chunks into a compact context block.
+
+    1. merge overlapping / adjacent chunks of the same source and page,
+    2. drop near-duplicate passages (word-shingle Jaccard),
+    3. order passages by retriever rank,
+    4. fill up to ``token_budget``, truncating the last passage at a sentence boundary.
+    """
+    def __init__(self, token_budget: int = 3000, dedupe_threshold: float = 0.85,
+                 min_overlap: int = 20, adjacency_gap: int = 2, min_tail_tokens: int = 40,
+                 separator: str = "\n\n"):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+        self.min_overlap = min_overlap
+        self.adjacency_gap = adjacency_gap
+        self.min_tail_tokens = min_tail_tokens
+        self.separator = separator
+
+    # ---------- Public API ----------
+
+    def pack(self, docs: Sequence[Any]) -> str:
+        return self.separator.join(p.text for p in self.select(docs))
+
+    def select(self, docs: Sequence[Any]) -> List[Passage]:
+        passages = self._to_passages(docs)
+        passages = self._merge(passages)
+        passages = self._dedupe(sorted(passages, key=lambda p: p.rank))
+        return self._fit_budget(passages)
+
+    # ---------- Internals ----------
+
+    @staticmethod
+    def _to_passages(docs: Sequence[Any]) -> List[Passage]:
+        out: List[Passage] = []
+        for rank, d in enumerate(docs):
+            md: Dict[str, Any] = getattr(d, "metadata", None) or {}
+            text = getattr(d, "page_content", str(d))
+            if not text.strip():
+                continue
+            start = md.get("start_index")
+            out.append(Passage(text=text, source=md.get("source"), page=md.get("page"), rank=rank,
+                               start=start if isinstance(start, int) else None, ranks=[rank]))
+        return out
+
+    def _join(self, a: Passage, b: Passage) -> Optional[Passage]:
+        """Merge ``b`` into ``a`` if they overlap or touch; ``a`` is the earlier one in the page."""
+        if a.start is not None and b.start is not None:
+            if b.start < a.start:
+                a, b = b, a
+            if b.end <= a.end:                                   # b fully inside a
+                text = a.text
+            elif b.start <= a.end + self.adjacency_gap:
+                overlap = a.end - b.start
+                if overlap > 0 and not a.text.endswith(b.text[:overlap]):
+                    return None
+                text = a.text + b.text[overlap:] if overlap >= 0 else a.text + " " + b.text
+            else:
+                return None
+            start = a.start
+        else:
+            if b.text in a.text:
+                text = a.text
+            elif a.text in b.text:
+                text = b.text
+            else:
+                overlap = _suffix_prefix_overlap(a.text, b.text, self.min_overlap)
+                if overlap:
+                    text = a.text + b.text[overlap:]
+                else:
+                    overlap = _suffix_prefix_overlap(b.text, a.text, self.min_overlap)
+                    if not overlap:
+                        return None
+                    text = b.text + a.text[overlap:]
+            start = None
+        return Passage(text=text, source=a.source, page=a.page, rank=min(a.rank, b.rank),
+                       start=start, ranks=sorted(a.ranks + b.ranks))
+
+    def _merge(self, passages: List[Passage]) -> List[Passage]:
+        groups: Dict[Tuple[Any, Any], List[Passage]] = {}
+        for p in passages:
+            if p.source is None:
+                groups.setdefault((id(p), None), []).append(p)
+            else:
+                groups.setdefault((p.source, p.page), []).append(p)
+
+        merged: List[Passage] = []
+        for group in groups.values():
+            group.sort(key=lambda p: (p.start is None, p.start or 0, p.rank))
+            changed = True
+            while changed and len(group) > 1:
+                changed = False
+                for i in range(len(group)):
+                    for j in range(i + 1, len(group)):
+                        joined = self._join(group[i], group[j])
+                        if joined is not None:
+                            group[i] = joined
+                            del group[j]
+                            changed = True
+                            break
+                    if changed:
+                        break
+            merged.extend(group)
+        return merged
+
+    def _dedupe(self, passages: List[Passage]) -> List[Passage]:
+        kept: List[Passage] = []
+        kept_shingles: List[Set[Tuple[str, ...]]] = []
+        for p in passages:
+            sh = _shingles(p.text)
+            duplicate = False
+            for other in kept_shingles:
+                # Jaccard >= t is impossible when the set sizes differ by more than a factor t
+                if min(len(sh), len(other)) < self.dedupe_threshold * max(len(sh), len(other)):
+                    continue
+                inter = len(sh & other)
+                if inter and inter / (len(sh) + len(other) - inter) >= self.dedupe_threshold:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(p)
+                kept_shingles.append(sh)
+        return kept
+
+    def _fit_budget(self, passages: List[Passage]) -> List[Passage]:
+        if self.token_budget is None or self.token_budget <= 0:
+            return passages
+        out: List[Passage] = []
+        used = 0
+        sep_tokens = count_tokens(self.separator)
+        for p in passages:
+            cost = count_tokens(p.text) + (sep_tokens if out else 0)
+            if used + cost <= self.token_budget:
+                out.append(p)
+                used += cost
+                continue
+            remaining = self.token_budget - used - (sep_tokens if out else 0)
+            if remaining >= self.min_tail_tokens:
+                out.append(Passage(text=truncate_to_tokens(p.text, remaining), source=p.source, page=p.page,
+                                   rank=p.rank, start=p.start, ranks=p.ranks))
+            break
+        return out
@@ -0,0 +1,136 @@
+"""
+Local router for document-level questions.
+
+"Summarize this document", "who is the author of lease.pdf?", "how many
+pages is the report?" cannot be answered well from top-k fragments, and
+going through ``ConversationalRAG`` costs a rewrite call, a retrieval and
+an answer call. When the index has per-document entries in
+``doc_summaries.json`` (see ``src.document_ingestion.doc_summaries``), such
+questions are answered from them directly, in well under a millisecond.
+
+Routing is deliberately narrow: the whole (normalised) question must match
+one of the patterns below, optionally naming a document ("of lease.pdf",
+"this report"), so "what does the report say about supplier risk?" still
+goes to retrieval. A question about documents whose entries are missing or
+failed, or with a page or upload-time filter, is not routed either.
+"""
+from __future__ import annotations
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.document_ingestion.doc_summaries import DocumentSummaryStore
+
+_DOC = r"(?:document|doc|file|report|paper|pdf|upload|contract|text|article)s?"
+_NAME = r"[\w][\w .()-]*?\.(?:pdf|docx|txt)"
+_REF = rf"(?:(?:this|the|that|my|these|those|each|every|both|all|all the|all of the) {_DOC}|{_DOC}|it|they|{_NAME})"
+_OF = rf"(?: (?:of|in|for|from|by|on) {_REF})?"
+
+_INTENTS: List[Tuple[str, str]] = [
+    ("summary", rf"(?:summari[sz]e|recap|(?:give|write|provide) (?:me )?(?:a |an )?(?:\w+ )?(?:summary|overview|recap)"
+                rf"|(?:a |an )?(?:\w+ )?(?:summary|overview|recap)|tl ?;? ?dr){_OF}(?: {_REF})?"),
+    ("summary", rf"what (?:is|are|was) {_REF} about"),
+    ("summary", rf"what (?:is|are) the (?:main|key) (?:points|takeaways|ideas|findings){_OF}"),
+    ("author", rf"who (?:is|are|was|were) the authors?{_OF}|who (?:wrote|authored) {_REF}|authors?{_OF}"),
+    ("title", rf"what (?:is|was) the title{_OF}|title{_OF}|what is {_REF} called"),
+    ("created", rf"when was {_REF} (?:written|created|published|dated|issued)"
+                rf"|what (?:is|was) the (?:creation |publication )?date{_OF}"),
+    ("modified", rf"when was {_REF} (?:last )?(?:modified|updated|revised|changed)"
+                 rf"|what (?:is|was) the last modified date{_OF}"),
+    ("publisher", rf"who (?:is|was) the publisher{_OF}|who published {_REF}|publisher{_OF}"),
+    ("language", rf"(?:in )?what language (?:is|are) {_REF}(?: written)?(?: in)?|what is the language{_OF}"),
+    ("pages", rf"how many pages (?:does|do|are|is) (?:there in )?(?:in )?{_REF}(?: have| contain)?"
+              rf"|how many pages{_OF}|how long is {_REF}|what is the page count{_OF}"),
+    ("tone", rf"what (?:is|was) the (?:tone|sentiment)(?: and (?:tone|sentiment))?{_OF}"),
+]
+_PATTERNS = [(intent, re.compile(pattern)) for intent, pattern in _INTENTS]
+_FILE_RE = re.compile(r"\.(?:pdf|docx|txt)\b")
+
+_FIELDS = {"title": "Title", "created": "DateCreated", "modified": "LastModifiedDate", "publisher": "Publisher",
+           "language": "Language", "tone": "SentimentTone"}
+_MISSING = {"", "not available", "n/a", "na", "unknown", "none", "not specified", "not mentioned"}
+_PREFIX = re.compile(r"^(?:(?:hi|hey|ok|okay|so)[, ]+)?(?:please |(?:can|could|would) you (?:please )?|"
+                     r"i want (?:to know )?|tell me )+")
+
+
+def _normalise(question: str) -> str:
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    q = q.replace("what's", "what is").replace("who's", "who is").replace("’", "'")
+    q = re.sub(r"[?!.]+$", "", q).strip()
+    q = re.sub(r",? please$", "", q)
+    return _PREFIX.sub("", q).strip()
+
+
+def classify(question: str) -> Optional[Tuple[str, str]]:
+    """``(intent, normalised question)`` for a document-level question, else None."""
+    q = _normalise(question)
+    for intent, pattern in _PATTERNS:
+        if pattern.fullmatch(q):
+            return intent, q
+    return None
+
+
+def _value(value: Any) -> Optional[str]:
+    if isinstance(value, (list, tuple)):
+        items = [str(v).strip() for v in value if str(v).strip().lower() not in _MISSING]
+        return ", ".join(items) or None
+    text = str(value).strip() if value is not None else ""
+    return None if text.lower() in _MISSING else text
+
+
+class DocumentQueryRouter:
+    def __init__(self, index_dir: Path, metadata_filter: Optional[Dict[str, Any]] = None):
+        self.store = DocumentSummaryStore(index_dir)
+        self.metadata_filter = metadata_filter or {}
+
+    def _documents(self, q: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Entries the question is about: the documents it names, else all (within the filter)."""
+        entries = self.store.all()
+        if not entries or set(self.metadata_filter) - {"doc_id", "file_type"}:
+            return None
+        ids = list(entries)
+        if "doc_id" in self.metadata_filter:
+            ids = [d for d in ids if d in self.metadata_filter["doc_id"]]
+        if "file_type" in self.metadata_filter:
+            ids = [d for d in ids if entries[d].get("file_type") in self.metadata_filter["file_type"]]
+        if _FILE_RE.search(q):
+            ids = [d for d in ids if d.lower() in q]        # names a file: only that one (none if unknown)
+        picked = {d: entries[d] for d in ids}
+        if not picked or any(e.get("status") != "ok" for e in picked.values()):
+            return None
+        return picked
+
+    @staticmethod
+    def _answer(intent: str, entry: Dict[str, Any]) -> str:
+        md = entry.get("metadata") or {}
+        if intent == "summary":
+            points = [str(s).strip() for s in (md.get("Summary") or []) if str(s).strip()]
+            title = _value(md.get("Title"))
+            body = "\n".join(f"- {p}" for p in points) or "No summary is available."
+            return f"{title}\n{body}" if title else body
+        if intent == "author":
+            return _value(md.get("Author")) or "The author is not stated in the document."
+        if intent == "pages":
+            # the loader yields one Document per PDF page but a single one for DOCX/TXT
+            pages = entry.get("pages") if entry.get("file_type") == "pdf" else _value(md.get("PageCount"))
+            if not str(pages or "").isdigit():
+                return "The page count is not available."
+            return f"{pages} page" if int(pages) == 1 else f"{pages} pages"
+        label = {"created": "creation date", "modified": "last modified date"}.get(intent, intent)
+        return _value(md.get(_FIELDS[intent])) or f"The {label} is not stated in the document."
+
+    def route(self, question: str) -> Optional[Dict[str, Any]]:
+        """``{"intent", "answer", "doc_ids"}`` when the question can be answered from the summaries."""
+        found = classify(question)
+        if found is None:
+            return None
+        intent, q = found
+        docs = self._documents(q)
+        if docs is None:
+            return None
+        if len(docs) == 1:
+            answer = self._answer(intent, next(iter(docs.values())))
+        else:
+            sep = "\n" if intent == "summary" else " "
+            answer = "\n\n".join(f"{doc_id}:{sep}{self._answer(intent, e)}" for doc_id, e in docs.items())
+        return {"intent": intent, "answer": answer, "doc_ids": list(docs)}
@@ -0,0 +1,76 @@
+"""
+Maximal-marginal-relevance selection over vectors already in the index.
+
+LangChain's FAISS MMR re-embeds nothing either, but it reconstructs the
+candidates one at a time and recomputes every candidate's similarity to the
+whole selected set at each step. Here:
+
+1. the ``fetch_k`` nearest positions come from the (layered, possibly
+   filtered) index search that plain retrieval uses anyway,
+2. their stored vectors are gathered with one ``reconstruct_batch``,
+3. query relevance and the candidate-candidate cosine matrix are computed
+   once (one ``fetch_k x d`` and one ``fetch_k x fetch_k`` product),
+4. each greedy step scores all remaining candidates with one vectorised
+   ``lambda * relevance - (1 - lambda) * max_similarity_to_selected`` and
+   updates the running maximum with the winner's row.
+
+``fetch_k`` is small (tens), so the whole selection costs well under a
+millisecond next to the embedding call.
+"""
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+
+from src.document_ingestion.index_store import LayeredIndex
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> np.ndarray:
+    """
+    Indices (into ``candidates``) of ``k`` rows chosen by MMR, in selection
+    order. ``lambda_mult`` 1 ranks by relevance only, 0 by diversity only
+    (after the first, most relevant, pick).
+    """
+    n = candidates.shape[0]
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    cand = _unit(np.asarray(candidates, dtype=np.float32))
+    relevance = cand @ _unit(np.asarray(query, dtype=np.float32).reshape(-1))
+    similarity = cand @ cand.T
+
+    selected = np.empty(k, dtype=np.int64)
+    redundancy = np.full(n, -np.inf, dtype=np.float32)     # max similarity to anything selected so far
+    available = np.ones(n, dtype=bool)
+    for step in range(k):
+        # the first pick is always the most relevant one, as in LangChain's implementation
+        score = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy if step else relevance
+        best = int(np.argmax(np.where(available, score, -np.inf)))
+        selected[step] = best
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+def mmr_positions(index, query: np.ndarray, positions: np.ndarray, k: int, lambda_mult: float = 0.5) -> np.ndarray:
+    """MMR over index ``positions`` (``-1`` padding ignored), using the vectors stored at those positions."""
+    positions = np.asarray(positions, dtype=np.int64)
+    positions = positions[positions >= 0]
+    if positions.size <= 1:
+        return positions[:k]
+    layered = index if isinstance(index, LayeredIndex) else LayeredIndex(index)
+    vectors = layered.reconstruct_batch(positions)
+    return positions[mmr_select(query, vectors, k, lambda_mult)]
+
+
+def mmr_search(index, query: np.ndarray, k: int, fetch_k: int = 20, lambda_mult: float = 0.5,
+               subset: Optional[np.ndarray] = None) -> np.ndarray:
+    """Positions of ``k`` diverse results among the ``fetch_k`` nearest to ``query`` (a 1 x d array)."""
+    layered = index if isinstance(index, LayeredIndex) else LayeredIndex(index)
+    _, ids = layered.search(query, max(int(fetch_k), int(k)), subset=subset)
+    return mmr_positions(layered, query[0], ids[0], k, lambda_mult)
@@ -0,0 +1,145 @@
+"""
+Micro-batched retrieval shared by every ``ConversationalRAG`` in the process.
+
+Concurrent similarity searches are submitted to one ``QueryScheduler`` per
+embedding model. Each batch (collected for up to ``max_wait_ms`` or until
+``max_batch_size`` queries are waiting) costs:
+
+* one embedding call for all distinct query texts (repeats share a vector),
+* one matrix ``index.search`` per target index and metadata filter, with
+  ``k`` = the largest ``k`` asked of it,
+
+and every caller gets back its own top-``k`` Documents. MMR queries ride
+along: their ``fetch_k`` candidates come from the same matrix search and are
+reduced to ``k`` with ``mmr.mmr_positions``. Score thresholds go through the
+regular LangChain retriever.
+"""
+from __future__ import annotations
+import inspect
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from utils.batching import MicroBatcher
+from utils.model_loader import describe_embeddings
+from src.document_ingestion.index_store import LayeredIndex
+from src.document_chat.mmr import mmr_positions
+
+
+def _query_embedder(embeddings):
+    """
+    Batched query embedding. Providers that embed queries and documents
+    differently (Gemini's ``task_type``) are asked for query vectors.
+    """
+    try:
+        params = inspect.signature(embeddings.embed_documents).parameters
+    except (TypeError, ValueError):
+        params = {}
+    if "task_type" in params:
+        return lambda texts: embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return embeddings.embed_documents
+
+
+def _search_subset(vs: FAISS, x: np.ndarray, k: int, subset: np.ndarray):
+    index = vs.index if isinstance(vs.index, LayeredIndex) else LayeredIndex(vs.index)
+    return index.search(x, k, subset=subset)
+
+
+class QueryScheduler:
+    def __init__(self, embeddings, max_batch_size: int = 32, max_wait_ms: float = 3.0, workers: int = 2):
+        self.log = CustomLogger().get_logger(__name__)
+        self.embeddings = embeddings
+        self._embed = _query_embedder(embeddings)
+        self.stats = {"queries": 0, "distinct_queries": 0, "embed_calls": 0, "index_searches": 0, "mmr_queries": 0}
+        self._stats_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._run_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    workers=workers, name="query-scheduler")
+
+    def search(self, vs: FAISS, query: str, k: int = 4, subset: Optional[np.ndarray] = None,
+               subset_key: Hashable = None, fetch_k: Optional[int] = None,
+               lambda_mult: float = 0.5) -> List[Document]:
+        """
+        Top-``k`` Documents for ``query`` in ``vs``, computed together with
+        whatever else is waiting. ``subset`` (positions allowed by a metadata
+        filter) restricts the search; queries with equal ``subset_key`` share it.
+        With ``fetch_k`` the ``k`` results are picked by MMR among the
+        ``fetch_k`` nearest.
+        """
+        mmr = (max(int(fetch_k), int(k)), float(lambda_mult)) if fetch_k else None
+        return self.batcher.map([(vs, query, int(k), subset, subset_key, mmr)])[0]
+
+    def _run_batch(self, items: List[Tuple[FAISS, str, int, Optional[np.ndarray], Hashable, Optional[Tuple[int, float]]]]
+                   ) -> List[List[Document]]:
+        texts = list(dict.fromkeys(item[1] for item in items))
+        vectors = np.asarray(self._embed(texts), dtype=np.float32)
+        row = {text: i for i, text in enumerate(texts)}
+
+        groups: Dict[Tuple[int, Hashable], List[int]] = {}
+        for pos, (vs, _, _, subset, subset_key, _) in enumerate(items):
+            key = (id(vs), None if subset is None else (subset_key if subset_key is not None else ("pos", pos)))
+            groups.setdefault(key, []).append(pos)
+
+        out: List[Optional[List[Document]]] = [None] * len(items)
+        for positions in groups.values():
+            vs, _, _, subset, _, _ = items[positions[0]]
+            x = np.ascontiguousarray(vectors[[row[items[p][1]] for p in positions]])
+            if vs._normalize_L2:
+                faiss.normalize_L2(x)
+            depth = lambda p: items[p][5][0] if items[p][5] else items[p][2]
+            k = max(depth(p) for p in positions)
+            _, ids = vs.index.search(x, k) if subset is None else _search_subset(vs, x, k, subset)
+            for r, p in enumerate(positions):
+                mmr = items[p][5]
+                if mmr:
+                    chosen = mmr_positions(vs.index, x[r], ids[r, :mmr[0]], items[p][2], mmr[1])
+                else:
+                    chosen = ids[r, :items[p][2]]
+                out[p] = self._documents(vs, chosen)
+        with self._stats_lock:
+            self.stats["queries"] += len(items)
+            self.stats["distinct_queries"] += len(texts)
+            self.stats["embed_calls"] += 1
+            self.stats["index_searches"] += len(groups)
+            self.stats["mmr_queries"] += sum(1 for item in items if item[5])
+        return out
+
+    @staticmethod
+    def _documents(vs: FAISS, ids: np.ndarray) -> List[Document]:
+        docs = []
+        for i in ids:
+            if i == -1:
+                continue
+            doc = vs.docstore.search(vs.index_to_docstore_id[int(i)])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+
+_SCHEDULERS: Dict[Tuple[Any, ...], QueryScheduler] = {}
+_SCHEDULERS_GUARD = threading.Lock()
+
+
+def get_query_scheduler(embeddings, batching_config: Optional[Dict[str, Any]] = None) -> Optional[QueryScheduler]:
+    """The process-wide scheduler for an embedding model, or None when ``query_batching`` is disabled."""
+    cfg = batching_config or {}
+    if not cfg.get("enabled", True):
+        return None
+    emb = describe_embeddings(embeddings)
+    # keyed by model, not instance: every request builds its own ModelLoader/embeddings
+    key = (emb.get("backend"), emb.get("model"))
+    with _SCHEDULERS_GUARD:
+        scheduler = _SCHEDULERS.get(key)
+        if scheduler is None:
+            scheduler = QueryScheduler(
+                embeddings,
+                max_batch_size=int(cfg.get("max_batch_size", 32)),
+                max_wait_ms=float(cfg.get("max_wait_ms", 3)),
+                workers=int(cfg.get("workers", 2)),
+            )
+            _SCHEDULERS[key] = scheduler
+        return scheduler
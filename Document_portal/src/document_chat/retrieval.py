@@ -1,18 +1,22 @@
 import sys
 import os
 from operator import itemgetter
+from pathlib import Path
 from typing import List, Optional, Dict, Any
 
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
 from exceptions.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from prompts.prompt_library import PROMPT_REGISTRY
 from model.models import PromptType
+from src.document_chat.context_packer import ContextPacker
+from src.document_chat.doc_router import DocumentQueryRouter
+from src.document_chat.query_scheduler import get_query_scheduler
+from src.document_ingestion.index_cache import SharedIndexRetriever, get_shared_index
 
 
 class ConversationalRAG:
@@ -25,13 +29,15 @@ class ConversationalRAG:
         answer = rag.invoke("What is ...?", chat_history=[])
     """
 
-    def __init__(self, session_id: Optional[str], retriever=None):
+    def __init__(self, session_id: Optional[str], retriever=None, model_loader: Optional[ModelLoader] = None):
         try:
             self.log = CustomLogger().get_logger(__name__)
             self.session_id = session_id
+            self.model_loader = model_loader or ModelLoader()
 
             # Load LLM and prompts once
             self.llm = self._load_llm()
+            self.context_packer = self._build_context_packer()
             self.contextualize_prompt: ChatPromptTemplate = PROMPT_REGISTRY[
                 PromptType.CONTEXTUALIZE_QUESTION.value
             ]
@@ -42,6 +48,8 @@ class ConversationalRAG:
             # Lazy pieces
             self.retriever = retriever
             self.chain = None
+            self.router: Optional[DocumentQueryRouter] = None
+            self.last_route: Optional[Dict[str, Any]] = None
             if self.retriever is not None:
                 self._build_lcel_chain()
 
@@ -59,35 +67,53 @@ class ConversationalRAG:
         index_name: str = "index",
         search_type: str = "similarity",
         search_kwargs: Optional[Dict[str, Any]] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
     ):
         """
         Load FAISS vectorstore from disk and build retriever + LCEL chain.
+        The index is shared per process and hot-reloads when new uploads commit.
+        ``metadata_filter`` (see metadata_index.build_filter) restricts the
+        search to matching chunks. ``search_type="mmr"`` returns ``k`` diverse
+        chunks out of the ``fetch_k`` nearest (``lambda_mult`` 1 = relevance only).
         """
         try:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
 
-            embeddings = ModelLoader().load_embeddings()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,  # ok if you trust the index
+            embeddings = self.model_loader.load_embeddings()
+            store_cfg = self.model_loader.config.get("index_store", {}) or {}
+            # base index + appended segments; ok if you trust the index (pickle)
+            shared = get_shared_index(
+                Path(index_path), embeddings, index_name=index_name,
+                mmap=bool(store_cfg.get("mmap", True)),
+                max_cached=int(store_cfg.get("max_cached_indexes", 32)),
             )
+            shared.current()  # fail here, not on the first question, if the index is unreadable
 
             if search_kwargs is None:
                 search_kwargs = {"k": k}
-
-            self.retriever = vectorstore.as_retriever(
-                search_type=search_type, search_kwargs=search_kwargs
+                if search_type == "mmr":
+                    search_kwargs.update(fetch_k=max(fetch_k, k), lambda_mult=lambda_mult)
+
+            # concurrent queries on any index share embedding calls and matrix searches
+            scheduler = get_query_scheduler(embeddings, self.model_loader.config.get("query_batching", {}))
+            self.retriever = SharedIndexRetriever(
+                index=shared, search_type=search_type, search_kwargs=search_kwargs, scheduler=scheduler,
+                metadata_filter=metadata_filter,
             )
             self._build_lcel_chain()
+            if (self.model_loader.config.get("doc_summaries", {}) or {}).get("route", True):
+                self.router = DocumentQueryRouter(Path(index_path), metadata_filter=metadata_filter)
 
             self.log.info(
                 "FAISS retriever loaded successfully",
                 index_path=index_path,
                 index_name=index_name,
                 k=k,
+                search_type=search_type,
+                metadata_filter=metadata_filter,
                 session_id=self.session_id,
             )
             return self.retriever
@@ -104,6 +130,12 @@ class ConversationalRAG:
                     "RAG chain not initialized. Call load_retriever_from_faiss() before invoke().", sys
                 )
             chat_history = chat_history or []
+            # "summarize this document", "who is the author": answered from the ingest-time summaries
+            self.last_route = self.router.route(user_input) if self.router is not None else None
+            if self.last_route is not None:
+                self.log.info("Answered from document summaries", session_id=self.session_id,
+                              intent=self.last_route["intent"], doc_ids=self.last_route["doc_ids"])
+                return self.last_route["answer"]
             payload = {"input": user_input, "chat_history": chat_history}
             answer = self.chain.invoke(payload)
             if not answer:
@@ -126,7 +158,7 @@ class ConversationalRAG:
 
     def _load_llm(self):
         try:
-            llm = ModelLoader().load_llm()
+            llm = self.model_loader.load_llm()
             if not llm:
                 raise ValueError("LLM could not be loaded")
             self.log.info("LLM loaded successfully", session_id=self.session_id)
@@ -135,9 +167,18 @@ class ConversationalRAG:
             self.log.error("Failed to load LLM", error=str(e))
             raise DocumentPortalException("LLM loading error in ConversationalRAG", sys)
 
-    @staticmethod
-    def _format_docs(docs) -> str:
-        return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+    def _build_context_packer(self) -> Optional[ContextPacker]:
+        cfg = self.model_loader.config.get("context_packing", {}) or {}
+        if not cfg.get("enabled", True):
+            return None
+        budget = self.model_loader.get_llm_config().get("context_token_budget", cfg.get("token_budget", 3000))
+        self.log.info("Context packing enabled", token_budget=budget, session_id=self.session_id)
+        return ContextPacker(token_budget=budget, dedupe_threshold=cfg.get("dedupe_threshold", 0.85))
+
+    def _format_docs(self, docs) -> str:
+        if self.context_packer is None:
+            return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+        return self.context_packer.pack(docs)
 
     def _build_lcel_chain(self):
         try:
@@ -1,27 +1,31 @@
 import sys
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-import pandas as pd
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.output_parsers import OutputFixingParser
 from utils.model_loader import ModelLoader
+from utils.structured_output import TolerantJsonParser, structured_llm
 from logger.custom_logger import CustomLogger
 from exceptions.custom_exception import DocumentPortalException
 from prompts.prompt_library import PROMPT_REGISTRY
 from model.models import SummaryResponse,PromptType
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 class DocumentComparatorLLM:
-    def __init__(self):
+    def __init__(self, model_loader: Optional[ModelLoader] = None):
         load_dotenv()
         self.log = CustomLogger().get_logger(__name__)
-        self.loader = ModelLoader()
+        self.loader = model_loader or ModelLoader()
         self.llm = self.loader.load_llm()
-        self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
-        self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
+        self.parser = TolerantJsonParser(pydantic_object=SummaryResponse)
         self.prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON.value]
-        self.chain = self.prompt | self.llm | self.parser
+        self.chain = self.prompt | structured_llm(self.llm, SummaryResponse) | self.parser
         self.log.info("DocumentComparatorLLM initialized", model=self.llm)
 
-    def compare_documents(self, combined_docs: str) -> pd.DataFrame:
+    def compare_documents(self, combined_docs: str) -> "pd.DataFrame":
         try:
             inputs = {
                 "combined_docs": combined_docs,
@@ -36,8 +40,47 @@ class DocumentComparatorLLM:
             self.log.error("Error in compare_documents", error=str(e))
             raise DocumentPortalException("Error comparing documents", sys)
 
-    def _format_response(self, response_parsed: list[dict]) -> pd.DataFrame: #type: ignore
+    def compare_many(self, reference_name: str, reference_text: str,
+                     candidates: List[Tuple[str, Callable[[], str]]],
+                     max_concurrency: int = 4) -> Iterator[Dict[str, Any]]:
+        """
+        Compare one reference against many candidates. The reference text is
+        extracted once by the caller; each candidate (name, loader) is read
+        and compared on its own worker, at most ``max_concurrency`` at a time.
+        Results are yielded as they finish, in completion order; a failing
+        candidate yields an error record instead of aborting the job.
+        """
+        header = f"Document: {reference_name}\n{reference_text}"
+
+        def run(index: int, name: str, load: Callable[[], str]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            try:
+                combined = f"{header}\n\nDocument: {name}\n{load()}"
+                df = self.compare_documents(combined)
+                return {"index": index, "candidate": name, "status": "ok",
+                        "rows": df.to_dict(orient="records"), "seconds": round(time.perf_counter() - started, 3)}
+            except Exception as e:
+                self.log.error("Bulk comparison failed for candidate", candidate=name, error=str(e))
+                return {"index": index, "candidate": name, "status": "error", "error": str(e),
+                        "seconds": round(time.perf_counter() - started, 3)}
+
+        self.log.info("Bulk comparison started", reference=reference_name, candidates=len(candidates),
+                      max_concurrency=max_concurrency)
+        with ThreadPoolExecutor(max_workers=max(1, min(int(max_concurrency), len(candidates) or 1)),
+                                thread_name_prefix="compare") as pool:
+            # carry the caller's context (LLM priority) into the workers
+            futures = [pool.submit(contextvars.copy_context().run, run, i, name, load)
+                       for i, (name, load) in enumerate(candidates)]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:      # consumer went away: do not start the rest
+                    future.cancel()
+
+    def _format_response(self, response_parsed: list[dict]) -> "pd.DataFrame": #type: ignore
         try:
+            import pandas as pd     # deferred: ~0.3 s of start-up import
             df = pd.DataFrame(response_parsed)
             return df
         except Exception as e:
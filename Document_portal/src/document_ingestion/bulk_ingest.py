@@ -0,0 +1,315 @@
+"""
+Resumable bulk ingestion of a directory tree into one FAISS index.
+
+    python -m src.document_ingestion.bulk_ingest DOCS_DIR --index-dir faiss_index/archive
+        [--workers 4] [--embed-workers 2] [--batch-chunks 512] [--chunk-size 1000] [--chunk-overlap 200]
+
+Pipeline (``bulk_ingest`` in config/config.yaml sets the defaults):
+
+1. walk ``DOCS_DIR`` for supported files, in a stable order,
+2. skip files already ingested (checkpoint) and files whose content hash was
+   already seen (copies of one file under several names),
+3. load, tag, strip furniture, split and collapse each file on a process pool,
+4. embed batches of ~``batch_chunks`` chunks on ``embed_workers`` threads, at
+   most two batches in flight per thread, so parsing never runs far ahead,
+5. commit each batch through ``FaissManager`` (one group-committed segment);
+   the index is compacted once at the end instead of every few segments.
+
+Progress is appended to ``<index_dir>/bulk_checkpoint.jsonl`` only after a
+file's chunks are committed. After a crash or Ctrl-C, re-running the same
+command skips every file recorded there (same path, size and mtime). A file
+that was committed but not yet recorded is ingested again; the index's chunk
+fingerprints keep it from being stored twice. Failed files are retried.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+from utils.model_loader import ModelLoader, describe_embeddings
+from utils.document_ops import load_documents
+from src.document_ingestion.chunk_dedup import build_deduper
+from src.document_ingestion.chunker import build_chunker
+from src.document_ingestion.data_ingestion import SUPPORTED_EXTENSIONS, ChatIngestor, FaissManager, split_documents
+
+CHECKPOINT_NAME = "bulk_checkpoint.jsonl"
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_file(path: str, doc_id: str, chunk_size: int, chunk_overlap: int,
+               dedup_config: Optional[Dict[str, Any]], chunk_config: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """
+    Load one file and turn it into chunks exactly as ``ChatIngestor.built_retriever``
+    does (process-pool task). ``chunk_config`` holds the ``chunking`` and
+    ``embedding_model`` config blocks.
+    """
+    docs = load_documents([Path(path)])
+    ChatIngestor._tag_documents(docs, {path: doc_id})
+    deduper = build_deduper(dedup_config)
+    chunker = build_chunker(chunk_config, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    split = lambda pages: split_documents(pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap, chunker=chunker)
+    return deduper.process(docs, split) if deduper is not None else split(docs)
+
+
+class Checkpoint:
+    """Append-only JSON lines, one per finished file: rel path, size, mtime_ns, sha256, status, chunks."""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.hashes: Set[str] = set()
+        self._lock = threading.Lock()
+        if self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue        # torn last line of an interrupted run
+                self.entries[entry["path"]] = entry
+                if entry["status"] != "failed":
+                    self.hashes.add(entry["sha256"])
+
+    def is_current(self, rel: str, stat: os.stat_result) -> bool:
+        entry = self.entries.get(rel)
+        return bool(entry and entry["status"] != "failed"
+                    and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns)
+
+    def record(self, entries: List[Dict[str, Any]]):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                    self.entries[entry["path"]] = entry
+                    if entry["status"] != "failed":
+                        self.hashes.add(entry["sha256"])
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class _Precomputed(Embeddings):
+    """
+    Hands the index writer vectors computed by the bulk embedding stage, so
+    embedding runs on several threads while commits stay single-writer.
+    Texts it has no vector for are embedded by the wrapped model.
+    """
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        described = describe_embeddings(inner)
+        self.backend, self.model = described["backend"], described["model"]
+        self._vectors: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, texts: List[str], vectors: List[List[float]]):
+        with self._lock:
+            self._vectors.update(zip(texts, vectors))
+
+    def discard(self, texts: List[str]):
+        with self._lock:
+            for t in texts:
+                self._vectors.pop(t, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            found = [self._vectors.get(t) for t in texts]
+        missing = [t for t, v in zip(texts, found) if v is None]
+        computed = iter(self.inner.embed_documents(missing)) if missing else iter(())
+        return [v if v is not None else next(computed) for v in found]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+
+class BulkIngestor:
+    def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None, workers: Optional[int] = None,
+                 embed_workers: Optional[int] = None, batch_chunks: Optional[int] = None,
+                 chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.log = CustomLogger().get_logger(__name__)
+        self.model_loader = model_loader or ModelLoader()
+        cfg = self.model_loader.config.get("bulk_ingest", {}) or {}
+        self.index_dir = Path(index_dir)
+        self.workers = int(workers if workers is not None else cfg.get("workers") or os.cpu_count() or 1)
+        self.embed_workers = max(1, int(embed_workers or cfg.get("embed_workers", 2)))
+        self.batch_chunks = max(1, int(batch_chunks or cfg.get("batch_chunks", 512)))
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.dedup_config = self.model_loader.config.get("chunk_dedup", {}) or {}
+        self.chunk_config = {key: self.model_loader.config.get(key) for key in ("chunking", "embedding_model")}
+
+        self.fm = FaissManager(self.index_dir, self.model_loader)
+        # segments pile up during the load; compact once at the end instead
+        self.fm.writer_options["compact_after_segments"] = int(cfg.get("compact_after_segments", 256))
+        self.embeddings = _Precomputed(self.fm.emb)
+        self.fm.emb = self.embeddings
+        self.checkpoint = Checkpoint(self.index_dir / CHECKPOINT_NAME)
+        self.stats = {"files_seen": 0, "files_ingested": 0, "resumed": 0, "duplicates": 0, "failed": 0,
+                      "chunks": 0, "embeddings": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self._create_lock = threading.Lock()
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    @staticmethod
+    def walk(root: Path) -> Iterator[Path]:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if Path(name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                    yield Path(dirpath) / name
+
+    def report(self) -> Dict[str, Any]:
+        s = dict(self.stats)
+        secs = max(s["seconds"], 1e-9)
+        s.update(files_per_s=round(s["files_ingested"] / secs, 2), chunks_per_s=round(s["chunks"] / secs, 2),
+                 embeddings_per_s=round(s["embeddings"] / secs, 2))
+        return s
+
+    # ---------- Stages ----------
+
+    def _commit(self, files: List[Dict[str, Any]], chunks: List[Document]):
+        """Embed one batch, commit it, then checkpoint its files (embedding-pool task)."""
+        texts = [c.page_content for c in chunks]
+        if texts:
+            self.embeddings.put(texts, self.embeddings.inner.embed_documents(texts))
+            self._count(embeddings=len(texts))
+            try:
+                with self._create_lock:
+                    if self.fm.vs is None and not self.fm.store.exists():
+                        self.fm.load_or_create(texts=texts, metadatas=[c.metadata for c in chunks])
+                        chunks = []
+                    elif self.fm.vs is None:
+                        self.fm.load_or_create()
+                if chunks:
+                    self.fm.add_documents(chunks, refresh=False)
+            finally:
+                self.embeddings.discard(texts)
+        self.checkpoint.record(files)
+        self._count(files_ingested=len(files), chunks=len(texts))
+
+    def _drain(self, futures: Set[Future], limit: int) -> Set[Future]:
+        """Wait until fewer than ``limit`` futures are pending; re-raise the first failure."""
+        while len(futures) >= limit:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for f in done:
+                f.result()
+        return futures
+
+    def run(self, root: Path) -> Dict[str, Any]:
+        root = Path(root)
+        started = time.perf_counter()
+        seen: Set[str] = set()
+        batch_files: List[Dict[str, Any]] = []
+        batch_chunks: List[Document] = []
+        parsing: Dict[Future, Dict[str, Any]] = {}
+        committing: Set[Future] = set()
+
+        def flush():
+            nonlocal batch_files, batch_chunks, committing
+            if batch_files:
+                committing = self._drain(committing, 2 * self.embed_workers)
+                committing.add(embed_pool.submit(self._commit, batch_files, batch_chunks))
+                batch_files, batch_chunks = [], []
+
+        def collect(future: Future):
+            entry = parsing.pop(future)
+            try:
+                chunks = future.result()
+            except Exception as e:
+                self.log.error("Bulk ingest failed to parse file", path=entry["path"], error=str(e))
+                self.checkpoint.record([{**entry, "status": "failed", "error": str(e)[:300]}])
+                self._count(failed=1)
+                return
+            batch_files.append({**entry, "status": "done", "chunks": len(chunks)})
+            batch_chunks.extend(chunks)
+            if len(batch_chunks) >= self.batch_chunks:
+                flush()
+
+        def drain_parsing(limit: int):
+            while len(parsing) >= limit:
+                done, _ = wait(list(parsing), return_when=FIRST_COMPLETED)
+                for f in done:
+                    collect(f)
+
+        parse_pool = (ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                      if self.workers > 0 else ThreadPoolExecutor(1))      # workers=0: parse in-process
+        embed_pool = ThreadPoolExecutor(self.embed_workers, thread_name_prefix="bulk-embed")
+        self.log.info("Bulk ingest started", root=str(root), index_dir=str(self.index_dir), workers=self.workers,
+                      embed_workers=self.embed_workers, resumable_files=len(self.checkpoint.entries))
+        try:
+            for path in self.walk(root):
+                self._count(files_seen=1)
+                rel = path.relative_to(root).as_posix()
+                stat = path.stat()
+                if self.checkpoint.is_current(rel, stat):
+                    self._count(resumed=1)
+                    continue
+                sha = _sha256(path)
+                entry = {"path": rel, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha}
+                if sha in seen or sha in self.checkpoint.hashes:
+                    self.checkpoint.record([{**entry, "status": "duplicate"}])
+                    self._count(duplicates=1)
+                    continue
+                seen.add(sha)
+                drain_parsing(2 * max(1, self.workers))
+                parsing[parse_pool.submit(parse_file, str(path), rel, self.chunk_size, self.chunk_overlap,
+                                          self.dedup_config, self.chunk_config)] = entry
+            drain_parsing(1)
+            flush()
+            self._drain(committing, 1)
+        finally:
+            parse_pool.shutdown(wait=True, cancel_futures=True)
+            embed_pool.shutdown(wait=True, cancel_futures=True)     # let running commits finish and checkpoint
+            self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        if self.stats["chunks"]:
+            self.fm.compact()
+        self.log.info("Bulk ingest finished", **self.report())
+        return self.report()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.document_ingestion.bulk_ingest",
+                                     description="Ingest a directory tree into a FAISS index (resumable)")
+    parser.add_argument("root", type=Path, help="directory to walk for .pdf/.docx/.txt files")
+    parser.add_argument("--index-dir", type=Path, required=True, help="target index directory")
+    parser.add_argument("--workers", type=int, help="parse processes (0 = parse in this process)")
+    parser.add_argument("--embed-workers", type=int, help="concurrent embedding batches")
+    parser.add_argument("--batch-chunks", type=int, help="chunks per embedding batch / commit")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    ingestor = BulkIngestor(args.index_dir, workers=args.workers, embed_workers=args.embed_workers,
+                            batch_chunks=args.batch_chunks, chunk_size=args.chunk_size,
+                            chunk_overlap=args.chunk_overlap)
+    try:
+        report = ingestor.run(args.root)
+    except KeyboardInterrupt:
+        print(json.dumps({"interrupted": True, **ingestor.report()}, indent=2))
+        print("Progress is checkpointed; run the same command again to resume.", file=sys.stderr)
+        return 130
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
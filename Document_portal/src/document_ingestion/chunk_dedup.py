@@ -0,0 +1,194 @@
+"""
+Pre-embedding suppression of page furniture and near-duplicate chunks.
+
+1. ``strip_furniture`` (before splitting): lines at the top/bottom of a page
+   that recur, after normalising digits, on most pages of the same source
+   (headers, footers, "Page 3 of 12", confidentiality banners) are removed.
+2. ``collapse`` (after splitting): each chunk gets a MinHash signature over
+   word trigrams, bucketed with LSH bands. A chunk whose estimated Jaccard
+   similarity to an earlier kept chunk of the same document (``doc_id``, else
+   ``source``) is >= ``threshold`` is dropped and its source/page is appended
+   to the kept chunk's ``metadata["also_in"]`` so citations can still point at
+   every occurrence. Across documents only text that is equal after
+   whitespace/case normalisation collapses: two versions of a contract that
+   differ in one figure must both stay searchable. Chunks shorter than
+   ``min_words`` (signature lines, stray labels) only collapse on exact match.
+
+MinHash rather than SimHash: on chunk-sized texts (100-200 words) a one-word
+edit moves a 64-bit SimHash by 3-9 bits, which overlaps badly with the usual
+k <= 3 cut-off, while the Jaccard estimate stays tunable and well separated.
+"""
+from __future__ import annotations
+import re
+import zlib
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+_MIX = np.uint64(0x9E3779B1)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """Distinct 32-bit hashes of the word trigrams (single words for very short texts)."""
+    words = _WORD_RE.findall(text.lower())
+    ids = {t: zlib.crc32(t.encode("utf-8")) for t in set(words)}
+    w = np.fromiter(map(ids.__getitem__, words), dtype=np.uint64, count=len(words))
+    if w.size >= 3:
+        w = ((((w[:-2] * _MIX) & _MASK32) ^ w[1:-1]) * _MIX & _MASK32) ^ w[2:]
+    return np.unique(w)
+
+
+class MinHasher:
+    """``num_perm`` multiply-shift hashes ((a*x + b) mod 2^64) >> 32 over 32-bit shingle hashes."""
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self.b = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True)
+
+    def signature(self, text: str) -> np.ndarray:
+        x = _shingle_hashes(text)
+        return ((x[:, None] * self.a + self.b) >> np.uint64(32)).min(axis=0)
+
+
+def _normalise_line(line: str) -> str:
+    return _SPACE_RE.sub(" ", _DIGITS_RE.sub("#", line.strip().lower()))
+
+
+class ChunkDeduplicator:
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, min_words: int = 8,
+                 edge_lines: int = 4, furniture_min_pages: int = 3, furniture_page_ratio: float = 0.5,
+                 max_provenance: int = 20):
+        self.log = CustomLogger().get_logger(__name__)
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.minhash = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_words = min_words
+        self.edge_lines = edge_lines
+        self.furniture_min_pages = furniture_min_pages
+        self.furniture_page_ratio = furniture_page_ratio
+        self.max_provenance = max_provenance
+
+    # ---------- Page furniture ----------
+
+    def _edges(self, lines: List[str]) -> List[int]:
+        """Indices of the first/last ``edge_lines`` non-empty lines of a page."""
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        return sorted(set(filled[:self.edge_lines] + filled[-self.edge_lines:]))
+
+    def strip_furniture(self, pages: List[Document]) -> Tuple[List[Document], int]:
+        """Remove recurring header/footer lines per source; returns (pages, lines removed)."""
+        by_source: Dict[Any, List[int]] = defaultdict(list)
+        for i, d in enumerate(pages):
+            by_source[d.metadata.get("source")].append(i)
+
+        out = list(pages)
+        removed = 0
+        for idxs in by_source.values():
+            if len(idxs) < self.furniture_min_pages:
+                continue
+            split = {i: pages[i].page_content.split("\n") for i in idxs}
+            counts: Counter = Counter()
+            for i in idxs:
+                counts.update({_normalise_line(split[i][j]) for j in self._edges(split[i])})
+            threshold = max(self.furniture_min_pages, self.furniture_page_ratio * len(idxs))
+            furniture = {line for line, n in counts.items() if line and n >= threshold}
+            if not furniture:
+                continue
+            for i in idxs:
+                lines = split[i]
+                drop = {j for j in self._edges(lines) if _normalise_line(lines[j]) in furniture}
+                if drop:
+                    removed += len(drop)
+                    text = "\n".join(line for j, line in enumerate(lines) if j not in drop).strip("\n")
+                    out[i] = Document(page_content=text, metadata=dict(pages[i].metadata))
+        return out, removed
+
+    # ---------- Near-duplicate chunks ----------
+
+    @staticmethod
+    def _document(d: Document) -> Any:
+        md = d.metadata or {}
+        return md.get("doc_id", md.get("source"))
+
+    @staticmethod
+    def _where(d: Document) -> Dict[str, Any]:
+        md = d.metadata or {}
+        return {k: md[k] for k in ("doc_id", "source", "page", "start_index") if k in md}
+
+    def _band_keys(self, sig: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(b, sig[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+
+    def collapse(self, chunks: List[Document]) -> List[Document]:
+        kept: List[Document] = []
+        kept_sigs: Dict[int, np.ndarray] = {}
+        kept_docs: List[Any] = []
+        buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        exact: Dict[str, int] = {}
+        for d in chunks:
+            norm = _SPACE_RE.sub(" ", d.page_content.strip().lower())
+            if not norm:
+                continue
+            match: Optional[int] = exact.get(norm)
+            sig = None
+            # table rules and TOC leaders have no words (hence no shingles): exact match only
+            if match is None and len(_WORD_RE.findall(norm)) >= max(1, self.min_words):
+                sig = self.minhash.signature(norm)
+                keys = self._band_keys(sig)
+                doc = self._document(d)
+                for k in dict.fromkeys(i for key in keys for i in buckets.get(key, ())):
+                    # near-duplicates only within one document; across documents they may differ in a figure
+                    if kept_docs[k] == doc and float(np.mean(kept_sigs[k] == sig)) >= self.threshold:
+                        match = k
+                        break
+            if match is not None:
+                also = kept[match].metadata.setdefault("also_in", [])
+                if len(also) < self.max_provenance:
+                    also.append(self._where(d))
+                continue
+            idx = len(kept)
+            kept.append(Document(page_content=d.page_content, metadata=dict(d.metadata or {})))
+            kept_docs.append(self._document(d))
+            exact[norm] = idx
+            if sig is not None:
+                kept_sigs[idx] = sig
+                for key in keys:
+                    buckets[key].append(idx)
+        return kept
+
+    def process(self, pages: List[Document], split) -> List[Document]:
+        """strip furniture -> ``split(pages)`` -> collapse near-duplicates, logging what was saved."""
+        stripped, lines_removed = self.strip_furniture(pages)
+        chunks = split(stripped)
+        kept = self.collapse(chunks)
+        self.log.info("Chunk dedupe", furniture_lines_removed=lines_removed, chunks_in=len(chunks),
+                      chunks_kept=len(kept), dropped=len(chunks) - len(kept))
+        return kept
+
+
+def build_deduper(cfg: Optional[Dict[str, Any]]) -> Optional[ChunkDeduplicator]:
+    """``ChunkDeduplicator`` for a ``chunk_dedup`` config block, or None when disabled."""
+    cfg = cfg or {}
+    if not cfg.get("enabled", True):
+        return None
+    return ChunkDeduplicator(
+        threshold=float(cfg.get("jaccard_threshold", 0.8)),
+        num_perm=int(cfg.get("num_perm", 64)),
+        bands=int(cfg.get("bands", 16)),
+        min_words=int(cfg.get("min_words", 8)),
+        edge_lines=int(cfg.get("furniture_edge_lines", 4)),
+        furniture_min_pages=int(cfg.get("furniture_min_pages", 3)),
+        furniture_page_ratio=float(cfg.get("furniture_page_ratio", 0.5)),
+    )
@@ -0,0 +1,285 @@
+"""
+Structure-aware chunking sized in embedding-model tokens.
+
+Each loaded page is cut on its own (chunks never straddle pages), working
+from offsets into the page text:
+
+1. one pass over the lines (``pattern.fullmatch(text, pos, endpos)``, no
+   copies) finds headings (markdown ``#``, numbered ``4.2 Payment``,
+   ``ARTICLE``/``Section``/``Schedule`` lines, short ALL-CAPS lines) and
+   paragraphs (runs of non-blank lines),
+2. blocks are packed greedily up to ``chunk_tokens``. A heading starts a
+   new chunk (once the current one has ``min_chunk_tokens``). A paragraph
+   that does not fit starts the next chunk if the current one is at least
+   half full; otherwise, and for paragraphs longer than a chunk, it is cut
+   into sentences that fill the chunk, repeating up to ``overlap_tokens``
+   of its trailing sentences at the start of the next one. Only these
+   straddling paragraphs are scanned for sentence ends. A sentence longer
+   than a whole chunk is cut at spaces.
+
+Only the finished chunks are sliced out of the page. Every chunk records
+``source``/``page`` (from its page), ``start_index``/``end_index`` (character
+offsets into the page, so ``page_content[start:end]`` is the chunk text),
+its ``tokens`` and the ``section`` heading it falls under.
+
+Tokens are counted with tiktoken for OpenAI embedding models when it is
+installed, otherwise with the ``utils.tokens`` estimate (4 characters per
+token), which needs no copy at all.
+"""
+from __future__ import annotations
+import math
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from utils.tokens import CHARS_PER_TOKEN
+
+_HEADING_RE = re.compile(
+    r"[ \t]*(?:"
+    r"#{1,6}[ \t]+\S[^\n]*"                                                     # markdown
+    r"|(?:\d{1,3}(?:\.\d{1,3})*\.?|[IVXLC]{1,6}\.|[A-Z]\.)[ \t]+[A-Z][^\n]*[^.;,:\s]"  # 4.2 Payment terms
+    r"|(?i:article|section|chapter|part|schedule|appendix|annex)[ \t]+[\w.]+[^\n]*"
+    r"|[A-Z][A-Z0-9 \t&,'()/-]{2,}[A-Z0-9)]"                                    # ALL CAPS
+    r")[ \t]*")
+_BLANK_RE = re.compile(r"\s*")                  # Unicode whitespace, as str.isspace() below
+_SENTENCE_END_RE = re.compile(r"([.!?][\"')\]]*)\s+")
+_MAX_HEADING_CHARS = 100
+
+
+class TokenCounter:
+    """Token counts for spans of a text; ``name`` is recorded in logs."""
+    def __init__(self, name: str = "estimate", encode_batch: Optional[Callable[[List[str]], List[Any]]] = None):
+        self.name = name
+        self._encode_batch = encode_batch
+
+    def spans(self, text: str, spans: Sequence[Tuple[int, int]]) -> List[int]:
+        if self._encode_batch is None:
+            return [max(1, math.ceil((e - s) / CHARS_PER_TOKEN)) for s, e in spans]
+        return [max(1, len(ids)) for ids in self._encode_batch([text[s:e] for s, e in spans])]
+
+
+_COUNTERS: Dict[Tuple[str, Optional[str]], TokenCounter] = {}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def token_counter(provider: Optional[str] = None, model: Optional[str] = None) -> TokenCounter:
+    """Shared counter for an embedding provider/model; the estimate when no tokenizer is available."""
+    key = (str(provider), model)
+    with _COUNTERS_LOCK:
+        counter = _COUNTERS.get(key)
+        if counter is None:
+            counter = TokenCounter()
+            if provider == "openai":
+                try:
+                    import tiktoken
+                    try:
+                        enc = tiktoken.encoding_for_model(model or "")
+                    except KeyError:
+                        enc = tiktoken.get_encoding("cl100k_base")
+                    counter = TokenCounter(f"tiktoken:{enc.name}", enc.encode_ordinary_batch)
+                except Exception as e:      # not installed, or the BPE file cannot be fetched offline
+                    CustomLogger().get_logger(__name__).warning(
+                        "No tokenizer for embedding model, estimating tokens", model=model, error=str(e))
+            _COUNTERS[key] = counter
+    return counter
+
+
+class StructuredChunker:
+    def __init__(self, chunk_tokens: int = 256, overlap_tokens: int = 32, min_chunk_tokens: int = 32,
+                 counter: Optional[TokenCounter] = None):
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens must be positive")
+        self.chunk_tokens = int(chunk_tokens)
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.chunk_tokens // 2))
+        self.min_chunk_tokens = max(0, min(int(min_chunk_tokens), self.chunk_tokens // 4))
+        self.counter = counter or TokenCounter()
+
+    # ---------- Segmentation ----------
+
+    @staticmethod
+    def _blocks(text: str) -> Tuple[List[Tuple[int, int]], List[bool]]:
+        """(start, end) of every heading and paragraph in ``text``, and whether it is a heading."""
+        spans: List[Tuple[int, int]] = []
+        headings: List[bool] = []
+        para_start, para_end = -1, 0
+        pos, n = 0, len(text)
+        while True:
+            nl = text.find("\n", pos)
+            end = n if nl < 0 else nl
+            if _BLANK_RE.fullmatch(text, pos, end):
+                if para_start >= 0:
+                    spans.append((para_start, para_end))
+                    headings.append(False)
+                    para_start = -1
+            elif end - pos <= _MAX_HEADING_CHARS and _HEADING_RE.fullmatch(text, pos, end):
+                if para_start >= 0:
+                    spans.append((para_start, para_end))
+                    headings.append(False)
+                    para_start = -1
+                start, stop = pos, end
+                while text[start] in " \t":
+                    start += 1
+                while stop > start and text[stop - 1].isspace():
+                    stop -= 1
+                spans.append((start, stop))
+                headings.append(True)
+            else:
+                if para_start < 0:
+                    para_start = pos
+                    while text[para_start] in " \t":
+                        para_start += 1
+                para_end = end
+                while para_end > pos and text[para_end - 1].isspace():
+                    para_end -= 1
+            if nl < 0:
+                break
+            pos = nl + 1
+        if para_start >= 0:
+            spans.append((para_start, para_end))
+            headings.append(False)
+        return spans, headings
+
+    @staticmethod
+    def _sentences(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        out = []
+        for m in _SENTENCE_END_RE.finditer(text, start, end):
+            out.append((start, m.end(1)))
+            start = m.end()
+        if start < end:
+            out.append((start, end))
+        return out
+
+    # ---------- Packing ----------
+
+    def _windows(self, text: str, start: int, end: int, tokens: int) -> List[Tuple[int, int, int]]:
+        """Cut one over-long span into about-equal pieces at spaces."""
+        length = end - start
+        pieces = math.ceil(tokens / self.chunk_tokens)
+        max_chars = max(1, self.chunk_tokens * length // tokens)        # characters that fit in one chunk
+        out = []
+        while start < end:
+            width = min(max_chars, math.ceil((end - start) / max(1, pieces - len(out))))
+            stop = min(end, start + width)
+            if stop < end:
+                space = text.rfind(" ", start + width // 2, stop + 1)
+                stop = space if space > 0 else stop
+            out.append((start, stop, math.ceil(tokens * (stop - start) / length)))
+            start = stop
+            while start < end and text[start].isspace():
+                start += 1
+        return out
+
+    def _pack(self, text: str) -> List[Tuple[int, int, int, Tuple[int, int]]]:
+        """(start, end, tokens, span of the heading in effect or (-1, -1)) of each chunk of ``text``."""
+        spans, headings = self._blocks(text)
+        if not spans:
+            return []
+        tokens = self.counter.spans(text, spans)
+        budget = self.chunk_tokens
+        chunks: List[Tuple[int, int, int, Tuple[int, int]]] = []
+        cur: List[Tuple[int, int, int, int]] = []       # (start, end, tokens, block) of the current chunk
+        state = {"tokens": 0, "section": (-1, -1), "chunk_section": (-1, -1)}
+
+        def add(s: int, e: int, t: int, block: int):
+            if not cur:
+                state["chunk_section"] = state["section"]
+            cur.append((s, e, t, block))
+            state["tokens"] += t
+
+        def emit() -> List[Tuple[int, int, int, int]]:
+            done = cur[:]
+            if done:
+                chunks.append((done[0][0], done[-1][1], state["tokens"], state["chunk_section"]))
+                cur.clear()
+                state["tokens"] = 0
+            return done
+
+        for b, ((s, e), heading, t) in enumerate(zip(spans, headings, tokens)):
+            if heading:
+                if cur and state["tokens"] >= self.min_chunk_tokens:
+                    emit()
+                state["section"] = (s, e)
+            if state["tokens"] + t <= budget:
+                add(s, e, t, b)
+                continue
+            if cur and state["tokens"] >= budget // 2:        # cut between blocks when it keeps half a chunk
+                emit()
+                if t <= budget:
+                    add(s, e, t, b)
+                    continue
+            # the block straddles the boundary: fill the chunk sentence by sentence
+            sentences = self._sentences(text, s, e)
+            for (ss, se), st in zip(sentences, self.counter.spans(text, sentences)):
+                if st > budget:
+                    emit()
+                    for ws, we, wt in self._windows(text, ss, se, st):
+                        add(ws, we, wt, b)
+                        emit()
+                    continue
+                if state["tokens"] + st > budget:
+                    done = emit()
+                    room = min(self.overlap_tokens, budget - st)
+                    tail = []
+                    for u in reversed(done):                   # repeat the end of this paragraph for context
+                        if u[3] != b or u[2] > room:
+                            break
+                        room -= u[2]
+                        tail.append(u)
+                    for u in reversed(tail):
+                        add(*u)
+                add(ss, se, st, b)
+        emit()
+        return chunks
+
+    # ---------- Public API ----------
+
+    def split_text(self, text: str) -> List[Tuple[int, int, int]]:
+        """(start, end, tokens) of the chunks of one page."""
+        return [(s, e, n) for s, e, n, _ in self._pack(text)]
+
+    def split_documents(self, docs: Sequence[Document]) -> List[Document]:
+        out: List[Document] = []
+        section: Dict[Any, str] = {}                # heading in effect at the end of each source so far
+        for d in docs:
+            text = d.page_content or ""
+            source = (d.metadata or {}).get("source")
+            for s, e, n, (hs, he) in self._pack(text):
+                if hs >= 0:
+                    section[source] = text[hs:he]
+                md = dict(d.metadata or {})
+                md.update(start_index=s, end_index=e, tokens=n)
+                if source in section:
+                    md["section"] = section[source]
+                out.append(Document(page_content=text[s:e], metadata=md))
+        return out
+
+
+def embedding_model(config: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """(provider, model_name) of the embedding backend EMBEDDING_PROVIDER selects, without loading it."""
+    block = (config.get("embedding_model") or {}).get(os.getenv("EMBEDDING_PROVIDER", "google")) or {}
+    return block.get("provider"), block.get("model_name")
+
+
+def build_chunker(config: Optional[Dict[str, Any]], chunk_size: int = 1000,
+                  chunk_overlap: int = 200) -> Optional[StructuredChunker]:
+    """
+    ``StructuredChunker`` for the ``chunking`` config block, or None for the
+    character-based LangChain splitter. ``chunk_size``/``chunk_overlap`` are
+    the caller's character sizes, used when the block sets no token sizes.
+    """
+    config = config or {}
+    cfg = config.get("chunking", {}) or {}
+    if cfg.get("strategy", "structured") != "structured":
+        return None
+    provider, model = embedding_model(config) if cfg.get("tokenizer", "auto") == "auto" else (None, None)
+    return StructuredChunker(
+        chunk_tokens=int(cfg.get("chunk_tokens") or math.ceil(chunk_size / CHARS_PER_TOKEN)),
+        overlap_tokens=int(cfg.get("overlap_tokens") if cfg.get("overlap_tokens") is not None
+                           else chunk_overlap // CHARS_PER_TOKEN),
+        min_chunk_tokens=int(cfg.get("min_chunk_tokens", 32)),
+        counter=token_counter(provider, model),
+    )
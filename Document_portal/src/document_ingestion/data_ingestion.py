@@ -2,88 +2,174 @@ from __future__ import annotations
 import os
 import sys
 import hashlib
-import json
 import shutil
 from pathlib import Path
-from typing import List,Optional,Dict,Any,Iterable
+from typing import List,Optional,Dict,Any,Iterable,Tuple
 
 
-import fitz
+import time
+from functools import lru_cache
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, describe_embeddings
 from logger.custom_logger import CustomLogger
 from exceptions.custom_exception import DocumentPortalException
 from utils.file_io import generate_session_id,save_uploaded_files
 from utils.document_ops import load_documents
+from src.document_ingestion.chunk_dedup import ChunkDeduplicator, build_deduper
+from src.document_ingestion.chunker import StructuredChunker, build_chunker
+from src.document_ingestion.doc_summaries import forget_summary, schedule_summaries
+from src.document_ingestion.index_cache import get_shared_index
+from src.document_ingestion.index_store import SegmentedIndexStore, doc_owners, doc_view, same_lineage
+from src.document_ingestion.index_writer import submit_documents
+from src.document_ingestion.index_snapshot import export_snapshot, import_snapshot
+from src.document_ingestion.metadata_index import MetadataIndex, metadata_index
 
 SUPPORTED_EXTENSIONS={'.pdf','.txt','.docx'}
 
+
+@lru_cache(maxsize=16)
+def _character_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    # start_index lets the retriever merge overlapping neighbours back together
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+
+
+def split_documents(docs: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200,
+                    chunker: Optional[StructuredChunker] = None) -> List[Document]:
+    """Chunks of ``docs``: by ``chunker`` when given, else LangChain's character splitter."""
+    if chunker is not None:
+        return chunker.split_documents(docs)
+    return _character_splitter(chunk_size, chunk_overlap).split_documents(docs)
+
 class FaissManager:
+    """
+    Owns one FAISS index directory. Writes are queued on the directory's
+    IndexWriter (single writer, group commit, file-locked); this object keeps
+    an in-memory snapshot that refresh() moves forward to the latest manifest.
+    """
     def __init__(self,index_dir: Path,model_loader:Optional[ModelLoader]=None):
-        self.index_dir=index_dir
+        self.log=CustomLogger().get_logger(__name__)
+        self.index_dir=Path(index_dir)
         self.index_dir.mkdir(parents=True,exist_ok=True)
 
-        self.meta_path=self.index_dir / "ingested_meta.json"
-        self._meta:Dict[str,Any]={"rows":{}}
-
-        if self.meta_path.exists():
-            try:
-                self._meta=json.loads(self.meta_path.read_text(encoding='utf-8')) or {"rows":{}}
-            except Exception:
-                self._meta={"rows":{}}
-
+        self.store=SegmentedIndexStore(self.index_dir)
         self.model_loader=model_loader or ModelLoader()
         self.emb=self.model_loader.load_embeddings()
         self.vs: Optional[FAISS]=None
+        self._snapshot: Dict[str,Any]={}
+
+        store_cfg=self.model_loader.config.get("index_store",{}) or {}
+        self.writer_options={
+            "group_commit_ms":float(store_cfg.get("group_commit_ms",0)),
+            "max_batch_docs":int(store_cfg.get("max_batch_docs",1024)),
+            "compact_after_segments":int(store_cfg.get("compact_after_segments",8)),
+        }
+        self.mmap=bool(store_cfg.get("mmap",True))
 
 
     def _exists(self)->bool:
-        return (self.index_dir/"index.faiss").exists() and (self.index_dir/"index.pkl").exists()
+        return self.store.exists()
     @staticmethod
     def _fingerprint(text:str,md: Dict[str,Any]) -> str:
         src=md.get("source") or md.get("file_path")
         rid=md.get("row_id")
         if src is not None:
-            return f"{src} :: {'' if rid is None else rid}"
+            # chunks of one source share src, so without row_id the content decides
+            rid=rid if rid is not None else hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+            return f"{src} :: {rid}"
         return hashlib.sha256(text.encode('utf-8')).hexdigest() 
-    def _save_meta(self):
-        self.meta_path.write_text(json.dumps(self._meta,ensure_ascii=False,indent=2),encoding='utf-8')
-    def add_documents(self,docs: List[Document]):
+    def _submit(self,docs: List[Document],op: str="add",doc_id: Optional[str]=None):
+        """Queue docs on the directory writer and wait for their group commit."""
+        future=submit_documents(self.index_dir,docs,self.emb,self._fingerprint,op=op,doc_id=doc_id,
+                                **self.writer_options)
+        return future.result()
+    def refresh(self):
+        """Swap to the latest committed snapshot, appending only segments not seen yet."""
+        if self.vs is not None and self.store.read_version()==self._snapshot.get("version"):
+            return self.vs
+        manifest=self.store.read_manifest()
+        if self.vs is not None and same_lineage(manifest,self._snapshot):
+            loaded=set(self._snapshot.get("segments",[]))
+            applied=set(self._snapshot.get("ops",[]))
+            try:
+                for name in manifest.get("segments",[]):
+                    if name not in loaded:
+                        SegmentedIndexStore.append_to_vs(self.vs,*self.store.read_segment(name))
+                new_ops=[self.store.read_ops(name) for name in manifest.get("ops",[]) if name not in applied]
+                if new_ops:
+                    SegmentedIndexStore.apply_ops(self.vs,new_ops)
+                self._snapshot=manifest
+                return self.vs
+            except FileNotFoundError:
+                pass  # compacted underneath us; fall back to a full load
+        self.vs,self._snapshot=self.store.load_snapshot(self.emb,mmap=self.mmap)
+        return self.vs
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Inverted doc_id/file_type/page/upload-time index over the current snapshot (see metadata_index.py)."""
+        if self.vs is None:
+            raise RuntimeError("call load_or_create() before using the metadata index.")
+        return metadata_index(self.vs)
+    def compact(self):
+        """Fold all segments into a new base now (normally the writer does this in the background)."""
+        base=self.store.compact(self.emb)
+        if self.vs is not None:
+            self.refresh()
+        return base
+    def export_snapshot(self,path: Path,float16: Optional[bool]=None) -> Dict[str,Any]:
+        """Write the committed index to one portable archive (see index_snapshot.py); defaults from ``snapshots``."""
+        cfg=self.model_loader.config.get("snapshots",{}) or {}
+        return export_snapshot(self.index_dir,path,
+                               float16=bool(cfg.get("float16",False)) if float16 is None else float16,
+                               compress_level=int(cfg.get("compress_level",1)))
+    @classmethod
+    def from_snapshot(cls,path: Path,index_dir: Path,model_loader:Optional[ModelLoader]=None,
+                      overwrite: bool=False) -> "FaissManager":
+        """Restore an archive written by ``export_snapshot`` into ``index_dir`` and return it loaded."""
+        fm=cls(index_dir,model_loader)
+        import_snapshot(path,fm.index_dir,overwrite=overwrite,embedding=describe_embeddings(fm.emb))
+        fm.load_or_create()
+        return fm
+    def add_documents(self,docs: List[Document],refresh: bool=True):
+        """Add chunks; ``refresh=False`` skips loading the new segment (bulk loads that never search)."""
         if self.vs is None:
             raise RuntimeError("call load_or_create() before add_documents().")
         
-        new_docs: List[Document] = []
-
-        for d in docs:
-            key=self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
-                continue
-            self._meta["rows"][key] = True
-            new_docs.append(d)
-
-        if new_docs:
-            self.vs.add_documents(new_docs)
-            self.vs.save_local(str(self.index_dir))
-            self._save_meta()
-        return len(new_docs)
-
+        added=self._submit(docs) if docs else 0
+        if added and refresh:
+            self.refresh()
+        return added
         
+    def replace_source(self,doc_id: str,docs: List[Document]) -> Dict[str,int]:
+        """
+        Make ``docs`` the stored chunks of ``doc_id``: unchanged chunks are kept
+        (only their page/offset metadata is refreshed), new ones are embedded
+        and vanished ones removed. Returns {"added", "kept", "removed"}.
+        """
+        if self.vs is None:
+            raise RuntimeError("call load_or_create() before replace_source().")
+        result=self._submit(docs,op="replace",doc_id=doc_id)
+        self.log.info("Source replaced",doc_id=doc_id,index=str(self.index_dir),**result)
+        self.refresh()
+        return result
+    def delete_source(self,doc_id: str) -> int:
+        """Remove every chunk of ``doc_id``; chunks shared with other documents only lose its provenance."""
+        if self.vs is None:
+            raise RuntimeError("call load_or_create() before delete_source().")
+        removed=self._submit([],op="delete",doc_id=doc_id)
+        self.log.info("Source deleted",doc_id=doc_id,index=str(self.index_dir),removed=removed)
+        self.refresh()
+        return removed
     def load_or_create(self,texts:Optional[List[str]]=None, metadatas: Optional[List[dict]] = None):
         if self._exists():
-            self.vs=FAISS.load_local(
-                str(self.index_dir),
-                embeddings=self.emb,
-                allow_dangerous_deserialization=True
-            )
-            return self.vs
+            return self.refresh()
         if not texts:
             raise DocumentPortalException("No existing FAISS index and no data to create one", sys)
-        self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
-        self.vs.save_local(str(self.index_dir))
-        return self.vs
+        metadatas=metadatas or [{} for _ in texts]
+        self._submit([Document(page_content=t,metadata=m) for t,m in zip(texts,metadatas)])
+        return self.refresh()
 
 class DocHandler:
     """
@@ -117,6 +203,7 @@ class DocHandler:
     def read_pdf(self, pdf_path: str) -> str:
         try:
             text_chunks = []
+            import fitz     # PyMuPDF, deferred to first use (start-up time)
             with fitz.open(pdf_path) as doc:
                 for page_num in range(doc.page_count):
                     page = doc.load_page(page_num)
@@ -158,8 +245,37 @@ class DocumentComparator:
             self.log.error("Error saving PDF files", error=str(e), session=self.session_id)
             raise DocumentPortalException("Error saving files", e) from e
 
+    def save_bulk_files(self, reference_file, candidate_files) -> Tuple[Path, List[Path]]:
+        """Save one reference and N candidates under reference/ and candidates/ of the session."""
+        try:
+            ref_dir = self.session_path / "reference"
+            cand_dir = self.session_path / "candidates"
+            for d in (ref_dir, cand_dir):
+                d.mkdir(parents=True, exist_ok=True)
+            paths: List[Path] = []
+            for i, fobj in enumerate([reference_file, *candidate_files]):
+                name = os.path.basename(fobj.name)
+                if not name.lower().endswith(".pdf"):
+                    raise ValueError(f"Only PDF files are allowed: {name}")
+                out = ref_dir / name if i == 0 else cand_dir / name
+                if out.exists():            # same file name uploaded twice
+                    out = cand_dir / f"{Path(name).stem}_{i}{Path(name).suffix}"
+                with open(out, "wb") as f:
+                    if hasattr(fobj, "read"):
+                        f.write(fobj.read())
+                    else:
+                        f.write(fobj.getbuffer())
+                paths.append(out)
+            self.log.info("Bulk files saved", reference=str(paths[0]), candidates=len(paths) - 1,
+                          session=self.session_id)
+            return paths[0], paths[1:]
+        except Exception as e:
+            self.log.error("Error saving bulk comparison files", error=str(e), session=self.session_id)
+            raise DocumentPortalException("Error saving files", e) from e
+
     def read_pdf(self, pdf_path: Path) -> str:
         try:
+            import fitz     # PyMuPDF, deferred to first use (start-up time)
             with fitz.open(pdf_path) as doc:
                 if doc.is_encrypted:
                     raise ValueError(f"PDF is encrypted: {pdf_path.name}")
@@ -205,10 +321,11 @@ class ChatIngestor:
         faiss_base: str = "faiss_index",
         use_session_dirs: bool = True,
         session_id: Optional[str] = None,
+        model_loader: Optional[ModelLoader] = None,
     ):
         try:
             self.log = CustomLogger().get_logger(__name__)
-            self.model_loader = ModelLoader()
+            self.model_loader = model_loader or ModelLoader()
             
             self.use_session = use_session_dirs
             self.session_id = session_id or generate_session_id()
@@ -218,6 +335,8 @@ class ChatIngestor:
             
             self.temp_dir = self._resolve_dir(self.temp_base)
             self.faiss_dir = self._resolve_dir(self.faiss_base)
+            self.deduper = self._build_deduper()
+            self.summaries_cfg = self.model_loader.config.get("doc_summaries", {}) or {}
             
             self.log.info("ChatIngestor initialized",
                           session_id=self.session_id,
@@ -236,25 +355,58 @@ class ChatIngestor:
             return d
         return base
         
+    def _build_deduper(self) -> Optional[ChunkDeduplicator]:
+        return build_deduper(self.model_loader.config.get("chunk_dedup", {}))
+
     def _split(self, docs: List[Document], chunk_size=1000, chunk_overlap=200) -> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = splitter.split_documents(docs)
-        self.log.info("Documents split", chunks=len(chunks), chunk_size=chunk_size, overlap=chunk_overlap)
+        chunker = build_chunker(self.model_loader.config, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks = split_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap, chunker=chunker)
+        if chunker is None:
+            self.log.info("Documents split", chunks=len(chunks), chunk_size=chunk_size, overlap=chunk_overlap)
+        else:
+            self.log.info("Documents split", chunks=len(chunks), chunk_tokens=chunker.chunk_tokens,
+                          overlap_tokens=chunker.overlap_tokens, tokenizer=chunker.counter.name)
         return chunks
     
+    @staticmethod
+    def _tag_documents(docs: List[Document], names: Dict[str, str]):
+        """
+        Stamp each page with its document id (the uploaded file name, used by
+        replace/delete and source filters), file type and upload time.
+        """
+        uploaded_at = time.time()
+        for d in docs:
+            src = str(d.metadata.get("source", ""))
+            d.metadata["doc_id"] = names.get(src) or Path(src).name
+            d.metadata["file_type"] = Path(d.metadata["doc_id"]).suffix.lstrip(".").lower()
+            d.metadata["uploaded_at"] = uploaded_at
+
     def built_retriever( self,
         uploaded_files: Iterable,
         *,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
-        k: int = 5,):
+        k: int = 5,
+        replace: bool = False,):
+        """
+        Index uploaded files. With ``replace=True`` each file supersedes the
+        stored document of the same name: only changed chunks are embedded
+        and chunks that disappeared are removed.
+        """
         try:
-            paths = save_uploaded_files(uploaded_files, self.temp_dir)
+            names: Dict[str, str] = {}
+            paths = save_uploaded_files(uploaded_files, self.temp_dir, names=names)
             docs = load_documents(paths)
             if not docs:
                 raise ValueError("No valid documents loaded")
+            self._tag_documents(docs, names)
             
-            chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            if self.deduper is not None:
+                # drop headers/footers and repeated chunks before paying to embed them
+                chunks = self.deduper.process(
+                    docs, lambda pages: self._split(pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+            else:
+                chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
             fm = FaissManager(self.faiss_dir, self.model_loader)
             
             texts = [c.page_content for c in chunks]
@@ -265,11 +417,41 @@ class ChatIngestor:
             except Exception:
                 vs = fm.load_or_create(texts=texts, metadatas=metas)
                 
-            added = fm.add_documents(chunks)
-            self.log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
+            if replace:
+                # a chunk collapsed across files belongs to each of them
+                by_doc: Dict[str, List[Document]] = {}
+                for c in chunks:
+                    for doc_id in dict.fromkeys(doc_owners(c.metadata)):
+                        by_doc.setdefault(doc_id, []).append(
+                            Document(page_content=c.page_content, metadata=doc_view(c.metadata, doc_id)))
+                for doc_id, doc_chunks in by_doc.items():
+                    fm.replace_source(doc_id, doc_chunks)
+            else:
+                added = fm.add_documents(chunks)
+                self.log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
+
+            if self.summaries_cfg.get("enabled", False):
+                # per-document summaries for the query router; indexing does not wait for them
+                schedule_summaries(self.faiss_dir, docs, self.model_loader, self.summaries_cfg)
             
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            # a full reload during the commit leaves ``vs`` behind; serve the snapshot queries will see
+            store_cfg = self.model_loader.config.get("index_store", {}) or {}
+            shared = get_shared_index(self.faiss_dir, fm.emb, mmap=fm.mmap,
+                                      max_cached=int(store_cfg.get("max_cached_indexes", 32)))
+            return shared.current().as_retriever(search_type="similarity", search_kwargs={"k": k})
             
         except Exception as e:
             self.log.error("Failed to build retriever", error=str(e))
-            raise DocumentPortalException("Failed to build retriever", e) from e
\ No newline at end of file
+            raise DocumentPortalException("Failed to build retriever", e) from e
+
+    def delete_document(self, doc_id: str) -> int:
+        """Remove an uploaded file's chunks from the index; returns how many vectors were dropped."""
+        try:
+            fm = FaissManager(self.faiss_dir, self.model_loader)
+            fm.load_or_create()
+            removed = fm.delete_source(doc_id)
+            forget_summary(self.faiss_dir, doc_id)
+            return removed
+        except Exception as e:
+            self.log.error("Failed to delete document", error=str(e), doc_id=doc_id)
+            raise DocumentPortalException("Failed to delete document", e) from e
\ No newline at end of file
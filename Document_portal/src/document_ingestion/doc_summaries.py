@@ -0,0 +1,189 @@
+"""
+Per-document metadata and summaries, computed in the background after indexing.
+
+With ``doc_summaries.enabled`` ``ChatIngestor`` passes the pages it indexed
+to ``schedule_summaries``. A small shared pool runs ``DocumentAnalyzer`` on
+each new or changed document (the /analyze ``Metadata`` schema and
+long-document compression) at batch LLM priority, and stores the result in
+``doc_summaries.json`` next to the index::
+
+    {"lease.pdf": {"status": "ok", "sha256": ..., "pages": 12, "file_type": "pdf",
+                   "metadata": {"Summary": [...], "Title": ..., "Author": [...], ...},
+                   "computed_at": ..., "seconds": ...}}
+
+Entries are keyed by doc id and carry a hash of the document text, so
+re-uploading unchanged content costs nothing. Indexing never waits for
+them; ``src.document_chat.doc_router`` answers document-level questions
+from this file once the entries are there. ``forget_summary`` (document
+deleted) drops the entry and any result still being computed for it.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.index_store import _atomic_write_text, dir_lock
+
+SUMMARIES_FILE = "doc_summaries.json"
+
+stats = {"scheduled": 0, "unchanged": 0, "computed": 0, "failed": 0, "discarded": 0}
+
+
+class DocumentSummaryStore:
+    """``doc_summaries.json`` of one index directory; reads are cached until the file changes."""
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.path = self.index_dir / SUMMARIES_FILE
+        self._cache: Any = (None, {})
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return {}
+        key = (st.st_mtime_ns, st.st_size)
+        if self._cache[0] != key:
+            try:
+                self._cache = (key, json.loads(self.path.read_text(encoding="utf-8")))
+            except ValueError:          # replaced while reading; the next call sees the new file
+                return self._cache[1]
+        return self._cache[1]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self.all().get(doc_id)
+
+    def _update(self, change: Callable[[Dict[str, Any]], bool]) -> None:
+        # short read-modify-write under the index directory's write lock (other workers, the bulk CLI)
+        with dir_lock(self.index_dir):
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                data = {}
+            if change(data) is not False:
+                _atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+
+    def put(self, doc_id: str, entry: Dict[str, Any], current: Optional[Callable[[], bool]] = None) -> bool:
+        """Store ``entry``; with ``current``, only if it still returns True under the write lock."""
+        stored = []
+
+        def change(data):
+            if current is not None and not current():
+                return False
+            data[doc_id] = entry
+            stored.append(True)
+
+        self._update(change)
+        return bool(stored)
+
+    def remove(self, doc_id: str) -> None:
+        if self.path.exists():
+            self._update(lambda data: data.pop(doc_id, None) is not None)
+
+
+def document_text(pages: List[Document]) -> str:
+    """One document's pages in reading order, with the page markers /analyze uses."""
+    if len(pages) == 1 or any(p.metadata.get("page") is None for p in pages):
+        return "\n".join(p.page_content for p in pages)
+    pages = sorted(pages, key=lambda p: p.metadata["page"])
+    return "\n".join(f"\n--- Page {p.metadata['page'] + 1} ---\n{p.page_content}" for p in pages)
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_GUARD = threading.Lock()
+_PENDING: Dict[str, Dict[str, Future]] = {}          # index dir -> doc_id -> latest queued summary
+# bumped whenever a document is re-queued or deleted; a result is stored only if its generation is current
+_GENERATION: Dict[Tuple[str, str], int] = {}
+
+
+def _pool(workers: int) -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_GUARD:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="doc-summary")
+        return _POOL
+
+
+def _is_current(key: str, doc_id: str, generation: int) -> bool:
+    with _POOL_GUARD:
+        return _GENERATION.get((key, doc_id)) == generation
+
+
+def _summarize(store: DocumentSummaryStore, key: str, doc_id: str, generation: int, pages: List[Document],
+               sha: str, model_loader) -> None:
+    log = CustomLogger().get_logger(__name__)
+    started = time.perf_counter()
+    entry: Dict[str, Any] = {"sha256": sha, "pages": len(pages),
+                             "file_type": pages[0].metadata.get("file_type"), "computed_at": time.time()}
+    try:
+        from src.document_analyzer.data_analysis import DocumentAnalyzer
+        metadata = DocumentAnalyzer(model_loader=model_loader).analyze_document(document_text(pages))
+        entry.update(status="ok", metadata=metadata)
+        stats["computed"] += 1
+    except Exception as e:
+        entry.update(status="failed", error=str(e))
+        stats["failed"] += 1
+        log.error("Document summary failed", doc_id=doc_id, index=str(store.index_dir), error=str(e))
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    if not store.put(doc_id, entry, current=lambda: _is_current(key, doc_id, generation)):
+        stats["discarded"] += 1
+        log.info("Document summary discarded", doc_id=doc_id, index=str(store.index_dir),
+                 reason="document deleted or re-queued")
+    elif entry["status"] == "ok":
+        log.info("Document summary stored", doc_id=doc_id, index=str(store.index_dir), seconds=entry["seconds"])
+
+
+def schedule_summaries(index_dir: Path, pages: List[Document], model_loader,
+                       config: Optional[Dict[str, Any]] = None) -> List[Future]:
+    """
+    Queue a summary for every document (``doc_id``) in ``pages`` whose text
+    changed since its stored entry; returns at once.
+    """
+    cfg = config or {}
+    store = DocumentSummaryStore(index_dir)
+    by_doc: Dict[str, List[Document]] = {}
+    for p in pages:
+        by_doc.setdefault(p.metadata.get("doc_id") or str(p.metadata.get("source")), []).append(p)
+    pool = _pool(int(cfg.get("workers", 2)))
+    key = str(Path(index_dir).resolve())
+    futures = []
+    for doc_id, doc_pages in by_doc.items():
+        sha = hashlib.sha256("\f".join(p.page_content for p in doc_pages).encode("utf-8")).hexdigest()
+        current = store.get(doc_id)
+        if current and current.get("status") == "ok" and current.get("sha256") == sha:
+            stats["unchanged"] += 1
+            continue
+        stats["scheduled"] += 1
+        with _POOL_GUARD:
+            generation = _GENERATION[(key, doc_id)] = _GENERATION.get((key, doc_id), 0) + 1
+            future = pool.submit(_summarize, store, key, doc_id, generation, doc_pages, sha, model_loader)
+            pending = _PENDING.setdefault(key, {})
+            for stale in [d for d, f in pending.items() if f.done()]:
+                del pending[stale]
+            pending[doc_id] = future
+        futures.append(future)
+    return futures
+
+
+def forget_summary(index_dir: Path, doc_id: str) -> None:
+    """Drop ``doc_id``'s entry; a summary still queued or running for it is never stored."""
+    key = str(Path(index_dir).resolve())
+    with _POOL_GUARD:
+        _GENERATION[(key, doc_id)] = _GENERATION.get((key, doc_id), 0) + 1
+        future = _PENDING.get(key, {}).pop(doc_id, None)
+    if future is not None:
+        future.cancel()
+    DocumentSummaryStore(index_dir).remove(doc_id)
+
+
+def wait_for_summaries(index_dir: Path, timeout: Optional[float] = None) -> bool:
+    """Block until the summaries queued for ``index_dir`` are stored; False on timeout."""
+    with _POOL_GUARD:
+        futures = list(_PENDING.get(str(Path(index_dir).resolve()), {}).values())
+    return not wait(futures, timeout=timeout).not_done
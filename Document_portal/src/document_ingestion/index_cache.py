@@ -0,0 +1,159 @@
+"""
+Process-wide cache of loaded FAISS indexes with version-based hot reload.
+
+Every request that queries a session index goes through ``get_shared_index``
+instead of deserialising the directory again. ``SharedIndex.current()``
+compares the directory's ``VERSION`` marker with the loaded snapshot and
+moves forward without restarting the worker:
+
+* new segments on the same base are added to a copy of the small delta and
+  new ops (deletes, metadata rewrites) are applied on top,
+* a new base (after compaction) is re-mapped, which is cheap with ``mmap``.
+
+Snapshots are immutable once published, so in-flight searches keep using the
+one they started with.
+"""
+from __future__ import annotations
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.index_store import LayeredIndex, SegmentedIndexStore, same_lineage
+from src.document_ingestion.metadata_index import matches, metadata_index
+from src.document_chat.mmr import mmr_search
+
+
+class SharedIndex:
+    def __init__(self, index_dir: Path, embeddings, index_name: str = "index", mmap: bool = True):
+        self.log = CustomLogger().get_logger(__name__)
+        self.store = SegmentedIndexStore(Path(index_dir), index_name=index_name)
+        self.embeddings = embeddings
+        self.mmap = mmap
+        self.vs: Optional[FAISS] = None
+        self.manifest: Dict[str, Any] = {}
+        self.version: Optional[int] = None
+        self.stats = {"full_loads": 0, "incremental_swaps": 0}
+        self._lock = threading.Lock()
+
+    def current(self) -> FAISS:
+        """The latest committed snapshot; only touches disk beyond ``VERSION`` when it changed."""
+        version = self.store.read_version()
+        if self.vs is not None and version == self.version:
+            return self.vs
+        with self._lock:
+            if self.vs is None or version != self.version:
+                self._swap()
+            return self.vs
+
+    def _swap(self):
+        manifest = self.store.read_manifest()
+        if self.vs is not None and same_lineage(manifest, self.manifest):
+            loaded = set(self.manifest.get("segments", []))
+            applied = set(self.manifest.get("ops", []))
+            try:
+                new = [self.store.read_segment(n) for n in manifest.get("segments", []) if n not in loaded]
+                ops = [self.store.read_ops(n) for n in manifest.get("ops", []) if n not in applied]
+                vs = SegmentedIndexStore.extend(self.vs, new)
+                self.vs = SegmentedIndexStore.apply_ops(vs, ops) if ops else vs
+                self.manifest, self.version = manifest, manifest.get("version")
+                self.stats["incremental_swaps"] += 1
+                return
+            except FileNotFoundError:
+                pass  # compacted underneath us; fall back to a full load
+        self.vs, self.manifest = self.store.load_snapshot(self.embeddings, mmap=self.mmap)
+        self.version = self.manifest.get("version")
+        self.stats["full_loads"] += 1
+        self.log.info("Index snapshot loaded", index=str(self.store.index_dir), version=self.version,
+                      ntotal=self.vs.index.ntotal, mmap=self.mmap)
+
+
+class SharedIndexRetriever(BaseRetriever):
+    """
+    Retriever that resolves the newest snapshot of a ``SharedIndex`` on every
+    query. Plain top-k similarity searches go through ``scheduler`` (a
+    ``QueryScheduler``) when one is set, so concurrent queries share embedding
+    calls and index searches.
+
+    ``search_type="mmr"`` (``k``, ``fetch_k``, ``lambda_mult``) picks ``k``
+    diverse results among the ``fetch_k`` nearest using the stored vectors
+    (see ``src.document_chat.mmr``), batched the same way.
+
+    ``metadata_filter`` (see ``metadata_index``) is resolved to the allowed
+    positions first and the similarity or MMR search runs over those only;
+    other search types get it as a LangChain ``filter`` callable.
+    """
+    index: Any
+    search_type: str = "similarity"
+    search_kwargs: dict = {}
+    scheduler: Any = None
+    metadata_filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vs = self.index.current()
+        plain = self.search_type == "similarity" and set(self.search_kwargs) <= {"k"}
+        mmr = self.search_type == "mmr" and set(self.search_kwargs) <= {"k", "fetch_k", "lambda_mult"}
+        k = self.search_kwargs.get("k", 4)
+        diversity = {"fetch_k": int(self.search_kwargs.get("fetch_k", 20)),
+                     "lambda_mult": float(self.search_kwargs.get("lambda_mult", 0.5))} if mmr else {}
+        if self.metadata_filter and (plain or mmr):
+            subset = metadata_index(vs).select(self.metadata_filter)
+            if self.scheduler is not None:
+                return self.scheduler.search(vs, query, k=k, subset=subset, subset_key=self._filter_key(),
+                                             **diversity)
+            return self._search_subset(vs, query, k, subset, **diversity)
+        if (plain or mmr) and self.scheduler is not None:
+            return self.scheduler.search(vs, query, k=k, **diversity)
+        if mmr:
+            return self._search_subset(vs, query, k, None, **diversity)
+        search_kwargs = dict(self.search_kwargs)
+        if self.metadata_filter:
+            flt = self.metadata_filter
+            search_kwargs["filter"] = lambda md: matches(md, flt)
+        retriever = vs.as_retriever(search_type=self.search_type, search_kwargs=search_kwargs)
+        return retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+
+    def _filter_key(self) -> str:
+        return json.dumps(self.metadata_filter, sort_keys=True, default=str)
+
+    @staticmethod
+    def _search_subset(vs: FAISS, query: str, k: int, subset, fetch_k: Optional[int] = None,
+                       lambda_mult: float = 0.5) -> List[Document]:
+        x = np.asarray([vs.embedding_function.embed_query(query)], dtype=np.float32)
+        if vs._normalize_L2:
+            faiss.normalize_L2(x)
+        index = vs.index if isinstance(vs.index, LayeredIndex) else LayeredIndex(vs.index)
+        if fetch_k:
+            ids = mmr_search(index, x, k, fetch_k=fetch_k, lambda_mult=lambda_mult, subset=subset)[None, :]
+        else:
+            _, ids = index.search(x, k, subset=subset)
+        docs = [vs.docstore.search(vs.index_to_docstore_id[int(i)]) for i in ids[0] if i != -1]
+        return [d for d in docs if isinstance(d, Document)]
+
+
+_SHARED: "OrderedDict[Tuple[str, str], SharedIndex]" = OrderedDict()
+_SHARED_GUARD = threading.Lock()
+
+
+def get_shared_index(index_dir: Path, embeddings, index_name: str = "index", mmap: bool = True,
+                     max_cached: int = 32) -> SharedIndex:
+    """The process-wide ``SharedIndex`` for a directory; least recently used ones are dropped past ``max_cached``."""
+    key = (str(Path(index_dir).resolve()), index_name)
+    with _SHARED_GUARD:
+        shared = _SHARED.get(key)
+        if shared is None or shared.mmap != mmap:
+            shared = SharedIndex(Path(index_dir), embeddings, index_name=index_name, mmap=mmap)
+            _SHARED[key] = shared
+        _SHARED.move_to_end(key)
+        while len(_SHARED) > max(1, max_cached):
+            _SHARED.popitem(last=False)
+        return shared
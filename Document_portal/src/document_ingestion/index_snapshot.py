@@ -0,0 +1,411 @@
+"""
+Portable snapshots of a FAISS index directory: one compressed, checksummed file.
+
+    python -m src.document_ingestion.index_snapshot export faiss_index/<session> /backups/<session>.snapshot.tgz [--float16]
+    python -m src.document_ingestion.index_snapshot import /backups/<session>.snapshot.tgz faiss_index/<session> [--overwrite]
+
+Archive layout (a gzip-compressed tar stream, members in this order)::
+
+    SNAPSHOT.json          format, embedding backend/model, dim, metric, vector dtype, counts
+    manifest.json          the exported manifest (base, segments, ops)
+    <base>.faiss | .npy    base vectors: the flat index as stored, or float16 rows with --float16
+    <base>.pkl             base docstore + id map
+    segments/...           the manifest's segments (float16 rows with --float16) and ops files
+    fingerprints.bin       chunk fingerprints (ingested_meta.json for directories that predate it)
+    doc_summaries.json     per-document summaries, when computed
+    SHA256SUMS.json        sha256 of every member above
+
+Export reads one manifest and streams the files it references: they are
+immutable, so no lock is held and no compaction is forced; a compaction that
+deletes them mid-export restarts it. Taking a snapshot therefore costs one
+sequential read of the index plus compression.
+
+Import reads the archive front to back and writes each member straight into
+a staging directory next to the target, verifying checksums on the fly and
+widening float16 rows back to float32 (the base goes directly into a flat
+``.faiss`` file, so it can be memory-mapped on load). Nothing is staged in
+memory beyond one chunk, and the target is swapped in with a rename only
+after every checksum matched, under the directory's write lock so no commit
+lands in the directory being replaced. The restored manifest gets a new
+``restore_id``: readers, writers and fingerprint sets of the old directory
+then reload it in full, even when the snapshot shares its base.
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.doc_summaries import SUMMARIES_FILE
+from src.document_ingestion.index_store import (FINGERPRINT_FILE, LEGACY_META, MANIFEST_NAME, SEGMENT_DIR,
+                                                SegmentedIndexStore, _read_index_mmap, dir_lock)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SUFFIX = ".snapshot.tgz"
+HEADER_NAME = "SNAPSHOT.json"
+CHECKSUMS_NAME = "SHA256SUMS.json"
+CHUNK_BYTES = 4 << 20
+
+log = CustomLogger().get_logger(__name__)
+
+
+class _Reader:
+    """File-like view of an iterator of byte chunks that hashes everything read through it."""
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buf = bytearray()
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    @classmethod
+    def of_file(cls, f, size: Optional[int] = None) -> "_Reader":
+        def chunks():
+            left = size
+            while left is None or left > 0:
+                block = f.read(CHUNK_BYTES if left is None else min(CHUNK_BYTES, left))
+                if not block:
+                    return
+                if left is not None:
+                    left -= len(block)
+                yield block
+        return cls(chunks())
+
+    def read(self, n: int = -1) -> bytes:
+        while n < 0 or len(self._buf) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        n = len(self._buf) if n < 0 else min(n, len(self._buf))
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        self.sha.update(out)
+        self.size += len(out)
+        return out
+
+    def drain(self) -> str:
+        while self.read(CHUNK_BYTES):
+            pass
+        return self.sha.hexdigest()
+
+
+def _npy_header(dtype, shape: Tuple[int, ...]) -> bytes:
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buf, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape})
+    return buf.getvalue()
+
+
+def _read_npy_header(f) -> Tuple[Tuple[int, ...], np.dtype]:
+    version = np.lib.format.read_magic(f)
+    read = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortran, dtype = read(f)
+    if fortran:
+        raise ValueError("Fortran-ordered vectors are not supported in snapshots")
+    return shape, dtype
+
+
+def _flat_header(d: int, metric: int, ntotal: int) -> bytes:
+    """Bytes of a serialized ``IndexFlat`` up to its vectors, for ``ntotal`` rows of ``d`` floats."""
+    empty = faiss.serialize_index(faiss.IndexFlat(d, metric)).tobytes()
+    # fourcc, d (int32), ntotal (int64), ..., then the code vector's length in floats (uint64)
+    return empty[:8] + struct.pack("<q", ntotal) + empty[16:-8] + struct.pack("<Q", ntotal * d)
+
+
+def _row_chunks(rows: Iterable[np.ndarray], dtype) -> Iterator[bytes]:
+    for block in rows:
+        yield np.ascontiguousarray(block, dtype=dtype).tobytes()
+
+
+def _blocks(n: int, d: int, itemsize: int = 4) -> Iterator[Tuple[int, int]]:
+    step = max(1, CHUNK_BYTES // max(1, d * itemsize))
+    for i0 in range(0, n, step):
+        yield i0, min(step, n - i0)
+
+
+# ---------- Export ----------
+
+class _ArchiveWriter:
+    def __init__(self, fileobj, mtime: float):
+        self.tar = tarfile.open(fileobj=fileobj, mode="w|")
+        self.mtime = mtime
+        self.sums: Dict[str, str] = {}
+        self.bytes_in = 0
+
+    def add(self, name: str, size: int, reader: _Reader):
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, int(self.mtime), 0o644
+        self.tar.addfile(info, reader)
+        if reader.size != size:
+            raise FileNotFoundError(f"{name} changed size while being exported")
+        self.sums[name] = reader.sha.hexdigest()
+        self.bytes_in += size
+
+    def add_bytes(self, name: str, data: bytes):
+        self.add(name, len(data), _Reader([data]))
+
+    def add_file(self, name: str, path: Path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size     # append-only files may grow meanwhile: ship what is here now
+            self.add(name, size, _Reader.of_file(f, size))
+
+    def add_rows(self, name: str, shape: Tuple[int, int], rows: Iterable[np.ndarray], dtype):
+        header = _npy_header(dtype, shape)
+        size = len(header) + shape[0] * shape[1] * np.dtype(dtype).itemsize
+        self.add(name, size, _Reader(_chain(header, _row_chunks(rows, dtype))))
+
+    def close(self):
+        self.add_bytes(CHECKSUMS_NAME, json.dumps(self.sums, indent=1).encode("utf-8"))
+        self.tar.close()
+
+
+def _chain(first: bytes, rest: Iterator[bytes]) -> Iterator[bytes]:
+    yield first
+    yield from rest
+
+
+def _export_once(store: SegmentedIndexStore, path: Path, float16: bool, compress_level: int) -> Dict[str, Any]:
+    manifest = store.read_manifest()
+    index_dir = store.index_dir
+    base = manifest.get("base")
+    if base and not (index_dir / f"{base}.faiss").exists():
+        raise FileNotFoundError(str(index_dir / f"{base}.faiss"))
+    base_index = _read_index_mmap(index_dir / f"{base}.faiss") if base else None
+    dim = manifest.get("dim") or (base_index.d if base_index is not None else None)
+    if dim is None:
+        raise FileNotFoundError(f"No FAISS index found in {index_dir}")
+    # only flat bases can be re-encoded; anything else ships as stored
+    flat_base = base_index is not None and isinstance(base_index, faiss.IndexFlat)
+    segment_rows = {name: np.load(store.segment_dir / f"{name}.npy", mmap_mode="r").shape[0]
+                    for name in manifest.get("segments", [])}
+    header = {
+        "format": SNAPSHOT_FORMAT, "created_at": time.time(), "source": str(index_dir),
+        "embedding": manifest.get("embedding"), "dim": int(dim),
+        "metric": int(base_index.metric_type) if base_index is not None else faiss.METRIC_L2,
+        "vector_dtype": "float16" if float16 else "float32", "base": base,
+        "base_encoding": "npy" if float16 and flat_base else "faiss",
+        "version": manifest.get("version", 0),
+        "counts": {"base_vectors": int(base_index.ntotal) if base_index is not None else 0,
+                   "segment_vectors": int(sum(segment_rows.values())),
+                   "segments": len(segment_rows), "ops": len(manifest.get("ops", []))},
+    }
+    dtype = np.float16 if float16 else np.float32
+
+    tmp = path.with_name(f"{path.name}.tmp-{uuid.uuid4().hex[:8]}")
+    try:
+        with open(tmp, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=compress_level,
+                                                   mtime=int(header["created_at"])) as gz:
+            out = _ArchiveWriter(gz, header["created_at"])
+            out.add_bytes(HEADER_NAME, json.dumps(header, ensure_ascii=False, indent=1).encode("utf-8"))
+            out.add_bytes(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+            if base:
+                if header["base_encoding"] == "npy":
+                    n = base_index.ntotal
+                    out.add_rows(f"{base}.npy", (n, int(dim)),
+                                 (base_index.reconstruct_n(i0, k) for i0, k in _blocks(n, int(dim))), dtype)
+                else:
+                    out.add_file(f"{base}.faiss", index_dir / f"{base}.faiss")
+                out.add_file(f"{base}.pkl", index_dir / f"{base}.pkl")
+            for name, n in segment_rows.items():
+                npy = store.segment_dir / f"{name}.npy"
+                if float16:
+                    vectors = np.load(npy, mmap_mode="r")
+                    out.add_rows(f"{SEGMENT_DIR}/{name}.npy", (n, int(dim)),
+                                 (vectors[i0:i0 + k] for i0, k in _blocks(n, int(dim))), dtype)
+                else:
+                    out.add_file(f"{SEGMENT_DIR}/{name}.npy", npy)
+                out.add_file(f"{SEGMENT_DIR}/{name}.pkl", store.segment_dir / f"{name}.pkl")
+            for name in manifest.get("ops", []):
+                out.add_file(f"{SEGMENT_DIR}/{name}.pkl", store.segment_dir / f"{name}.pkl")
+            for name in (FINGERPRINT_FILE, LEGACY_META, SUMMARIES_FILE):
+                if (index_dir / name).exists():
+                    out.add_file(name, index_dir / name)
+            out.close()
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    header["bytes_in"] = out.bytes_in
+    return header
+
+
+def export_snapshot(index_dir: Path, path: Path, float16: bool = False, compress_level: int = 1,
+                    index_name: str = "index") -> Dict[str, Any]:
+    """
+    Write the current snapshot of ``index_dir`` to the archive ``path``
+    (replaced atomically) and return its header plus ``bytes``/``seconds``.
+    ``float16`` halves vector storage; similarity scores move by ~1e-3.
+    """
+    store = SegmentedIndexStore(Path(index_dir), index_name)
+    if not store.exists():
+        raise FileNotFoundError(f"No FAISS index found in {index_dir}")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    for attempt in range(3):
+        try:
+            header = _export_once(store, path, float16, compress_level)
+            break
+        except FileNotFoundError:
+            # a compaction published a new base and removed the files we were reading
+            if attempt == 2 or not store.exists():
+                raise
+            time.sleep(0.05)
+    header.update(bytes=path.stat().st_size, seconds=round(time.perf_counter() - started, 3))
+    log.info("Index snapshot exported", index=str(index_dir), path=str(path), dtype=header["vector_dtype"],
+             bytes=header["bytes"], bytes_in=header["bytes_in"], seconds=header["seconds"], **header["counts"])
+    return header
+
+
+# ---------- Import ----------
+
+def _member_path(root: Path, name: str) -> Path:
+    parts = Path(name).parts
+    if not parts or Path(name).is_absolute() or ".." in parts or len(parts) > 2 \
+            or (len(parts) == 2 and parts[0] != SEGMENT_DIR):
+        raise ValueError(f"Unexpected member in index snapshot: {name!r}")
+    return root.joinpath(*parts)
+
+
+def _write_chunks(dst: Path, chunks: Iterable[bytes]):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with open(dst, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _widen_rows(src: _Reader, n: int, d: int, dtype) -> Iterator[bytes]:
+    for _, k in _blocks(n, d, dtype.itemsize):
+        data = src.read(k * d * dtype.itemsize)
+        if len(data) != k * d * dtype.itemsize:
+            raise ValueError("Index snapshot is truncated")
+        yield np.frombuffer(data, dtype=dtype).astype(np.float32).tobytes()
+
+
+def _restore_rows(src: _Reader, dst: Path, header: Dict[str, Any], as_faiss: bool):
+    shape, dtype = _read_npy_header(src)
+    n, d = (shape[0], shape[1]) if len(shape) == 2 else (0, header["dim"])
+    prefix = _flat_header(d, header["metric"], n) if as_faiss else _npy_header(np.float32, (n, d))
+    _write_chunks(dst, _chain(prefix, _widen_rows(src, n, d, dtype)))
+
+
+def _swap_in(staging: Path, index_dir: Path):
+    if not index_dir.exists():
+        os.replace(staging, index_dir)
+        return
+    old = index_dir.with_name(f".{index_dir.name}.old-{uuid.uuid4().hex[:8]}")
+    os.replace(index_dir, old)
+    os.replace(staging, index_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def import_snapshot(path: Path, index_dir: Path, overwrite: bool = False,
+                    embedding: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Restore the archive ``path`` into ``index_dir`` and return its header.
+    An existing index there is only replaced with ``overwrite``; a snapshot
+    built with a different ``embedding`` ({backend, model}) is refused.
+    """
+    index_dir = Path(index_dir)
+    target = SegmentedIndexStore(index_dir)
+    if target.exists() and not overwrite:
+        raise FileExistsError(f"{index_dir} already holds an index; pass overwrite=True to replace it")
+    started = time.perf_counter()
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    staging = index_dir.with_name(f".{index_dir.name}.restore-{uuid.uuid4().hex[:8]}")
+    staging.mkdir()
+    try:
+        header: Optional[Dict[str, Any]] = None
+        manifest: Optional[Dict[str, Any]] = None
+        expected: Optional[Dict[str, str]] = None
+        sums: Dict[str, str] = {}
+        with gzip.open(path, "rb") as gz, tarfile.open(fileobj=gz, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    raise ValueError(f"Unexpected member in index snapshot: {member.name!r}")
+                src = _Reader.of_file(tar.extractfile(member))
+                name = member.name
+                if name == CHECKSUMS_NAME:
+                    expected = json.loads(src.read())
+                    continue
+                if header is None:
+                    if name != HEADER_NAME:
+                        raise ValueError(f"{path} is not an index snapshot")
+                    header = json.loads(src.read())
+                    if header.get("format") != SNAPSHOT_FORMAT:
+                        raise ValueError(f"Unsupported index snapshot format: {header.get('format')}")
+                    if embedding and header.get("embedding") and header["embedding"] != embedding:
+                        raise ValueError(f"Snapshot was built with {header['embedding']}, not {embedding}")
+                elif name == MANIFEST_NAME:
+                    manifest = json.loads(src.read())
+                elif name.endswith(".npy") and header["vector_dtype"] != "float32":
+                    as_faiss = name == f"{header['base']}.npy"
+                    dst = _member_path(staging, f"{header['base']}.faiss" if as_faiss else name)
+                    _restore_rows(src, dst, header, as_faiss)
+                else:
+                    _write_chunks(_member_path(staging, name), iter(lambda: src.read(CHUNK_BYTES), b""))
+                sums[name] = src.drain()
+        if header is None or manifest is None or expected is None:
+            raise ValueError(f"Index snapshot {path} is truncated")
+        bad = sorted(n for n in set(sums) | set(expected) if sums.get(n) != expected.get(n))
+        if bad:
+            raise ValueError(f"Index snapshot {path} failed checksum verification: {bad[:5]}")
+
+        manifest.setdefault("dim", header["dim"])
+        manifest["restore_id"] = uuid.uuid4().hex
+        with dir_lock(index_dir):
+            if target.exists():
+                if not overwrite:
+                    raise FileExistsError(f"{index_dir} already holds an index; pass overwrite=True to replace it")
+                # readers of the old directory poll VERSION: never let it go backwards
+                manifest["version"] = max(int(manifest.get("version", 0)), int(target.read_version() or 0)) + 1
+            SegmentedIndexStore(staging).write_manifest(manifest)
+            _swap_in(staging, index_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    log.info("Index snapshot imported", path=str(path), index=str(index_dir), dtype=header["vector_dtype"],
+             seconds=round(time.perf_counter() - started, 3), **header["counts"])
+    return header
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.document_ingestion.index_snapshot",
+                                     description="Export or import a portable FAISS index snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write INDEX_DIR to ARCHIVE")
+    exp.add_argument("index_dir", type=Path)
+    exp.add_argument("archive", type=Path)
+    exp.add_argument("--float16", action="store_true", help="store vectors as float16 (half the size)")
+    exp.add_argument("--compress-level", type=int, default=1, help="gzip level 1-9")
+    imp = sub.add_parser("import", help="restore ARCHIVE into INDEX_DIR")
+    imp.add_argument("archive", type=Path)
+    imp.add_argument("index_dir", type=Path)
+    imp.add_argument("--overwrite", action="store_true", help="replace an existing index")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        header = export_snapshot(args.index_dir, args.archive, float16=args.float16,
+                                 compress_level=args.compress_level)
+    else:
+        header = import_snapshot(args.archive, args.index_dir, overwrite=args.overwrite)
+    print(json.dumps(header, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,867 @@
+"""
+Append-only, segmented persistence for FAISS indexes.
+
+Layout of an index directory::
+
+    manifest.json          current snapshot: base index name + ordered lists of segments and
+                           ops, vector dim, the embedding backend/model that built it and,
+                           after a snapshot import, its ``restore_id``
+    VERSION                manifest version, rewritten with every manifest swap
+    <base>.faiss/.pkl      compacted base, LangChain ``save_local`` format (legacy ``index`` is valid)
+    segments/seg_N.npy     float32 vectors appended by one commit (immutable)
+    segments/seg_N.pkl     docstore ids + Documents for those vectors (immutable)
+    segments/ops_N.pkl     docstore ids deleted and metadata rewritten by one commit (immutable)
+    fingerprints.bin       append-only 64-bit digests of every ingested chunk
+    .write.lock            OS file lock held by whichever process is committing
+
+A commit writes only its own segment and then swaps ``manifest.json`` with
+``os.replace``, so its cost is proportional to the batch, not to the index.
+Compaction folds segments back into a new base in the background.
+
+Deletes never rewrite vectors in place: an ops file tombstones docstore ids,
+readers mask those positions out of every search (``LayeredIndex.deleted``)
+and the next compaction drops them from the new base for good.
+
+With ``mmap=True`` the base vectors are memory-mapped read-only, so every
+worker process serving the same directory shares one page-cache copy; the
+segments on top live in a small private delta index (see ``LayeredIndex``).
+Readers poll ``VERSION`` to notice new commits without parsing the manifest.
+They apply only the new segments/ops while ``same_lineage`` holds, and
+reload everything after a compaction or a snapshot import.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from logger.custom_logger import CustomLogger
+from utils.model_loader import describe_embeddings
+
+MANIFEST_NAME = "manifest.json"
+VERSION_FILE = "VERSION"
+SEGMENT_DIR = "segments"
+FINGERPRINT_FILE = "fingerprints.bin"
+LEGACY_META = "ingested_meta.json"
+
+LOCK_FILE = ".write.lock"
+
+try:                                    # POSIX
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:                     # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class IndexDirLock:
+    """
+    Exclusive write lock for one index directory: a re-entrant thread lock
+    for writers in this process plus an OS file lock on ``.write.lock`` for
+    writers in other processes (uvicorn/gunicorn workers, the bulk CLI).
+    """
+    def __init__(self, index_dir: Path):
+        self.path = Path(index_dir) / LOCK_FILE
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fh = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                while True:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    self._fh = open(self.path, "a+b")
+                    _lock_file(self._fh)
+                    if self._current():
+                        break
+                    # the directory was replaced (snapshot import) while we waited: lock the new one
+                    _unlock_file(self._fh)
+                    self._fh.close()
+                    self._fh = None
+            except BaseException:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def _current(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._fh.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fh is not None:
+            try:
+                _unlock_file(self._fh)
+            finally:
+                self._fh.close()
+                self._fh = None
+        self._rlock.release()
+        return False
+
+
+# One lock object per index directory, shared by every store/writer in the process.
+_DIR_LOCKS: Dict[str, IndexDirLock] = {}
+_DIR_LOCKS_GUARD = threading.Lock()
+_COMPACTING: set = set()
+
+
+def dir_lock(index_dir: Path) -> IndexDirLock:
+    key = str(Path(index_dir).resolve())
+    with _DIR_LOCKS_GUARD:
+        if key not in _DIR_LOCKS:
+            _DIR_LOCKS[key] = IndexDirLock(Path(index_dir))
+        return _DIR_LOCKS[key]
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _atomic_write_text(path: Path, text: str):
+    _atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def _unlink_quiet(path: Path):
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:                     # still mapped by another process (Windows)
+        pass
+
+
+def same_lineage(manifest: Dict[str, Any], prev: Dict[str, Any]) -> bool:
+    """
+    True if ``manifest`` only adds segments/ops to what ``prev`` described:
+    same base and no snapshot import in between (a restored older snapshot
+    can share the base but drop segments), so readers may apply just the new ones.
+    """
+    return manifest.get("base") == prev.get("base") and manifest.get("restore_id") == prev.get("restore_id")
+
+
+def chunk_hash(text: str) -> str:
+    """Content identity of a chunk, stored as ``metadata["chunk_hash"]`` and diffed on replace."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+# Per-occurrence keys: a collapsed chunk carries its first occurrence at the top
+# level and the others in ``also_in`` (see chunk_dedup), each naming its doc_id.
+_WHERE_KEYS = ("doc_id", "source", "page", "start_index")
+
+
+def _occurrences(md: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{k: md[k] for k in _WHERE_KEYS if k in md}] + list(md.get("also_in") or [])
+
+
+def _with_occurrences(md: Dict[str, Any], occurrences: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out = {k: v for k, v in md.items() if k not in _WHERE_KEYS and k != "also_in"}
+    out.update(occurrences[0])
+    if occurrences[1:]:
+        out["also_in"] = occurrences[1:]
+    return out
+
+
+def doc_owners(md: Dict[str, Any]) -> List[str]:
+    """Every doc_id a stored chunk stands for."""
+    return [o["doc_id"] for o in _occurrences(md) if o.get("doc_id") is not None]
+
+
+def doc_view(md: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+    """Metadata of a (possibly collapsed) chunk restricted to ``doc_id``'s occurrences."""
+    return _with_occurrences(md, [o for o in _occurrences(md) if o.get("doc_id") == doc_id] or [{"doc_id": doc_id}])
+
+
+def without_doc(md: Dict[str, Any], doc_id: str) -> Optional[Dict[str, Any]]:
+    """Metadata with ``doc_id``'s occurrences dropped, or None if no other document still uses the chunk."""
+    others = [o for o in _occurrences(md) if o.get("doc_id") != doc_id]
+    return _with_occurrences(md, others) if others else None
+
+
+def retarget_doc(md: Dict[str, Any], doc_id: str, new_md: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace ``doc_id``'s occurrences of a kept chunk with those from its new version (pages may have moved)."""
+    others = [o for o in _occurrences(md) if o.get("doc_id") != doc_id]
+    if md.get("doc_id") == doc_id:
+        return _with_occurrences(new_md, _occurrences(new_md) + others)
+    return _with_occurrences(md, others + _occurrences(new_md))
+
+
+class FingerprintSet:
+    """
+    Compact set of ingested-chunk fingerprints.
+
+    Each key is stored as an 8-byte blake2b digest appended to a flat file.
+    In memory the digests live in a sorted ``uint64`` array (binary search)
+    plus a small Python set for recent additions that is merged periodically.
+    Removing keys (deleted documents) rewrites the file without them; other
+    processes notice the new file on ``refresh`` and reload it.
+    """
+    MERGE_THRESHOLD = 65536
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._load()
+
+    def _load(self):
+        self._sorted = np.empty(0, dtype="<u8")
+        self._recent: set = set()
+        self._offset = 0
+        self._inode = None
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                raw = f.read()
+                self._inode = os.fstat(f.fileno()).st_ino
+            usable = len(raw) - len(raw) % 8            # drop a torn trailing write
+            self._sorted = np.unique(np.frombuffer(raw[:usable], dtype="<u8"))
+            self._offset = usable
+
+    def refresh(self) -> int:
+        """Pick up digests appended by other processes since the last read/write."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            if self._inode is not None:                 # replaced by a snapshot without fingerprints
+                self._load()
+            return 0
+        if st.st_ino != self._inode or st.st_size < self._offset:     # rewritten by remove_many
+            self._load()
+            return len(self)
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            raw = f.read()
+        usable = len(raw) - len(raw) % 8
+        if usable:
+            self._recent.update(int(h) for h in np.frombuffer(raw[:usable], dtype="<u8"))
+            self._offset += usable
+        return usable // 8
+
+    @staticmethod
+    def digest(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _has(self, h: int) -> bool:
+        if h in self._recent:
+            return True
+        i = int(np.searchsorted(self._sorted, np.uint64(h)))
+        return i < self._sorted.size and int(self._sorted[i]) == h
+
+    def __contains__(self, key: str) -> bool:
+        return self._has(self.digest(key))
+
+    def __len__(self) -> int:
+        return int(self._sorted.size) + len(self._recent)
+
+    def add_many(self, keys: Iterable[str]) -> int:
+        new = []
+        for key in keys:
+            h = self.digest(key)
+            if not self._has(h):
+                self._recent.add(h)
+                new.append(h)
+        if new:
+            data = np.asarray(new, dtype="<u8").tobytes()
+            with open(self.path, "ab") as f:
+                # cut a torn trailing write first, or every digest after it would be misaligned
+                # (callers append under the directory's write lock)
+                size = f.seek(0, os.SEEK_END)
+                if size % 8:
+                    f.truncate(size - size % 8)
+                f.write(data)
+                self._inode = os.fstat(f.fileno()).st_ino
+            self._offset += len(data)
+        if len(self._recent) >= self.MERGE_THRESHOLD:
+            self._sorted = np.union1d(self._sorted, np.fromiter(self._recent, dtype="<u8"))
+            self._recent.clear()
+        return len(new)
+
+    def remove_many(self, keys: Iterable[str]) -> int:
+        """Forget ``keys`` so their chunks can be ingested again; call under the directory's write lock."""
+        self.refresh()
+        gone = {h for h in map(self.digest, keys) if self._has(h)}
+        if not gone:
+            return 0
+        merged = np.union1d(self._sorted, np.fromiter(self._recent, dtype="<u8", count=len(self._recent)))
+        self._sorted = merged[~np.isin(merged, np.fromiter(gone, dtype="<u8", count=len(gone)))]
+        self._recent.clear()
+        _atomic_write_bytes(self.path, self._sorted.tobytes())
+        self._offset = self._sorted.nbytes
+        self._inode = self.path.stat().st_ino
+        return len(gone)
+
+    def migrate_legacy(self, legacy_path: Path):
+        """Import keys from the old ``ingested_meta.json`` ({"rows": {key: true}}) once."""
+        if self.path.exists() or not legacy_path.exists():
+            return
+        try:
+            rows = (json.loads(legacy_path.read_text(encoding="utf-8")) or {}).get("rows", {})
+        except Exception:
+            rows = {}
+        self.add_many(rows.keys())
+        self.path.touch()
+
+
+class LayeredIndex:
+    """
+    A read-only (typically memory-mapped) base index with a private in-memory
+    delta on top, presented to LangChain's FAISS as one flat index. Ids
+    ``[0, base.ntotal)`` live in the base, the rest in the delta; ``add``
+    only ever touches the delta.
+
+    ``deleted`` positions (tombstoned by ops files) are excluded from every
+    search with an ``IDSelector``; ``ntotal`` still counts them because the
+    docstore id map is positional. Compaction removes them physically.
+    """
+    SUBSET_SCAN_MAX = 16384             # larger filtered subsets use an IDSelector scan instead of gathering vectors
+
+    def __init__(self, base, delta=None, deleted: Optional[np.ndarray] = None):
+        self.base = base
+        self.delta = delta if delta is not None else faiss.IndexFlat(base.d, base.metric_type)
+        self.d = base.d
+        self.metric_type = base.metric_type
+        self.is_trained = True
+        self.deleted = np.unique(np.asarray(deleted if deleted is not None else [], dtype=np.int64))
+        self._params = {}
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + self.delta.ntotal
+
+    @property
+    def n_live(self) -> int:
+        return self.ntotal - int(self.deleted.size)
+
+    def copy(self) -> "LayeredIndex":
+        """Same base, cloned delta: the original stays safe for concurrent readers."""
+        return LayeredIndex(self.base, faiss.clone_index(self.delta), self.deleted)
+
+    def with_deleted(self, positions: Iterable[int]) -> "LayeredIndex":
+        """Same base and delta with more positions masked out."""
+        return LayeredIndex(self.base, self.delta, np.concatenate([self.deleted, np.fromiter(positions, np.int64)]))
+
+    def _search_params(self, part: str):
+        """``SearchParameters`` excluding this part's deleted positions (part-local ids), or None."""
+        if part not in self._params:
+            n_base = self.base.ntotal
+            local = self.deleted[self.deleted < n_base] if part == "base" else self.deleted[self.deleted >= n_base] - n_base
+            params = None
+            if local.size:
+                batch = faiss.IDSelectorBatch(local)
+                params = faiss.SearchParameters()
+                params.sel = faiss.IDSelectorNot(batch)
+                params._refs = (batch, params.sel)       # SWIG does not keep the selectors alive
+            self._params[part] = params
+        return self._params[part]
+
+    def _search_part(self, part: str, x: np.ndarray, k: int):
+        index = self.base if part == "base" else self.delta
+        params = self._search_params(part)
+        return index.search(x, k, params=params) if params is not None else index.search(x, k)
+
+    def add(self, x: np.ndarray):
+        self.delta.add(x)
+
+    def search(self, x: np.ndarray, k: int, subset: Optional[np.ndarray] = None):
+        """
+        Top-``k`` over all live positions, or only over ``subset`` (sorted
+        positions, e.g. from a metadata filter). Small subsets are scored
+        directly; larger ones restrict the flat scans with an ``IDSelector``.
+        """
+        if subset is not None:
+            return self._search_subset(x, k, subset)
+        if not self.delta.ntotal:
+            return self._search_part("base", x, k)
+        d_delta, i_delta = self._search_part("delta", x, k)
+        i_delta = np.where(i_delta >= 0, i_delta + self.base.ntotal, -1)
+        if not self.base.ntotal:
+            return d_delta, i_delta
+        return self._merge(k, self._search_part("base", x, k), (d_delta, i_delta))
+
+    def _search_subset(self, x: np.ndarray, k: int, subset: np.ndarray):
+        subset = np.setdiff1d(np.asarray(subset, dtype=np.int64), self.deleted)
+        subset = subset[(subset >= 0) & (subset < self.ntotal)]
+        if subset.size <= self.SUBSET_SCAN_MAX:
+            dist = np.full((x.shape[0], k), np.inf if self.metric_type == faiss.METRIC_L2 else -np.inf, np.float32)
+            ids = np.full((x.shape[0], k), -1, dtype=np.int64)
+            if subset.size:
+                n = min(k, int(subset.size))
+                d, i = faiss.knn(np.ascontiguousarray(x, dtype=np.float32), self.reconstruct_batch(subset), n,
+                                 metric=self.metric_type)
+                dist[:, :n], ids[:, :n] = d, np.where(i >= 0, subset[np.maximum(i, 0)], -1)
+            return dist, ids
+        n_base = self.base.ntotal
+        parts = []
+        for index, local, offset in ((self.base, subset[subset < n_base], 0),
+                                     (self.delta, subset[subset >= n_base] - n_base, n_base)):
+            if not local.size:
+                continue
+            selector = faiss.IDSelectorBatch(local)
+            params = faiss.SearchParameters()
+            params.sel = selector
+            d, i = index.search(x, k, params=params)
+            parts.append((d, np.where(i >= 0, i + offset, -1)))
+        return parts[0] if len(parts) == 1 else self._merge(k, *parts)
+
+    def _merge(self, k: int, base_result, delta_result):
+        """Merge two top-k results whose ids are already global positions."""
+        d_base, i_base = base_result
+        d_delta, i_delta = delta_result
+        dist = np.hstack([d_base, d_delta])
+        ids = np.hstack([i_base, i_delta])
+        # L2: smaller is closer; inner product: larger is closer
+        order = np.argsort(dist if self.metric_type == faiss.METRIC_L2 else -dist, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        i = int(i)
+        return self.base.reconstruct(i) if i < self.base.ntotal else self.delta.reconstruct(i - self.base.ntotal)
+
+    def reconstruct_batch(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        out = np.empty((positions.size, self.d), dtype=np.float32)
+        in_base = positions < self.base.ntotal
+        if in_base.any():
+            out[in_base] = self.base.reconstruct_batch(positions[in_base])
+        if (~in_base).any():
+            out[~in_base] = self.delta.reconstruct_batch(positions[~in_base] - self.base.ntotal)
+        return out
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        n_base = self.base.ntotal
+        parts = []
+        if i0 < n_base and n:
+            take = min(n, n_base - i0)
+            parts.append(self.base.reconstruct_n(i0, take))
+            i0, n = i0 + take, n - take
+        if n:
+            parts.append(self.delta.reconstruct_n(i0 - n_base, n))
+        return np.vstack(parts) if parts else np.empty((0, self.d), np.float32)
+
+    def remove_ids(self, ids) -> int:
+        """
+        Drop positions for good, shifting later ones down like
+        ``faiss.Index.remove_ids`` (LangChain's ``FAISS.delete`` renumbers
+        ``index_to_docstore_id`` to match). A base that loses rows is replaced
+        by a private copy, so other snapshots mapping it are unaffected; the
+        delta changes in place. Committed stores delete through ops commits.
+        """
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[(ids >= 0) & (ids < self.ntotal)]
+        if not ids.size:
+            return 0
+        n_base = self.base.ntotal
+        in_base = ids[ids < n_base]
+        if in_base.size:
+            keep = np.setdiff1d(np.arange(n_base, dtype=np.int64), in_base)
+            base = faiss.IndexFlat(self.d, self.metric_type)
+            if keep.size:
+                base.add(self.base.reconstruct_batch(keep))
+            self.base = base
+        in_delta = ids[ids >= n_base] - n_base
+        if in_delta.size:
+            self.delta.remove_ids(in_delta)
+        still_deleted = np.setdiff1d(self.deleted, ids)
+        self.deleted = still_deleted - np.searchsorted(ids, still_deleted)
+        self._params = {}
+        return int(ids.size)
+
+
+def _read_index_mmap(path: Path):
+    """Memory-map a FAISS index read-only, falling back to a private copy for types that cannot be mapped."""
+    try:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(str(path))
+
+
+class SegmentedIndexStore:
+    """Reads and writes the segmented layout described in the module docstring."""
+
+    def __init__(self, index_dir: Path, index_name: str = "index"):
+        self.log = CustomLogger().get_logger(__name__)
+        self.index_dir = Path(index_dir)
+        self.index_name = index_name
+        self.manifest_path = self.index_dir / MANIFEST_NAME
+        self.segment_dir = self.index_dir / SEGMENT_DIR
+        self.lock = dir_lock(self.index_dir)
+
+    # ---------- Manifest ----------
+
+    def _legacy_exists(self) -> bool:
+        return (self.index_dir / f"{self.index_name}.faiss").exists() and \
+               (self.index_dir / f"{self.index_name}.pkl").exists()
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists() or self._legacy_exists()
+
+    def read_manifest(self) -> Dict[str, Any]:
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        # Directory written by plain save_local(): treat it as a base with no segments.
+        base = self.index_name if self._legacy_exists() else None
+        return {"format": 1, "version": 0, "dim": None, "base": base, "segments": [], "next_segment": 1}
+
+    def write_manifest(self, manifest: Dict[str, Any]):
+        manifest["updated_at"] = time.time()
+        _atomic_write_text(self.manifest_path, json.dumps(manifest, ensure_ascii=False))
+        _atomic_write_text(self.index_dir / VERSION_FILE, str(manifest["version"]))
+
+    def read_version(self) -> int:
+        """Cheap change check: the version of the last published manifest."""
+        try:
+            return int((self.index_dir / VERSION_FILE).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            # directories written before VERSION existed (or by plain save_local)
+            return self.read_manifest().get("version")
+
+    # ---------- Load ----------
+
+    @staticmethod
+    def _empty_vs(embeddings, dim: int) -> FAISS:
+        return FAISS(embedding_function=embeddings, index=LayeredIndex(faiss.IndexFlatL2(dim)),
+                     docstore=InMemoryDocstore(), index_to_docstore_id={})
+
+    @staticmethod
+    def append_to_vs(vs: FAISS, vectors: np.ndarray, ids: Sequence[str], docs: Sequence[Document]):
+        """Add pre-computed vectors to an in-memory store without re-embedding."""
+        start = vs.index.ntotal
+        vs.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        vs.docstore.add(dict(zip(ids, docs)))
+        vs.index_to_docstore_id.update({start + i: _id for i, _id in enumerate(ids)})
+
+    def read_segment(self, name: str):
+        vectors = np.load(self.segment_dir / f"{name}.npy")
+        return (vectors, *self.read_segment_docs(name))
+
+    def read_segment_docs(self, name: str) -> Tuple[List[str], List[Document]]:
+        with open(self.segment_dir / f"{name}.pkl", "rb") as f:
+            return pickle.load(f)
+
+    def read_ops(self, name: str) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+        """(deleted docstore ids, {docstore id: new metadata}) recorded by one commit."""
+        with open(self.segment_dir / f"{name}.pkl", "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def apply_ops(vs: FAISS, ops: Iterable[Tuple[Sequence[str], Dict[str, Dict[str, Any]]]]) -> FAISS:
+        """
+        Apply ops files to a loaded store. Tombstoned ids are masked out of a
+        new ``LayeredIndex``; their Documents are left out of, and rewritten
+        metadata goes into, a new docstore. ``extend`` shares the docstore and
+        metadata index with the previous snapshot, so neither is changed in
+        place: readers of that snapshot keep seeing it as it was.
+        Compaction drops the tombstoned vectors.
+        """
+        deleted: set = set()
+        rewrites: Dict[str, Dict[str, Any]] = {}
+        for ids, metadata in ops:
+            deleted.update(ids)
+            rewrites.update(metadata)
+        if not deleted and not rewrites:
+            return vs
+        docs = {_id: doc for _id, doc in vs.docstore._dict.items() if _id not in deleted}
+        for _id, md in rewrites.items():
+            doc = docs.get(_id)
+            if isinstance(doc, Document):
+                docs[_id] = Document(page_content=doc.page_content, metadata=md)
+        vs.docstore = InMemoryDocstore(docs)
+        if getattr(vs, "metadata_index", None) is not None:
+            vs.metadata_index = None                    # it reads the old docstore; rebuilt on next use
+        if deleted:
+            index = vs.index if isinstance(vs.index, LayeredIndex) else LayeredIndex(vs.index)
+            vs.index = index.with_deleted(pos for pos, _id in vs.index_to_docstore_id.items() if _id in deleted)
+        return vs
+
+    @staticmethod
+    def extend(vs: FAISS, segments: Iterable[Tuple[np.ndarray, Sequence[str], Sequence[Document]]]) -> FAISS:
+        """
+        Copy-on-write ``append_to_vs``: return a new store with the segments
+        added, leaving ``vs`` untouched for readers still searching it. The
+        docstore and id map only gain keys, so both stores share them.
+        """
+        index = vs.index.copy() if isinstance(vs.index, LayeredIndex) else faiss.clone_index(vs.index)
+        new_vs = FAISS(embedding_function=vs.embedding_function, index=index, docstore=vs.docstore,
+                       index_to_docstore_id=vs.index_to_docstore_id, normalize_L2=vs._normalize_L2,
+                       distance_strategy=vs.distance_strategy)
+        if getattr(vs, "metadata_index", None) is not None:
+            new_vs.metadata_index = vs.metadata_index     # built over the same docstore/id map
+        for vectors, ids, docs in segments:
+            SegmentedIndexStore.append_to_vs(new_vs, vectors, ids, docs)
+        return new_vs
+
+    def load_snapshot(self, embeddings, mmap: bool = False) -> Tuple[FAISS, Dict[str, Any]]:
+        """Like ``load`` but also return the manifest the store was built from."""
+        for attempt in range(3):
+            manifest = self.read_manifest()
+            if attempt == 0 and not self.check_embedding(describe_embeddings(embeddings), manifest):
+                self.log.warning("Index was built with a different embedding model", index=str(self.index_dir),
+                                 recorded=manifest.get("embedding"), current=describe_embeddings(embeddings))
+            try:
+                return self._load_once(embeddings, manifest, mmap=mmap), manifest
+            except FileNotFoundError:
+                if attempt == 2 or not self.exists():
+                    raise
+                time.sleep(0.05)
+        raise FileNotFoundError(str(self.index_dir))
+
+    def _load_base(self, embeddings, base: str, mmap: bool) -> FAISS:
+        path = self.index_dir / f"{base}.faiss"
+        index = _read_index_mmap(path) if mmap else faiss.read_index(str(path))
+        with open(self.index_dir / f"{base}.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embedding_function=embeddings, index=LayeredIndex(index), docstore=docstore,
+                     index_to_docstore_id=index_to_docstore_id)
+
+    def _load_once(self, embeddings, manifest: Optional[Dict[str, Any]] = None, mmap: bool = False) -> FAISS:
+        manifest = manifest or self.read_manifest()
+        if manifest.get("base"):
+            vs = self._load_base(embeddings, manifest["base"], mmap)
+        elif manifest.get("dim"):
+            vs = self._empty_vs(embeddings, int(manifest["dim"]))
+        else:
+            raise FileNotFoundError(f"No FAISS index found in {self.index_dir}")
+        for name in manifest.get("segments", []):
+            self.append_to_vs(vs, *self.read_segment(name))
+        if manifest.get("ops"):
+            self.apply_ops(vs, [self.read_ops(name) for name in manifest["ops"]])
+        return vs
+
+    def load(self, embeddings, mmap: bool = False) -> FAISS:
+        """Load base + segments; retried if a compaction removes files mid-read."""
+        return self.load_snapshot(embeddings, mmap=mmap)[0]
+
+    # ---------- Write ----------
+
+    def check_embedding(self, embedding: Dict[str, Any], manifest: Optional[Dict[str, Any]] = None) -> bool:
+        """False if the index records a different embedding backend/model than ``embedding``."""
+        recorded = (manifest or self.read_manifest()).get("embedding")
+        return not recorded or recorded == embedding
+
+    def commit(self, vectors: Optional[np.ndarray], ids: Sequence[str], docs: Sequence[Document],
+               embedding: Optional[Dict[str, Any]] = None, deleted: Sequence[str] = (),
+               metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Persist one commit -- a segment of new vectors and/or an ops file of
+        tombstoned ids and metadata rewrites -- and publish it with a single
+        manifest swap; returns the new manifest. A new index records
+        ``embedding`` ({backend, model}); vectors from a different one are
+        refused instead of being mixed in.
+        """
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            manifest = self.read_manifest()
+            if ids:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                if embedding and not self.check_embedding(embedding, manifest):
+                    raise ValueError(f"Index {self.index_dir} was built with {manifest['embedding']}, not {embedding}")
+                if manifest.get("dim") is None:
+                    manifest["dim"] = int(vectors.shape[1])
+                    if embedding:
+                        manifest["embedding"] = embedding
+                name = f"seg_{manifest['next_segment']:06d}"
+                np.save(self.segment_dir / f"{name}.npy", vectors)
+                with open(self.segment_dir / f"{name}.pkl", "wb") as f:
+                    pickle.dump((list(ids), list(docs)), f, protocol=pickle.HIGHEST_PROTOCOL)
+                manifest["segments"] = manifest.get("segments", []) + [name]
+                manifest["next_segment"] += 1
+            if deleted or metadata:
+                name = f"ops_{manifest['next_segment']:06d}"
+                with open(self.segment_dir / f"{name}.pkl", "wb") as f:
+                    pickle.dump((list(deleted), dict(metadata or {})), f, protocol=pickle.HIGHEST_PROTOCOL)
+                manifest["ops"] = manifest.get("ops", []) + [name]
+                manifest["next_segment"] += 1
+            manifest["version"] += 1
+            self.write_manifest(manifest)
+        return manifest
+
+    def append_segment(self, vectors: np.ndarray, ids: Sequence[str], docs: Sequence[Document],
+                       embedding: Optional[Dict[str, Any]] = None) -> str:
+        """Persist one immutable segment and publish it in the manifest (see ``commit``)."""
+        return self.commit(vectors, ids, docs, embedding=embedding)["segments"][-1]
+
+    def segment_count(self) -> int:
+        return len(self.read_manifest().get("segments", []))
+
+    def compact(self, embeddings) -> Optional[str]:
+        """
+        Fold the base and all current segments into a new base, dropping
+        tombstoned vectors and baking in rewritten metadata. Segments and ops
+        committed while compaction runs are kept on top of the new base.
+        """
+        key = str(self.index_dir.resolve())
+        with _DIR_LOCKS_GUARD:
+            if key in _COMPACTING:
+                return None
+            _COMPACTING.add(key)
+        try:
+            return self._compact(embeddings)
+        finally:
+            with _DIR_LOCKS_GUARD:
+                _COMPACTING.discard(key)
+
+    def _write_base(self, vs: FAISS, name: str):
+        """Write the live vectors of ``vs`` in ``save_local`` layout: a flat index + (docstore, id map) pickle."""
+        index = vs.index
+        dead = set(index.deleted.tolist()) if isinstance(index, LayeredIndex) else set()
+        live = [pos for pos in range(index.ntotal) if pos not in dead and pos in vs.index_to_docstore_id]
+        flat = faiss.IndexFlat(index.d, index.metric_type)
+        if live:
+            flat.add(np.ascontiguousarray(index.reconstruct_n(0, index.ntotal)[live]))
+        ids = [vs.index_to_docstore_id[pos] for pos in live]
+        docstore = InMemoryDocstore({_id: vs.docstore.search(_id) for _id in ids})
+        faiss.write_index(flat, str(self.index_dir / f"{name}.faiss"))
+        with open(self.index_dir / f"{name}.pkl", "wb") as f:
+            pickle.dump((docstore, dict(enumerate(ids))), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _compact(self, embeddings) -> Optional[str]:
+        snapshot = self.read_manifest()
+        merged = list(snapshot.get("segments", []))
+        merged_ops = list(snapshot.get("ops", []))
+        if not merged and not merged_ops:
+            return None
+        started = time.perf_counter()
+        vs = self._load_once(embeddings, snapshot)
+        # unique name: another process may be compacting the same snapshot
+        new_base = f"{self.index_name}_g{snapshot['version']:06d}_{uuid.uuid4().hex[:6]}"
+        self._write_base(vs, new_base)
+        with self.lock:
+            manifest = self.read_manifest()
+            old_base = manifest.get("base")
+            if not same_lineage(manifest, snapshot) or not set(merged) <= set(manifest.get("segments", [])) \
+                    or not set(merged_ops) <= set(manifest.get("ops", [])):
+                for ext in (".faiss", ".pkl"):
+                    (self.index_dir / f"{new_base}{ext}").unlink(missing_ok=True)
+                return None
+            manifest["base"] = new_base
+            manifest["segments"] = [s for s in manifest.get("segments", []) if s not in merged]
+            manifest["ops"] = [o for o in manifest.get("ops", []) if o not in merged_ops]
+            manifest["version"] += 1
+            self.write_manifest(manifest)
+        # Readers that already hold the old manifest retry on FileNotFoundError;
+        # workers that mmapped the old base keep their mapping until they swap.
+        for name in merged:
+            for ext in (".npy", ".pkl"):
+                _unlink_quiet(self.segment_dir / f"{name}{ext}")
+        for name in merged_ops:
+            _unlink_quiet(self.segment_dir / f"{name}.pkl")
+        if old_base and old_base != new_base:
+            for ext in (".faiss", ".pkl"):
+                _unlink_quiet(self.index_dir / f"{old_base}{ext}")
+        self.log.info("Index compacted", index=str(self.index_dir), merged_segments=len(merged),
+                      merged_ops=len(merged_ops), base=new_base, seconds=round(time.perf_counter() - started, 3))
+        return new_base
+
+
+class SourceCatalog:
+    """
+    doc_id -> stored chunk ids and metadata, for document-level replace and
+    delete. Built from the directory on first ``sync`` and moved forward
+    after that by reading only new segments/ops while the base is unchanged.
+    Chunks without a doc_id (older ingests) are not tracked. With a
+    ``fingerprint`` function it also keeps each chunk's fingerprint key, so
+    deleting the chunk can release it from the ``FingerprintSet``.
+    """
+    def __init__(self, store: SegmentedIndexStore, fingerprint: Optional[Callable[[str, dict], str]] = None):
+        self.store = store
+        self.fingerprint = fingerprint
+        self.meta: Dict[str, Dict[str, Any]] = {}
+        self.keys: Dict[str, str] = {}
+        self.by_doc: Dict[str, set] = {}
+        self.manifest: Optional[Dict[str, Any]] = None
+
+    def _put_doc(self, _id: str, doc: Document):
+        md = doc.metadata or {}
+        key = self.fingerprint(doc.page_content, md) if self.fingerprint is not None and doc_owners(md) else None
+        self.put(_id, md, key=key)
+
+    def sync(self, manifest: Dict[str, Any]):
+        prev = self.manifest
+        if prev is None or not same_lineage(manifest, prev):
+            self.meta.clear()
+            self.keys.clear()
+            self.by_doc.clear()
+            prev = {}
+            if manifest.get("base"):
+                with open(self.store.index_dir / f"{manifest['base']}.pkl", "rb") as f:
+                    docstore, index_to_docstore_id = pickle.load(f)
+                for _id in index_to_docstore_id.values():
+                    doc = docstore.search(_id)
+                    if isinstance(doc, Document):
+                        self._put_doc(_id, doc)
+        seen = set(prev.get("segments", []))
+        for name in manifest.get("segments", []):
+            if name not in seen:
+                for _id, doc in zip(*self.store.read_segment_docs(name)):
+                    self._put_doc(_id, doc)
+        seen = set(prev.get("ops", []))
+        for name in manifest.get("ops", []):
+            if name not in seen:
+                self.apply(*self.store.read_ops(name))
+        self.manifest = manifest
+
+    def put(self, _id: str, md: Dict[str, Any], key: Optional[str] = None):
+        """Track a chunk; a metadata rewrite (no ``key``) keeps the key recorded when it was added."""
+        key = key or self.keys.get(_id)
+        self.drop(_id)
+        owners = doc_owners(md)
+        if owners:
+            self.meta[_id] = md
+            if key is not None:
+                self.keys[_id] = key
+            for doc_id in owners:
+                self.by_doc.setdefault(doc_id, set()).add(_id)
+
+    def drop(self, _id: str):
+        self.keys.pop(_id, None)
+        for doc_id in doc_owners(self.meta.pop(_id, {})):
+            ids = self.by_doc.get(doc_id)
+            if ids is not None:
+                ids.discard(_id)
+                if not ids:
+                    del self.by_doc[doc_id]
+
+    def apply(self, deleted: Sequence[str], metadata: Dict[str, Dict[str, Any]]):
+        for _id in deleted:
+            self.drop(_id)
+        for _id, md in metadata.items():
+            self.put(_id, md)
+
+    def chunks(self, doc_id: str) -> Dict[str, Dict[str, Any]]:
+        return {_id: self.meta[_id] for _id in self.by_doc.get(doc_id, ())}
@@ -0,0 +1,291 @@
+"""
+Single-writer ingestion with group commit.
+
+Every index directory gets one ``IndexWriter`` per process. Callers submit
+document batches and get a Future; the writer thread drains whatever has
+queued up (optionally lingering ``group_commit_ms``) and commits it as one
+unit: one fingerprint check, one ``embed_documents`` call, one segment, one
+manifest swap. The directory's ``IndexDirLock`` (thread + OS file lock) makes the
+commit exclusive across processes too.
+
+Document-level ``replace``/``delete`` requests ride the same queue. Their
+chunks are diffed by ``chunk_hash`` against the document's stored chunks
+(``SourceCatalog``): only new chunks are embedded, vanished ones are
+tombstoned and moved chunks get their page/offset metadata rewritten.
+Tombstoned chunks give their fingerprints back, so the same content can be
+ingested again later.
+"""
+from __future__ import annotations
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from logger.custom_logger import CustomLogger
+from utils.model_loader import describe_embeddings
+from src.document_ingestion.index_store import (
+    FINGERPRINT_FILE, LEGACY_META, FingerprintSet, SegmentedIndexStore, SourceCatalog,
+    chunk_hash, retarget_doc, without_doc,
+)
+
+
+@dataclass
+class _Pending:
+    docs: List[Document]
+    future: Future = field(default_factory=Future)
+    op: str = "add"                     # "add" | "replace" | "delete"
+    doc_id: Optional[str] = None
+
+
+class IndexWriter:
+    def __init__(self, index_dir: Path, embeddings, fingerprint: Callable[[str, dict], str],
+                 group_commit_ms: float = 0.0, max_batch_docs: int = 1024, idle_timeout_s: float = 60.0,
+                 compact_after_segments: int = 8):
+        self.log = CustomLogger().get_logger(__name__)
+        self.index_dir = Path(index_dir)
+        self.key = str(self.index_dir.resolve())
+        self.embeddings = embeddings
+        self.fingerprint = fingerprint
+        self.group_commit_s = group_commit_ms / 1000.0
+        self.max_batch_docs = max_batch_docs
+        self.idle_timeout_s = idle_timeout_s
+        self.compact_after_segments = compact_after_segments
+        self.store = SegmentedIndexStore(self.index_dir)
+        # read on the first commit, under the directory lock: construction never waits on the file lock
+        self.fingerprints: Optional[FingerprintSet] = None
+        self.catalog = SourceCatalog(self.store, fingerprint)
+        self.stats = {"commits": 0, "requests": 0, "docs_added": 0, "docs_removed": 0}
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"index-writer:{self.index_dir.name}", daemon=True)
+        self._thread.start()
+
+    # ---------- Writer loop ----------
+
+    def _next_group(self, first: _Pending) -> List[_Pending]:
+        """
+        Take everything that queued up while the previous commit ran, then
+        linger up to ``group_commit_ms`` for more (0 = never add latency).
+        """
+        group, n_docs = [first], len(first.docs)
+        deadline = time.monotonic() + self.group_commit_s
+        while n_docs < self.max_batch_docs:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(item)
+            n_docs += len(item.docs)
+        return group
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.idle_timeout_s)
+            except queue.Empty:
+                with _WRITERS_GUARD:
+                    if self._queue.empty():
+                        _WRITERS.pop(self.key, None)
+                        return
+                continue
+            group = self._next_group(first)
+            try:
+                counts = self._commit_group(group)
+                for item, count in zip(group, counts):
+                    item.future.set_result(count)
+            except Exception as e:
+                self.log.error("Group commit failed", error=str(e), index=str(self.index_dir), requests=len(group))
+                for item in group:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _commit_group(self, group: List[_Pending]) -> List[Any]:
+        started = time.perf_counter()
+        with self.store.lock:
+            if self.fingerprints is None:
+                self.fingerprints = FingerprintSet(self.index_dir / FINGERPRINT_FILE)
+                self.fingerprints.migrate_legacy(self.index_dir / LEGACY_META)
+            else:
+                self.fingerprints.refresh()
+            # only document-level ops need the catalog; plain adds never pay for building it
+            catalog = self.catalog if any(item.op != "add" for item in group) else None
+            if catalog is not None:
+                catalog.sync(self.store.read_manifest())
+            batch = _Batch()
+            results: List[Any] = []
+            try:
+                for item in group:
+                    if item.op == "add":
+                        results.append(self._collect_adds(item.docs, batch, catalog))
+                    elif item.op == "replace":
+                        results.append(self._diff_replace(item.doc_id, item.docs, batch, catalog))
+                    else:
+                        results.append(self._delete(item.doc_id, batch, catalog))
+                manifest = None
+                if batch.docs or batch.deleted or batch.metadata:
+                    vectors = None
+                    if batch.docs:
+                        vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in batch.docs]),
+                                             dtype=np.float32)
+                    manifest = self.store.commit(vectors, batch.ids, batch.docs,
+                                                 embedding=describe_embeddings(self.embeddings),
+                                                 deleted=batch.deleted, metadata=batch.metadata)
+                    self.fingerprints.add_many([k for k in batch.keys if k not in batch.released])
+                    self.fingerprints.remove_many(batch.released)
+            except BaseException:
+                self.catalog = SourceCatalog(self.store, self.fingerprint)     # it may hold uncommitted changes
+                raise
+            if catalog is not None and manifest is not None:
+                catalog.manifest = manifest                  # already holds this commit's changes
+        self.stats["commits"] += 1
+        self.stats["requests"] += len(group)
+        self.stats["docs_added"] += len(batch.docs)
+        self.stats["docs_removed"] += len(batch.deleted)
+        self.log.info("Group commit", index=str(self.index_dir), requests=len(group), added=len(batch.docs),
+                      removed=len(batch.deleted), rewritten=len(batch.metadata),
+                      seconds=round(time.perf_counter() - started, 4))
+        if batch.docs or batch.deleted:
+            self._maybe_compact()
+        return results
+
+    def _collect_adds(self, docs: List[Document], batch: "_Batch", catalog: Optional[SourceCatalog]) -> int:
+        added = 0
+        for d in docs:
+            key = self.fingerprint(d.page_content, d.metadata or {})
+            if key in batch.seen or (key in self.fingerprints and key not in batch.released):
+                continue
+            batch.add(key, d, catalog)
+            added += 1
+        return added
+
+    def _diff_replace(self, doc_id: str, docs: List[Document], batch: "_Batch",
+                      catalog: SourceCatalog) -> Dict[str, int]:
+        """Keep chunks whose hash is still present, embed the new ones, tombstone the rest."""
+        stored: Dict[str, List[str]] = {}
+        for _id, md in catalog.chunks(doc_id).items():
+            stored.setdefault(md.get("chunk_hash"), []).append(_id)
+        added = kept = 0
+        for d in docs:
+            md = dict(d.metadata or {}, doc_id=doc_id)
+            md.setdefault("chunk_hash", chunk_hash(d.page_content))
+            if stored.get(md["chunk_hash"]):
+                _id = stored[md["chunk_hash"]].pop()
+                new_md = retarget_doc(catalog.meta[_id], doc_id, md)
+                if new_md != catalog.meta[_id]:
+                    batch.rewrite(_id, new_md, catalog)
+                kept += 1
+                continue
+            key = self.fingerprint(d.page_content, md)
+            if key in batch.seen:
+                continue
+            batch.add(key, Document(page_content=d.page_content, metadata=md), catalog)
+            added += 1
+        removed = self._release(doc_id, [_id for ids in stored.values() for _id in ids], batch, catalog)
+        return {"added": added, "kept": kept, "removed": removed}
+
+    def _delete(self, doc_id: str, batch: "_Batch", catalog: SourceCatalog) -> int:
+        return self._release(doc_id, list(catalog.chunks(doc_id)), batch, catalog)
+
+    @staticmethod
+    def _release(doc_id: str, ids: List[str], batch: "_Batch", catalog: SourceCatalog) -> int:
+        """Detach ``doc_id`` from chunks; ones no other document shares are tombstoned."""
+        removed = 0
+        for _id in ids:
+            remaining = without_doc(catalog.meta[_id], doc_id)
+            if remaining is None:
+                batch.delete(_id, catalog)
+                removed += 1
+            else:
+                batch.rewrite(_id, remaining, catalog)
+        return removed
+
+    def _maybe_compact(self):
+        """Fold segments into a new base in the background once too many have piled up."""
+        manifest = self.store.read_manifest()
+        if len(manifest.get("segments", [])) + len(manifest.get("ops", [])) <= self.compact_after_segments:
+            return
+        threading.Thread(target=self._compact, name=f"compact:{self.index_dir.name}", daemon=True).start()
+
+    def _compact(self):
+        try:
+            self.store.compact(self.embeddings)
+        except Exception as e:
+            self.log.error("Index compaction failed", error=str(e), index=str(self.index_dir))
+
+
+class _Batch:
+    """Everything one group commit writes; catalog updates are applied as items are collected."""
+    def __init__(self):
+        self.docs: List[Document] = []
+        self.ids: List[str] = []
+        self.keys: List[str] = []
+        self.seen: set = set()
+        self.deleted: List[str] = []
+        self.released: set = set()          # fingerprint keys of tombstoned chunks
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, key: str, doc: Document, catalog: Optional[SourceCatalog]):
+        md = dict(doc.metadata or {})
+        md.setdefault("chunk_hash", chunk_hash(doc.page_content))
+        doc = Document(page_content=doc.page_content, metadata=md)
+        _id = str(uuid.uuid4())
+        self.seen.add(key)
+        self.released.discard(key)
+        self.keys.append(key)
+        self.docs.append(doc)
+        self.ids.append(_id)
+        if catalog is not None:
+            catalog.put(_id, md, key=key)
+
+    def rewrite(self, _id: str, md: Dict[str, Any], catalog: SourceCatalog):
+        self.metadata[_id] = md
+        catalog.put(_id, md)
+
+    def delete(self, _id: str, catalog: SourceCatalog):
+        key = catalog.keys.get(_id)
+        if key is not None:
+            self.released.add(key)
+            self.seen.discard(key)
+        self.deleted.append(_id)
+        self.metadata.pop(_id, None)
+        catalog.drop(_id)
+
+
+_WRITERS: Dict[str, IndexWriter] = {}
+_WRITERS_GUARD = threading.Lock()
+
+
+def submit_documents(index_dir: Path, docs: List[Document], embeddings, fingerprint: Callable[[str, dict], str],
+                     op: str = "add", doc_id: Optional[str] = None, **writer_kwargs) -> Future:
+    """
+    Queue docs on the directory's writer, starting one if none is running.
+    ``op="replace"``/``"delete"`` act on every stored chunk of ``doc_id``.
+    """
+    key = str(Path(index_dir).resolve())
+    item = _Pending(list(docs), op=op, doc_id=doc_id)
+    # enqueue under the guard so an idle writer cannot retire between lookup and put
+    with _WRITERS_GUARD:
+        writer = _WRITERS.get(key)
+        if writer is None:
+            writer = IndexWriter(Path(index_dir), embeddings, fingerprint, **writer_kwargs)
+            _WRITERS[key] = writer
+        elif describe_embeddings(writer.embeddings) != describe_embeddings(embeddings):
+            # the running writer would embed these docs with its own model
+            item.future.set_exception(ValueError(
+                f"Index {index_dir} is being written with {describe_embeddings(writer.embeddings)}, "
+                f"not {describe_embeddings(embeddings)}"))
+            return item.future
+        writer._queue.put(item)
+    return item.future
+
+
+def get_writer(index_dir: Path) -> Optional[IndexWriter]:
+    with _WRITERS_GUARD:
+        return _WRITERS.get(str(Path(index_dir).resolve()))
@@ -0,0 +1,180 @@
+"""
+Inverted metadata index over a loaded FAISS store, used to restrict the
+vector search itself to the chunks a filter allows.
+
+Filters are plain dicts (AND across fields, OR within a list)::
+
+    {"doc_id": ["manual.pdf"], "file_type": ["pdf"],
+     "page": [lo, hi], "uploaded_at": [lo, hi]}      # bounds inclusive, None = open
+
+``doc_id``/``file_type`` map each value to the positions carrying it;
+``page``/``uploaded_at`` keep (value, position) pairs and are range-scanned
+with numpy. A chunk collapsed across files (``also_in``) is indexed under
+every occurrence. The index catches up lazily with positions appended to the
+store's id map, and is rebuilt after metadata rewrites (``invalidate``).
+"""
+from __future__ import annotations
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+CATEGORICAL = ("doc_id", "file_type")
+NUMERIC = ("page", "uploaded_at")
+
+
+def _values(md: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Indexed values of one chunk, over its top-level occurrence and ``also_in``."""
+    out: Dict[str, List[Any]] = {f: [] for f in CATEGORICAL + NUMERIC}
+    for occ in [md] + list(md.get("also_in") or []):
+        src = occ.get("source")
+        doc_id = occ.get("doc_id") or (Path(str(src)).name if src else None)
+        if doc_id:
+            out["doc_id"].append(doc_id)
+        if isinstance(occ.get("page"), (int, float)):
+            out["page"].append(occ["page"])
+    file_type = md.get("file_type") or (Path(out["doc_id"][0]).suffix.lstrip(".").lower() if out["doc_id"] else None)
+    if file_type:
+        out["file_type"].append(file_type)
+    if isinstance(md.get("uploaded_at"), (int, float)):
+        out["uploaded_at"].append(md["uploaded_at"])
+    return out
+
+
+def matches(md: Dict[str, Any], flt: Dict[str, Any]) -> bool:
+    """Evaluate a filter against one chunk's metadata (for search types the index cannot restrict)."""
+    values = _values(md or {})
+    for field, cond in flt.items():
+        if field in CATEGORICAL:
+            if not set(values[field]) & set(cond):
+                return False
+        elif field in NUMERIC:
+            lo, hi = cond
+            if not any((lo is None or v >= lo) and (hi is None or v <= hi) for v in values[field]):
+                return False
+    return True
+
+
+class MetadataIndex:
+    def __init__(self, docstore, index_to_docstore_id: Dict[int, str]):
+        self.docstore = docstore
+        self.index_to_docstore_id = index_to_docstore_id
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._covered = 0
+        self._postings: Dict[str, Dict[Any, List[int]]] = {f: {} for f in CATEGORICAL}
+        self._pairs: Dict[str, List[List[float]]] = {f: [[], []] for f in NUMERIC}   # values, positions
+        self._arrays: Dict[str, Any] = {}
+
+    def invalidate(self):
+        """Metadata of stored chunks changed (replace rewrites pages): rebuild on next use."""
+        with self._lock:
+            self._reset()
+
+    def _catch_up(self):
+        end = len(self.index_to_docstore_id)
+        for pos in range(self._covered, end):
+            doc = self.docstore.search(self.index_to_docstore_id.get(pos))
+            if not isinstance(doc, Document):
+                continue
+            for field, vals in _values(doc.metadata or {}).items():
+                if field in CATEGORICAL:
+                    for v in vals:
+                        self._postings[field].setdefault(v, []).append(pos)
+                else:
+                    for v in vals:
+                        self._pairs[field][0].append(float(v))
+                        self._pairs[field][1].append(pos)
+        if end > self._covered:
+            self._arrays.clear()
+            self._covered = end
+
+    def _numeric(self, field: str):
+        if field not in self._arrays:
+            values, positions = self._pairs[field]
+            self._arrays[field] = (np.asarray(values, dtype=np.float64), np.asarray(positions, dtype=np.int64))
+        return self._arrays[field]
+
+    def select(self, flt: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Sorted positions allowed by ``flt``; None when there is nothing to filter on."""
+        if not flt:
+            return None
+        with self._lock:
+            self._catch_up()
+            allowed: Optional[np.ndarray] = None
+            for field, cond in flt.items():
+                if field in CATEGORICAL:
+                    lists = [self._postings[field].get(v, ()) for v in cond]
+                    hit = np.unique(np.fromiter((p for lst in lists for p in lst), dtype=np.int64))
+                elif field in NUMERIC:
+                    lo, hi = cond
+                    values, positions = self._numeric(field)
+                    mask = np.ones(values.shape, dtype=bool)
+                    if lo is not None:
+                        mask &= values >= lo
+                    if hi is not None:
+                        mask &= values <= hi
+                    hit = np.unique(positions[mask])
+                else:
+                    raise ValueError(f"Unknown metadata filter field: {field}")
+                allowed = hit if allowed is None else np.intersect1d(allowed, hit, assume_unique=True)
+                if not allowed.size:
+                    break
+            return allowed
+
+
+_BUILD_GUARD = threading.Lock()
+
+
+def metadata_index(vs) -> MetadataIndex:
+    """The store's metadata index, created on first use; snapshots sharing an id map share it."""
+    mi = getattr(vs, "metadata_index", None)
+    if mi is None:
+        with _BUILD_GUARD:
+            mi = getattr(vs, "metadata_index", None)
+            if mi is None:
+                mi = MetadataIndex(vs.docstore, vs.index_to_docstore_id)
+                vs.metadata_index = mi
+    return mi
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def _names(value: Optional[Any]) -> List[str]:
+    if value in (None, ""):
+        return []
+    items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    return [s.strip() for s in items if s and s.strip()]
+
+
+def build_filter(sources: Optional[Any] = None, file_types: Optional[Any] = None,
+                 page_from: Optional[int] = None, page_to: Optional[int] = None,
+                 uploaded_after: Optional[Any] = None, uploaded_before: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+    """
+    Filter dict from request parameters. ``sources`` are uploaded file names,
+    pages are 1-based as shown to users (stored 0-based), upload times are
+    ISO-8601 or epoch seconds.
+    """
+    flt: Dict[str, Any] = {}
+    if _names(sources):
+        flt["doc_id"] = _names(sources)
+    if _names(file_types):
+        flt["file_type"] = [t.lstrip(".").lower() for t in _names(file_types)]
+    if page_from is not None or page_to is not None:
+        flt["page"] = [None if page_from is None else int(page_from) - 1,
+                       None if page_to is None else int(page_to) - 1]
+    if uploaded_after not in (None, "") or uploaded_before not in (None, ""):
+        flt["uploaded_at"] = [_timestamp(uploaded_after), _timestamp(uploaded_before)]
+    return flt or None
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.admission import AdmissionController, AdmissionMiddleware, Rejected, process_metrics
+
+ENDPOINTS = {
+    "chat_query": {"path": "/chat/query", "priority": "interactive", "max_concurrency": 2, "max_queue": 4,
+                   "deadline_s": 5},
+    "analyze": {"path": "/analyze", "priority": "batch", "max_concurrency": 2, "max_queue": 2, "deadline_s": 5},
+}
+
+
+def test_interactive_overtakes_queued_batch_and_queues_are_bounded():
+    async def scenario():
+        ctl = AdmissionController(ENDPOINTS, total_concurrency=1)
+        order = []
+
+        async def call(name, tag):
+            await ctl.acquire(name)
+            order.append(tag)
+            await asyncio.sleep(0.01)
+            ctl.release(name, 0.01)
+
+        await ctl.acquire("analyze")                        # holds the only slot
+        tasks = [asyncio.create_task(call("analyze", "batch-1")), asyncio.create_task(call("analyze", "batch-2"))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(call("chat_query", "chat")))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Rejected) as full:
+            await ctl.acquire("analyze")
+        assert full.value.reason == "queue_full" and full.value.retry_after_s >= 1
+        assert ctl.report()["endpoints"]["analyze"]["queued"] == 2
+        ctl.release("analyze", 0.01)
+        await asyncio.gather(*tasks)
+        return order, ctl.report()
+
+    order, report = asyncio.run(scenario())
+    assert order == ["chat", "batch-1", "batch-2"]
+    assert report["in_flight"] == 0 and report["endpoints"]["analyze"]["queue_full"] == 1
+    assert report["endpoints"]["chat_query"]["wait_p95_ms"] > 0
+
+
+def test_requests_that_cannot_start_in_time_are_rejected_early():
+    async def scenario():
+        ctl = AdmissionController({"analyze": {**ENDPOINTS["analyze"], "max_concurrency": 1, "deadline_s": 0.2}})
+        await ctl.acquire("analyze")
+        with pytest.raises(Rejected) as timed_out:          # no service time observed yet: waits out the deadline
+            await ctl.acquire("analyze")
+        ctl.release("analyze", 3.0)                         # now known to take ~3s per request
+        await ctl.acquire("analyze")
+        started = time.monotonic()
+        with pytest.raises(Rejected) as early:
+            await ctl.acquire("analyze")
+        return timed_out.value, early.value, time.monotonic() - started
+
+    timed_out, early, elapsed = asyncio.run(scenario())
+    assert timed_out.reason == "timeout"
+    assert early.reason == "deadline" and early.retry_after_s == 3 and elapsed < 0.05
+
+
+def test_middleware_answers_429_with_retry_after_and_exposes_metrics():
+    ctl = AdmissionController({"analyze": {**ENDPOINTS["analyze"], "max_concurrency": 1, "max_queue": 0}})
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=ctl)
+    entered, release = threading.Event(), threading.Event()
+
+    @app.post("/analyze")
+    def analyze():
+        entered.set()
+        release.wait(5)
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    client = TestClient(app)
+    first = {}
+    worker = threading.Thread(target=lambda: first.update(resp=client.post("/analyze")))
+    worker.start()
+    assert entered.wait(5)
+    rejected = client.post("/analyze")
+    assert client.get("/health").status_code == 200                 # other paths are never queued
+    release.set()
+    worker.join(5)
+
+    assert rejected.status_code == 429 and rejected.headers["retry-after"] == "1"
+    assert rejected.json()["reason"] == "queue_full"
+    assert first["resp"].status_code == 200 and "x-queue-wait-ms" in first["resp"].headers
+    stats = process_metrics(ctl)["admission"]["endpoints"]["analyze"]
+    assert stats["admitted"] == stats["completed"] == 1 and stats["queue_full"] == 1 and stats["in_flight"] == 0
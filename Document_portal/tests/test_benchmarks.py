@@ -0,0 +1,48 @@
+from benchmarks.corpus import CorpusSpec
+from benchmarks.fakes import HashingEmbeddings
+from benchmarks.runner import compare_to_baseline, run_all
+
+
+def test_hashing_embeddings_are_deterministic():
+    emb = HashingEmbeddings(dim=64)
+    a = emb.embed_query("supplier risk in the contract")
+    assert a == HashingEmbeddings(dim=64).embed_query("supplier risk in the contract")
+    assert len(a) == 64
+
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {"scenarios": {"ingest": {"p95_ms": 10.0, "p99_ms": 12.0, "throughput_ops_s": 100.0, "peak_rss_mb": 200.0}}}
+    current = {"scenarios": {"ingest": {"p95_ms": 20.0, "p99_ms": 12.5, "throughput_ops_s": 50.0, "peak_rss_mb": 210.0}}}
+    regressed = {r["metric"] for r in compare_to_baseline(current, baseline, tolerance=0.25)}
+    assert regressed == {"p95_ms", "throughput_ops_s"}
+
+
+def test_scenarios_run_offline():
+    spec = CorpusSpec(n_docs=3, pages_per_doc=2)
+    results = run_all(["ingest", "rag_invoke", "analyze", "compare"], spec, iterations=2, warmup=0)
+    for name, metrics in results["scenarios"].items():
+        assert metrics["iterations"] == 2
+        assert metrics["p50_ms"] <= metrics["p99_ms"]
+        assert metrics["peak_rss_mb"] > 0
+
+
+def test_stub_server_serves_openai_embeddings_and_rate_limits(monkeypatch):
+    import httpx
+    from benchmarks.stub_server import StubBehaviour, start_stub_server
+    from utils.model_loader import ModelLoader
+
+    server, provider, base_url = start_stub_server(StubBehaviour(embedding_dim=32, rps=0.001, burst=2))
+    try:
+        for key, value in {"EMBEDDING_PROVIDER": "openai", "OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "stub",
+                           "GOOGLE_API_KEY": "stub", "GROQ_API_KEY": "stub"}.items():
+            monkeypatch.setenv(key, value)
+        emb = ModelLoader().load_embeddings()
+        emb.max_retries = 0
+        assert len(emb.embed_query("supplier risk")) == 32
+        resp = httpx.post(f"{base_url}/embeddings", json={"input": ["x"]})
+        assert resp.status_code == 200
+        resp = httpx.post(f"{base_url}/embeddings", json={"input": ["x"]})
+        assert resp.status_code == 429 and "Retry-After" in resp.headers
+        assert provider.counters["rate_limited"] == 1
+    finally:
+        server.shutdown()
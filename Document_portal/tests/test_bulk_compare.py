@@ -0,0 +1,35 @@
+import time
+
+from benchmarks.corpus import CorpusSpec, LocalUpload, generate_corpus, revise_pdf
+from benchmarks.fakes import FakeModelLoader
+from src.document_compare.document_comparator import DocumentComparatorLLM
+from src.document_ingestion.data_ingestion import DocumentComparator
+
+
+def test_bulk_compare_extracts_reference_once_and_streams_in_parallel(tmp_path):
+    ref = generate_corpus(tmp_path / "src", CorpusSpec(n_docs=1, pages_per_doc=2, kinds=("pdf",)))[0]
+    candidates = [revise_pdf(ref, tmp_path / "src" / f"vendor_{i}.pdf", seed=i) for i in range(6)]
+    dc = DocumentComparator(base_dir=str(tmp_path / "compare"))
+    ref_path, cand_paths = dc.save_bulk_files(LocalUpload(ref), [LocalUpload(c) for c in candidates])
+    assert ref_path.parent.name == "reference" and len(cand_paths) == 6
+
+    reads = []
+
+    def loader(path):
+        def load():
+            reads.append(path.name)
+            if path.name == "vendor_3.pdf":
+                raise ValueError("corrupt PDF")
+            return dc.read_pdf(path)
+        return load
+
+    comp = DocumentComparatorLLM(model_loader=FakeModelLoader(llm_latency_s=0.2))
+    started = time.perf_counter()
+    results = list(comp.compare_many(ref_path.name, dc.read_pdf(ref_path),
+                                     [(p.name, loader(p)) for p in cand_paths], max_concurrency=3))
+    elapsed = time.perf_counter() - started
+
+    assert sorted(r["index"] for r in results) == list(range(6)) and sorted(reads) == sorted(p.name for p in cand_paths)
+    assert [r["candidate"] for r in results if r["status"] == "error"] == ["vendor_3.pdf"]
+    assert all(r["rows"] for r in results if r["status"] == "ok")
+    assert elapsed < 0.2 * 5 * 0.75          # 5 LLM calls of 0.2s, three at a time
@@ -0,0 +1,50 @@
+import json
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_ingestion.bulk_ingest import CHECKPOINT_NAME, BulkIngestor
+from src.document_ingestion.index_store import SegmentedIndexStore
+
+
+def _write(root, rel, topic):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n\n".join(f"{topic} paragraph {i}: the {topic} terms cover clause {i} in detail."
+                                for i in range(5)), encoding="utf-8")
+
+
+def _ingestor(index_dir, workers=0):
+    return BulkIngestor(index_dir, model_loader=FakeModelLoader(embedding_dim=32), workers=workers,
+                        embed_workers=2, batch_chunks=3, chunk_size=80, chunk_overlap=0)
+
+
+def test_bulk_ingest_dedupes_resumes_and_reports(tmp_path):
+    root, index_dir = tmp_path / "docs", tmp_path / "index"
+    for i, topic in enumerate(["lease", "loan", "audit"]):
+        _write(root, f"dept{i % 2}/{topic}.txt", topic)
+    _write(root, "copies/lease_copy.txt", "lease")          # same bytes as dept0/lease.txt, walked first
+    (root / "notes.md").write_text("not a supported type")
+
+    first = _ingestor(index_dir).run(root)
+    assert first["files_seen"] == 4 and first["files_ingested"] == 3 and first["duplicates"] == 1
+    assert first["chunks"] == first["embeddings"] == 15 and first["chunks_per_s"] > 0
+
+    # a crash before the last commit: forget one file, add a new one, run again
+    lines = (index_dir / CHECKPOINT_NAME).read_text().splitlines()
+    kept = [line for line in lines if json.loads(line)["path"] != "dept0/audit.txt"]
+    (index_dir / CHECKPOINT_NAME).write_text("\n".join(kept) + "\n")
+    _write(root, "dept1/vendor.txt", "vendor")
+
+    second = _ingestor(index_dir).run(root)
+    assert second["resumed"] == 3 and second["files_ingested"] == 2 and second["duplicates"] == 0
+
+    vs = SegmentedIndexStore(index_dir).load(HashingEmbeddings(dim=32))
+    assert vs.index.n_live == 20                              # audit re-read, but not stored twice
+    assert {d.metadata["doc_id"] for d in vs.docstore._dict.values()} == {
+        "copies/lease_copy.txt", "dept1/loan.txt", "dept0/audit.txt", "dept1/vendor.txt"}
+
+
+def test_bulk_ingest_parses_on_a_process_pool(tmp_path):
+    for topic in ("lease", "loan"):
+        _write(tmp_path / "docs", f"{topic}.txt", topic)
+    report = _ingestor(tmp_path / "index", workers=2).run(tmp_path / "docs")
+    assert report["files_ingested"] == 2 and report["failed"] == 0 and report["chunks"] == 10
@@ -0,0 +1,83 @@
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader
+from src.document_ingestion.chunk_dedup import ChunkDeduplicator, MinHasher
+from src.document_ingestion.data_ingestion import ChatIngestor
+
+BODY = ("The supplier shall deliver quarterly compliance reports covering pricing, audit findings "
+        "and security access reviews for every region listed in schedule {n}.")
+DISCLAIMER = ("This document is confidential and intended solely for the addressee. Any review, "
+              "retransmission or dissemination by other persons is prohibited by law. If you received "
+              "it in error please notify the sender immediately and delete every copy from your systems.")
+TOPICS = ["pricing", "audit", "latency", "invoices", "liability", "security", "forecast", "budget"]
+
+
+def _pages(n=5):
+    pages = []
+    for i in range(n):
+        body = "\n".join(f"Clause on {TOPICS[(i + j) % len(TOPICS)]} and {TOPICS[(2 * i + j) % len(TOPICS)]}"
+                         for j in range(6))
+        pages.append(Document(page_content=f"ACME Corp - Internal\n{body}\nPage {i + 1} of {n}",
+                              metadata={"source": "contract.pdf", "page": i}))
+    return pages
+
+
+def test_recurring_headers_and_footers_are_stripped():
+    pages, removed = ChunkDeduplicator().strip_furniture(_pages())
+    assert removed == 10
+    for original, page in zip(_pages(), pages):
+        assert "ACME Corp" not in page.page_content and "Page" not in page.page_content
+        assert page.page_content.split("\n") == original.page_content.split("\n")[1:-1]
+
+
+def test_near_duplicate_chunks_collapse_with_provenance():
+    chunks = [
+        Document(page_content=DISCLAIMER, metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content=BODY.format(n=1), metadata={"source": "a.pdf", "page": 1}),
+        Document(page_content=DISCLAIMER.replace("law", "law "), metadata={"source": "a.pdf", "page": 2}),
+        Document(page_content=DISCLAIMER.replace("persons", "parties"), metadata={"source": "b.pdf", "page": 4}),
+    ]
+    kept = ChunkDeduplicator().collapse(chunks)
+    assert [d.metadata["page"] for d in kept] == [0, 1, 4]          # b.pdf's variant is another document
+    assert kept[0].metadata["also_in"] == [{"source": "a.pdf", "page": 2}]
+    mh = MinHasher()
+    assert (mh.signature(DISCLAIMER) == mh.signature(BODY.format(n=1))).mean() < 0.2
+
+
+def test_documents_differing_in_a_figure_are_both_kept():
+    text = ("The annual service fee is {fee} euros, payable in advance. The supplier may index the fee once a "
+            "year to the consumer price index. Late payment accrues interest at two percent per month.")
+    chunks = [Document(page_content=text.format(fee=fee), metadata={"source": f"{v}.pdf", "doc_id": f"{v}.pdf",
+                                                                     "page": 0})
+              for v, fee in (("v1", 5000), ("v2", 9000))]
+    chunks.append(Document(page_content="  " + text.format(fee=5000).upper(),
+                           metadata={"source": "v3.pdf", "doc_id": "v3.pdf", "page": 0}))
+    kept = ChunkDeduplicator().collapse(chunks)
+    assert [d.metadata["doc_id"] for d in kept] == ["v1.pdf", "v2.pdf"]
+    assert "9000" in kept[1].page_content
+    assert kept[0].metadata["also_in"] == [{"doc_id": "v3.pdf", "source": "v3.pdf", "page": 0}]   # identical text
+
+
+def test_wordless_chunks_only_collapse_on_exact_match():
+    rule = "| --- | --- | --- | --- | --- | --- | --- | --- |"
+    chunks = [Document(page_content=text, metadata={"source": "t.pdf", "page": i})
+              for i, text in enumerate([rule, rule, "..... ..... ..... ..... ..... ..... ..... .....", BODY.format(n=1)])]
+    for min_words in (8, 0):
+        kept = ChunkDeduplicator(min_words=min_words).collapse([Document(page_content=d.page_content,
+                                                                          metadata=dict(d.metadata)) for d in chunks])
+        assert [d.metadata["page"] for d in kept] == [0, 2, 3]
+        assert kept[0].metadata["also_in"] == [{"source": "t.pdf", "page": 1}]
+
+
+def test_ingestion_embeds_fewer_chunks(tmp_path):
+    class Upload:
+        name = "memo.txt"
+
+        @staticmethod
+        def getbuffer():
+            return "\n\n".join([DISCLAIMER, BODY.format(n=1), DISCLAIMER, BODY.format(n=2), DISCLAIMER]).encode()
+
+    ci = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"),
+                      session_id="dedupe", model_loader=FakeModelLoader(embedding_dim=32))
+    retriever = ci.built_retriever([Upload()], chunk_size=200, chunk_overlap=0, k=5)
+    assert retriever.vectorstore.index.ntotal == 3
@@ -0,0 +1,59 @@
+from langchain_core.documents import Document
+
+from src.document_ingestion.chunker import StructuredChunker, TokenCounter, build_chunker
+
+PAGE = """MASTER SERVICES AGREEMENT
+
+1. Payment terms
+The client pays each invoice within thirty days. Late payments accrue interest at two percent per month.
+
+2. Termination
+""" + " ".join(f"Either party may terminate under condition {i} with written notice." for i in range(12)) + """
+
+Schedule A - Fees
+Fees are listed per service line."""
+
+
+def test_chunks_follow_headings_and_stay_within_the_token_budget():
+    chunker = StructuredChunker(chunk_tokens=48, overlap_tokens=20, min_chunk_tokens=8)
+    pages = [Document(page_content=PAGE, metadata={"source": "msa.pdf", "page": 0}),
+             Document(page_content="Continued from the previous page.", metadata={"source": "msa.pdf", "page": 1})]
+    chunks = chunker.split_documents(pages)
+
+    for c in chunks:
+        md = c.metadata
+        assert pages[md["page"]].page_content[md["start_index"]:md["end_index"]] == c.page_content
+        assert md["source"] == "msa.pdf" and md["tokens"] <= 48
+    assert chunks[0].page_content.startswith("MASTER SERVICES AGREEMENT\n\n1. Payment terms")
+    assert chunks[0].page_content.endswith("two percent per month.")
+    sections = [c.metadata["section"] for c in chunks]
+    assert sections[1:-2] == ["2. Termination"] * (len(chunks) - 3)
+    assert sections[-2:] == ["Schedule A - Fees"] * 2          # the heading carries over to the next page
+    assert chunks[-2].page_content.startswith("Schedule A") and chunks[-1].metadata["page"] == 1
+    # a paragraph cut between sentences repeats its last sentence in the next chunk
+    second, third = chunks[1].page_content, chunks[2].page_content
+    assert third.split(". ")[0] + "." == second.rsplit(". ", 1)[-1]
+
+
+def test_overlong_sentences_are_cut_at_spaces_and_counts_can_come_from_a_tokenizer():
+    words = TokenCounter("words", lambda texts: [t.split() for t in texts])
+    text = " ".join(f"w{i}" for i in range(100))                 # one sentence, no punctuation
+    spans = StructuredChunker(chunk_tokens=30, overlap_tokens=0, counter=words).split_text(text)
+    assert len(spans) == 4 and all(n <= 30 for _, _, n in spans)
+    assert " ".join(text[s:e] for s, e, _ in spans) == text
+
+
+def test_unicode_whitespace_lines_are_blank():
+    chunker = StructuredChunker(chunk_tokens=64, overlap_tokens=0, min_chunk_tokens=0)
+    assert chunker.split_text("\xa0") == [] and chunker.split_text("\u2003\n \xa0\t\n") == []
+    text = "First paragraph.\n\xa0\u3000\nSecond paragraph.\xa0"
+    assert [text[s:e] for s, e, _ in chunker.split_text(text)] == ["First paragraph.\n\xa0\u3000\nSecond paragraph."]
+    assert chunker._blocks(text)[0] == [(0, 16), (20, 37)]
+
+
+def test_chunker_comes_from_config():
+    config = {"chunking": {"strategy": "structured", "chunk_tokens": None, "overlap_tokens": None},
+              "embedding_model": {"google": {"provider": "google", "model_name": "gemini-embedding-001"}}}
+    chunker = build_chunker(config, chunk_size=1000, chunk_overlap=200)
+    assert (chunker.chunk_tokens, chunker.overlap_tokens, chunker.counter.name) == (250, 50, "estimate")
+    assert build_chunker({**config, "chunking": {"strategy": "recursive"}}) is None
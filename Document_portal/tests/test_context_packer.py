@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from src.document_chat.context_packer import ContextPacker
+from utils.tokens import count_tokens
+
+
+def _doc(text, start=None, source="a.pdf", page=0):
+    md = {"source": source, "page": page}
+    if start is not None:
+        md["start_index"] = start
+    return Document(page_content=text, metadata=md)
+
+
+def test_merges_overlapping_chunks_by_offset():
+    page = " ".join(f"word{i}" for i in range(40))
+    a, b = page[:120], page[90:]
+    packed = ContextPacker().pack([_doc(b, start=90), _doc(a, start=0)])
+    assert packed == page
+
+
+def test_merges_overlapping_chunks_by_text_without_offsets():
+    page = "Alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi rho."
+    packed = ContextPacker(min_overlap=10).pack([_doc(page[:60]), _doc(page[35:])])
+    assert packed == page
+
+
+def test_drops_near_duplicates_and_keeps_rank_order():
+    text = "the supplier contract has a liability clause covering late delivery penalties and audits"
+    docs = [_doc(text, source="b.pdf"), _doc("unrelated revenue forecast for the next quarter", source="c.pdf"),
+            _doc(text + " too", source="d.pdf")]
+    selected = ContextPacker().select(docs)
+    assert [p.source for p in selected] == ["b.pdf", "c.pdf"]
+
+
+def test_respects_token_budget():
+    docs = [_doc(("Sentence number %d is here. " % i) * 20, source=f"s{i}.pdf") for i in range(10)]
+    packed = ContextPacker(token_budget=300).pack(docs)
+    assert count_tokens(packed) <= 300
+    assert packed.startswith("Sentence number 0")
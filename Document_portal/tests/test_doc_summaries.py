@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import wait
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader
+from src.document_chat.doc_router import DocumentQueryRouter, classify
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.data_ingestion import ChatIngestor
+from src.document_ingestion.doc_summaries import (
+    DocumentSummaryStore, forget_summary, schedule_summaries, stats, wait_for_summaries,
+)
+
+
+class Upload:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+
+    def getbuffer(self):
+        return self.text.encode()
+
+
+def test_classify_routes_only_document_level_questions():
+    assert classify("Summarize this document.")[0] == "summary"
+    assert classify("Can you please give me a short summary of lease.pdf?")[0] == "summary"
+    assert classify("Who is the author?")[0] == "author"
+    assert classify("How many pages does the report have?")[0] == "pages"
+    assert classify("When was this contract last updated")[0] == "modified"
+    for question in ["What does the report say about supplier risk?", "Summarize the payment terms",
+                     "Who approved the budget?", "What is the notice period in the lease?"]:
+        assert classify(question) is None
+
+
+def test_page_count_comes_from_the_loader_only_for_pdfs():
+    answer = DocumentQueryRouter._answer
+    assert answer("pages", {"pages": 12, "file_type": "pdf", "metadata": {"PageCount": "10"}}) == "12 pages"
+    assert answer("pages", {"pages": 1, "file_type": "pdf", "metadata": {}}) == "1 page"
+    assert answer("pages", {"pages": 1, "file_type": "docx", "metadata": {"PageCount": "7"}}) == "7 pages"
+    assert answer("pages", {"pages": 1, "file_type": "txt", "metadata": {"PageCount": "Not Available"}}) \
+        == "The page count is not available."
+
+
+def test_store_round_trip_and_remove(tmp_path):
+    store = DocumentSummaryStore(tmp_path)
+    store.put("a.pdf", {"status": "ok", "metadata": {"Title": "A"}})
+    store.put("b.pdf", {"status": "failed", "error": "timeout"})
+    assert set(DocumentSummaryStore(tmp_path).all()) == {"a.pdf", "b.pdf"}
+    store.remove("a.pdf")
+    assert list(store.all()) == ["b.pdf"] and store.get("a.pdf") is None
+
+
+def test_ingest_summarises_and_router_answers_without_retrieval(tmp_path):
+    loader = FakeModelLoader(embedding_dim=32)
+    loader.config = {**loader.config, "doc_summaries": {"enabled": True, "workers": 1, "route": True}}
+    ci = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"),
+                      session_id="summaries", model_loader=loader)
+    text = "Quarterly supplier review.\n\nDelivery was late in two regions and pricing rose by four percent."
+    ci.built_retriever([Upload("review.txt", text)], chunk_size=200, chunk_overlap=0, k=3)
+    assert wait_for_summaries(ci.faiss_dir, timeout=30)
+    entry = DocumentSummaryStore(ci.faiss_dir).get("review.txt")
+    assert entry["status"] == "ok" and entry["metadata"]["Title"] == "Synthetic Report"
+
+    unchanged = stats["unchanged"]
+    ci.built_retriever([Upload("review.txt", text)], chunk_size=200, chunk_overlap=0, k=3)
+    assert stats["unchanged"] == unchanged + 1
+
+    rag = ConversationalRAG(session_id="summaries", model_loader=loader)
+    rag.load_retriever_from_faiss(str(ci.faiss_dir), k=3)
+    assert rag.invoke("Who is the author of review.txt?") == "Benchmark Bot"
+    assert rag.last_route["intent"] == "author" and rag.last_route["doc_ids"] == ["review.txt"]
+    assert rag.invoke("Summarize this document").startswith("Synthetic Report\n- ")
+    rag.invoke("Which regions had late deliveries?")
+    assert rag.last_route is None
+
+    ci.delete_document("review.txt")
+    assert DocumentSummaryStore(ci.faiss_dir).get("review.txt") is None
+
+
+def test_deleting_a_document_discards_its_pending_summary(tmp_path):
+    loader = FakeModelLoader(embedding_dim=32, llm_latency_s=0.3)
+    pages = [Document(page_content=f"Clause {i} of the lease.", metadata={"doc_id": f"{name}.pdf", "page": i})
+             for name in ("lease", "other") for i in range(2)]
+    discarded = stats["discarded"]
+    futures = schedule_summaries(tmp_path, pages, loader, {"workers": 1})
+    time.sleep(0.1)                                         # the LLM call is under way
+    forget_summary(tmp_path, "lease.pdf")
+    forget_summary(tmp_path, "other.pdf")
+    wait(futures, timeout=30)
+    assert DocumentSummaryStore(tmp_path).all() == {}
+    assert stats["discarded"] - discarded == sum(1 for f in futures if not f.cancelled()) >= 1
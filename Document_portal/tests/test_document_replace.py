@@ -0,0 +1,170 @@
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_ingestion.data_ingestion import ChatIngestor, FaissManager
+from src.document_ingestion.index_cache import get_shared_index
+from src.document_ingestion.index_store import SegmentedIndexStore
+from src.document_ingestion.index_writer import get_writer
+from src.document_ingestion.metadata_index import metadata_index
+
+
+def _manual(version, pages=30, edited=(), source="manual_v1.pdf"):
+    return [Document(page_content=f"Section {p}: torque settings for assembly step {p}"
+                                  + (f" revised in {version}" if p in edited else ""),
+                     metadata={"source": source, "page": p, "doc_id": "manual.pdf"})
+            for p in range(pages)]
+
+
+def test_replace_embeds_only_changed_chunks_and_masks_old_ones(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    assert fm.replace_source("manual.pdf", _manual("v1")) == {"added": 30, "kept": 0, "removed": 0}
+    shared = get_shared_index(tmp_path, HashingEmbeddings(dim=32))
+    before = shared.current()
+
+    writer = get_writer(tmp_path)
+    embedded = writer.stats["docs_added"]
+    result = fm.replace_source("manual.pdf", _manual("v2", edited={7}, source="manual_v2.pdf"))
+    assert result == {"added": 1, "kept": 29, "removed": 1}
+    assert writer.stats["docs_added"] - embedded == 1
+
+    for vs in (fm.vs, shared.current(), SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32), mmap=True)):
+        hits = vs.similarity_search("Section 7: torque settings for assembly step 7", k=3)
+        assert "revised in v2" in hits[0].page_content
+        assert not any(h.page_content.endswith("step 7") for h in hits)
+        assert {h.metadata["source"] for h in hits} == {"manual_v2.pdf"}   # kept chunks point at the new file
+    assert before.index.n_live == 31                                       # old snapshot untouched
+
+    fm.compact()
+    vs = SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32))
+    assert vs.index.ntotal == vs.index.n_live == 31
+
+
+def test_replace_leaves_the_previous_snapshot_untouched(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    fm.replace_source("manual.pdf", _manual("v1", pages=6))
+    shared = get_shared_index(tmp_path, HashingEmbeddings(dim=32))
+    before = shared.current()
+    old_pages = metadata_index(before).select({"page": [0, 0]})
+    query = "Section 3: torque settings for assembly step 3"
+
+    # same chunks under a new file name, pages 2 and 3 edited: kept chunks get rewritten metadata
+    fm.replace_source("manual.pdf", _manual("v2", pages=6, edited={2, 3}, source="manual_v2.pdf"))
+    after = shared.current()
+    assert after is not before and after.docstore is not before.docstore
+
+    hits = before.similarity_search(query, k=6)
+    assert len(hits) == 6 and {h.metadata["source"] for h in hits} == {"manual_v1.pdf"}
+    assert hits[0].page_content == query
+    assert list(metadata_index(before).select({"page": [0, 0]})) == list(old_pages)
+    assert {h.metadata["source"] for h in after.similarity_search(query, k=6)} == {"manual_v2.pdf"}
+
+
+def test_delete_keeps_chunks_shared_with_other_documents(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    shared_md = {"doc_id": "a.pdf", "source": "a.pdf", "page": 0,
+                 "also_in": [{"doc_id": "b.pdf", "source": "b.pdf", "page": 3}]}
+    fm.add_documents([
+        Document(page_content="Standard confidentiality disclaimer", metadata=shared_md),
+        Document(page_content="Only in a: payment terms", metadata={"doc_id": "a.pdf", "source": "a.pdf", "page": 1}),
+        Document(page_content="Only in b: delivery terms", metadata={"doc_id": "b.pdf", "source": "b.pdf", "page": 1}),
+    ])
+    assert fm.delete_source("a.pdf") == 1
+    assert fm.delete_source("a.pdf") == 0
+
+    hit = fm.vs.similarity_search("Standard confidentiality disclaimer", k=1)[0]
+    assert hit.metadata["doc_id"] == "b.pdf" and "also_in" not in hit.metadata
+    assert [d.page_content for d in fm.vs.similarity_search("payment terms", k=5)
+            if d.page_content.startswith("Only")] == ["Only in b: delivery terms"]
+
+    reopened = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    reopened.load_or_create()
+    assert reopened.vs.index.n_live == 3 and reopened.delete_source("b.pdf") == 2
+
+
+def test_reupload_with_replace_swaps_the_file(tmp_path):
+    class Upload:
+        name = "policy.txt"
+
+        def __init__(self, text):
+            self.text = text
+
+        def getbuffer(self):
+            return self.text.encode()
+
+    paragraphs = [f"Policy clause {i}: suppliers must report incidents within {i + 1} days." for i in range(6)]
+    ci = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"),
+                      session_id="replace", model_loader=FakeModelLoader(embedding_dim=32))
+    ci.built_retriever([Upload("\n\n".join(paragraphs))], chunk_size=80, chunk_overlap=0, replace=True)
+    paragraphs[2] = "Policy clause 2: suppliers must report incidents within 12 hours."
+    retriever = ci.built_retriever([Upload("\n\n".join(paragraphs))], chunk_size=80, chunk_overlap=0, replace=True)
+
+    assert retriever.vectorstore.index.n_live == 6
+    docs = retriever.vectorstore.similarity_search("clause 2 report incidents", k=6)
+    assert {d.metadata["doc_id"] for d in docs} == {"policy.txt"}
+    assert "12 hours" in " ".join(d.page_content for d in docs) and "within 3 days" not in " ".join(
+        d.page_content for d in docs)
+    assert ci.delete_document("policy.txt") == 6
+
+
+def test_deleted_document_can_be_ingested_again(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    assert fm.add_documents(_manual("v1", pages=3)) == 3
+    assert fm.delete_source("manual.pdf") == 3
+    assert fm.add_documents(_manual("v1", pages=3)) == 3
+    assert fm.vs.index.n_live == 4
+    assert len(fm.vs.docstore._dict) == 4                                  # tombstoned Documents are dropped
+
+    hit = fm.vs.similarity_search("Section 1: torque settings for assembly step 1", k=1)[0]
+    assert hit.metadata["doc_id"] == "manual.pdf"
+
+    reopened = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    reopened.load_or_create()
+    assert reopened.add_documents(_manual("v1", pages=3)) == 0
+
+
+def test_langchain_delete_works_on_layered_stores(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    fm.add_documents(_manual("v1", pages=4))
+    fm.compact()
+    fm.add_documents(_manual("v1", pages=2, source="other.pdf"))
+    vs = SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32))
+    by_page = {(d.metadata.get("source"), d.metadata.get("page")): _id for _id, d in vs.docstore._dict.items()}
+
+    gone = [by_page[("manual_v1.pdf", 1)], by_page[("other.pdf", 0)]]
+    assert vs.delete(gone)
+    assert vs.index.ntotal == len(vs.index_to_docstore_id) == 5
+    for page in (0, 2, 3):
+        query = f"Section {page}: torque settings for assembly step {page}"
+        assert vs.similarity_search(query, k=1)[0].page_content == query
+    hits = vs.similarity_search("Section 1: torque settings for assembly step 1", k=5)
+    assert len(hits) == 5 and [d.metadata["source"] for d in hits if d.metadata.get("page") == 1] == ["other.pdf"]
+
+
+def test_retriever_reflects_a_compaction_during_ingest(tmp_path, monkeypatch):
+    class Upload:
+        def __init__(self, name, text):
+            self.name, self.text = name, text
+
+        def getbuffer(self):
+            return self.text.encode()
+
+    ci = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"),
+                      session_id="compacted", model_loader=FakeModelLoader(embedding_dim=32))
+    ci.built_retriever([Upload("a.txt", "Clause one covers delivery.")], chunk_size=200, chunk_overlap=0)
+
+    add_documents = FaissManager.add_documents
+
+    def compact_first(fm, docs, refresh=True):
+        # another process compacts after this ingest loaded its snapshot, forcing a full reload
+        fm.compact()
+        return add_documents(fm, docs, refresh=refresh)
+
+    monkeypatch.setattr(FaissManager, "add_documents", compact_first)
+    retriever = ci.built_retriever([Upload("b.txt", "Clause two covers pricing.")], chunk_size=200, chunk_overlap=0)
+    docs = retriever.vectorstore.similarity_search("pricing", k=5)
+    assert "Clause two covers pricing." in [d.page_content for d in docs]
@@ -0,0 +1,110 @@
+import gzip
+import io
+import tarfile
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_cache import get_shared_index
+from src.document_ingestion.index_snapshot import export_snapshot, import_snapshot
+from src.document_ingestion.index_store import SegmentedIndexStore
+from utils.warmup import Warmup
+
+
+def _docs(doc_id, n):
+    return [Document(page_content=f"{doc_id} clause {i}: the {doc_id} terms cover item {i}.",
+                     metadata={"source": f"{doc_id}.pdf", "page": i, "doc_id": doc_id}) for i in range(n)]
+
+
+def _index(index_dir):
+    """A base (compacted), a segment on top and an ops file deleting one document."""
+    fm = FaissManager(index_dir, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=[d.page_content for d in _docs("lease", 6)],
+                      metadatas=[d.metadata for d in _docs("lease", 6)])
+    fm.add_documents(_docs("loan", 4))
+    fm.compact()
+    fm.add_documents(_docs("audit", 3))
+    fm.delete_source("loan")
+    return fm
+
+
+def _results(vs, query="lease clause 3"):
+    return [(d.page_content, round(float(s), 2)) for d, s in vs.similarity_search_with_score(query, k=5)]
+
+
+@pytest.mark.parametrize("float16", [False, True])
+def test_snapshot_round_trip_restores_base_segments_and_ops(tmp_path, float16):
+    fm = _index(tmp_path / "src")
+    manifest = fm.store.read_manifest()
+    assert manifest["base"] and manifest["segments"] and manifest["ops"]
+
+    header = fm.export_snapshot(tmp_path / "s.snapshot.tgz", float16=float16)
+    assert header["dim"] == 32 and header["embedding"] == manifest["embedding"]
+    assert header["counts"] == {"base_vectors": 10, "segment_vectors": 3, "segments": 1, "ops": 1}
+
+    restored = FaissManager.from_snapshot(tmp_path / "s.snapshot.tgz", tmp_path / "dst",
+                                          model_loader=FakeModelLoader(embedding_dim=32))
+    assert restored.vs.index.n_live == fm.vs.index.n_live == 9
+    assert _results(restored.vs) == _results(fm.vs)
+    SegmentedIndexStore(tmp_path / "dst").load(HashingEmbeddings(dim=32), mmap=True)     # base is a flat .faiss
+    assert not any(p.name.startswith(".dst") for p in tmp_path.iterdir())                # staging cleaned up
+
+
+def test_restoring_an_older_snapshot_of_the_same_index_reloads_everything(tmp_path):
+    fm = _index(tmp_path / "idx")
+    export_snapshot(tmp_path / "idx", tmp_path / "old.snapshot.tgz")
+    fm.add_documents(_docs("memo", 5))
+    shared = get_shared_index(tmp_path / "idx", HashingEmbeddings(dim=32))
+    assert shared.current().index.n_live == fm.vs.index.n_live == 14
+
+    import_snapshot(tmp_path / "old.snapshot.tgz", tmp_path / "idx", overwrite=True)
+    manifest = SegmentedIndexStore(tmp_path / "idx").read_manifest()
+    assert manifest["base"] == fm._snapshot["base"] and manifest["restore_id"]     # same base, fewer segments
+    assert shared.current().index.n_live == fm.refresh().index.n_live == 9
+    assert not any("memo" in d.page_content for d, _ in shared.current().similarity_search_with_score("memo", k=9))
+    assert fm.add_documents(_docs("memo", 5)) == 5              # the writer forgot the memo fingerprints
+    assert fm.delete_source("memo") == 5 and fm.vs.index.n_live == 9
+
+
+def test_float16_halves_vectors_and_bad_archives_are_refused(tmp_path):
+    fm = FaissManager(tmp_path / "src", FakeModelLoader(embedding_dim=256))
+    fm.load_or_create(texts=[d.page_content for d in _docs("lease", 200)])
+    fm.compact()
+    full = export_snapshot(tmp_path / "src", tmp_path / "f32.snapshot.tgz")
+    half = export_snapshot(tmp_path / "src", tmp_path / "f16.snapshot.tgz", float16=True)
+    assert half["bytes_in"] < 0.7 * full["bytes_in"]           # hashing vectors are sparse: compare raw sizes
+
+    with pytest.raises(FileExistsError):
+        import_snapshot(tmp_path / "f32.snapshot.tgz", tmp_path / "src")
+    with pytest.raises(ValueError, match="built with"):
+        import_snapshot(tmp_path / "f32.snapshot.tgz", tmp_path / "other", embedding={"backend": "x", "model": "y"})
+
+    # flip one byte of the vectors: the checksum trailer catches it and nothing is published
+    with gzip.open(tmp_path / "f32.snapshot.tgz", "rb") as f:
+        raw = bytearray(f.read())
+    raw[len(raw) // 2] ^= 0xFF
+    (tmp_path / "bad.snapshot.tgz").write_bytes(gzip.compress(bytes(raw)))
+    with pytest.raises((ValueError, tarfile.TarError)):
+        import_snapshot(tmp_path / "bad.snapshot.tgz", tmp_path / "bad")
+    assert not (tmp_path / "bad").exists() and [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+
+    with pytest.raises(ValueError, match="not an index snapshot"):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            tar.addfile(tarfile.TarInfo("manifest.json"), io.BytesIO())
+        (tmp_path / "plain.tgz").write_bytes(gzip.compress(buf.getvalue()))
+        import_snapshot(tmp_path / "plain.tgz", tmp_path / "plain")
+
+
+def test_warmup_restores_missing_indexes_from_snapshots(tmp_path):
+    _index(tmp_path / "src").export_snapshot(tmp_path / "snaps" / "session_a.snapshot.tgz")
+    loader = FakeModelLoader(embedding_dim=32)
+    loader.config = {**loader.config, "snapshots": {"restore_dir": str(tmp_path / "snaps")},
+                     "warmup": {**loader.config["warmup"], "modules": [], "preload_indexes": 2}}
+    report = Warmup(faiss_base=str(tmp_path / "base"), model_loader=loader).run()
+    assert report["restored_indexes"] == [str(tmp_path / "base" / "session_a")]
+    assert report["preloaded_indexes"] == [str(tmp_path / "base" / "session_a")] and "restore" in report["steps"]
+    assert np.isfinite(report["steps"]["restore"])
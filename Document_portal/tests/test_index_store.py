@@ -0,0 +1,169 @@
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_cache import SharedIndexRetriever, get_shared_index
+from src.document_ingestion.index_store import FingerprintSet, LayeredIndex, SegmentedIndexStore
+from src.document_ingestion.index_writer import get_writer, submit_documents
+
+
+def _docs(prefix, n, source="a.pdf"):
+    return [Document(page_content=f"{prefix} chunk {i} about supplier risk", metadata={"source": source, "page": i})
+            for i in range(n)]
+
+
+def test_adds_append_segments_and_reload(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"], metadatas=[{"source": "seed.txt"}])
+    assert fm.add_documents(_docs("first", 3)) == 3
+    assert fm.add_documents(_docs("first", 3)) == 0           # fingerprints dedupe re-uploads
+    assert fm.add_documents(_docs("second", 2)) == 2
+
+    store = SegmentedIndexStore(tmp_path)
+    assert store.segment_count() == 3
+    vs = store.load(HashingEmbeddings(dim=32))
+    assert vs.index.ntotal == 6
+    assert "second chunk 1" in vs.similarity_search("second chunk 1 supplier", k=1)[0].page_content
+
+    reopened = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    reopened.load_or_create()
+    assert reopened.add_documents(_docs("second", 2)) == 0
+
+
+def test_compaction_folds_segments_into_base(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    for i in range(4):
+        fm.add_documents(_docs(f"batch{i}", 2))
+    assert fm.compact() is not None
+    manifest = SegmentedIndexStore(tmp_path).read_manifest()
+    assert manifest["segments"] == [] and manifest["base"].startswith("index_g")
+    assert SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32)).index.ntotal == 9
+
+
+def test_legacy_save_local_directory_is_upgraded(tmp_path):
+    emb = HashingEmbeddings(dim=32)
+    FAISS.from_texts(["old chunk"], emb, metadatas=[{"source": "old.pdf"}]).save_local(str(tmp_path))
+    (tmp_path / "ingested_meta.json").write_text(json.dumps({"rows": {"old.pdf :: ": True}}))
+
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create()
+    fm.add_documents(_docs("new", 2))
+    assert fm.vs.index.ntotal == 3
+    assert SegmentedIndexStore(tmp_path).load(emb).index.ntotal == 3
+    assert "old.pdf :: " in FingerprintSet(tmp_path / "fingerprints.bin")
+
+
+def test_fingerprint_set_survives_torn_write(tmp_path):
+    fs = FingerprintSet(tmp_path / "fp.bin")
+    fs.add_many(["a", "b"])
+    with open(tmp_path / "fp.bin", "ab") as f:
+        f.write(b"\x01\x02\x03")
+    reloaded = FingerprintSet(tmp_path / "fp.bin")
+    assert "a" in reloaded and "b" in reloaded and "c" not in reloaded and len(reloaded) == 2
+    reloaded.add_many(["c", "d"])
+    assert (tmp_path / "fp.bin").stat().st_size == 32
+    assert [k in FingerprintSet(tmp_path / "fp.bin") for k in "abcd"] == [True] * 4
+
+
+def test_concurrent_adds_are_group_committed(tmp_path):
+    FaissManager(tmp_path, FakeModelLoader(embedding_dim=32)).load_or_create(texts=["seed"])
+
+    def upload(i):
+        fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+        fm.load_or_create()
+        return fm.add_documents(_docs(f"upload{i}", 3, source=f"u{i}.pdf"))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert sum(pool.map(upload, range(32))) == 96
+    writer = get_writer(tmp_path)
+    assert writer.stats["docs_added"] == 97 and writer.stats["commits"] < writer.stats["requests"]
+    assert SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32)).index.ntotal == 97
+
+
+def test_starting_a_writer_does_not_wait_on_a_held_directory_lock(tmp_path):
+    held, release = threading.Event(), threading.Event()
+
+    def hold(store):
+        with store.lock:
+            held.set()
+            release.wait(30)
+
+    busy = SegmentedIndexStore(tmp_path / "busy")
+    holder = threading.Thread(target=hold, args=(busy,))
+    holder.start()
+    held.wait(30)
+    embeddings = HashingEmbeddings(dim=32)
+    submitted = []
+    submitter = threading.Thread(target=lambda: submitted.extend(
+        submit_documents(tmp_path / name, _docs(name, 2), embeddings, lambda text, md: text)
+        for name in ("busy", "idle")))
+    submitter.start()
+    submitter.join(10)
+    try:
+        assert len(submitted) == 2
+        assert submitted[1].result(timeout=30) == 2 and not submitted[0].done()
+    finally:
+        release.set()
+        holder.join(30)
+    assert submitted[0].result(timeout=30) == 2
+
+
+def _process_upload(args):
+    index_dir, worker = args
+    fm = FaissManager(index_dir, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed"])
+    return sum(fm.add_documents(_docs(f"p{worker}b{b}", 4, source=f"p{worker}.pdf")) for b in range(5))
+
+
+def test_writers_in_separate_processes_do_not_lose_updates(tmp_path):
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        added = pool.map(_process_upload, [(tmp_path, 0), (tmp_path, 1)])
+    assert added == [20, 20]
+    assert SegmentedIndexStore(tmp_path).load(HashingEmbeddings(dim=32)).index.ntotal == 41
+
+
+def test_mmapped_base_matches_in_memory_load(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    fm.add_documents(_docs("base", 5))
+    fm.compact()
+    fm.add_documents(_docs("delta", 3, source="b.pdf"))
+
+    emb = HashingEmbeddings(dim=32)
+    mapped = SegmentedIndexStore(tmp_path).load(emb, mmap=True)
+    private = SegmentedIndexStore(tmp_path).load(emb)
+    assert isinstance(mapped.index, LayeredIndex) and mapped.index.delta.ntotal == 3
+    assert mapped.index.ntotal == private.index.ntotal == 9
+    for query in ("base chunk 2 supplier", "delta chunk 1 supplier"):
+        got = [d.page_content for d in mapped.similarity_search(query, k=4)]
+        assert got == [d.page_content for d in private.similarity_search(query, k=4)]
+
+
+def test_shared_index_hot_swaps_on_new_version(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    fm.add_documents(_docs("first", 2))
+    fm.compact()
+
+    shared = get_shared_index(tmp_path, HashingEmbeddings(dim=32))
+    before = shared.current()
+    assert shared.current() is before                          # unchanged VERSION: no reload
+
+    fm.add_documents(_docs("late", 2, source="late.pdf"))
+    after = shared.current()
+    assert after is not before and before.index.ntotal == 3 and after.index.ntotal == 5
+    assert after.index.base is before.index.base               # base stays mapped, only the delta grew
+    assert shared.stats == {"full_loads": 1, "incremental_swaps": 1}
+
+    retriever = SharedIndexRetriever(index=shared, search_kwargs={"k": 1})
+    assert retriever.invoke("late chunk 1 supplier")[0].metadata["source"] == "late.pdf"
+
+    fm.compact()
+    assert shared.current().index.ntotal == 5 and shared.stats["full_loads"] == 2
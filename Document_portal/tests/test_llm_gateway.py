@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fakes import ScriptedChatModel
+from utils.llm_gateway import (
+    BATCH, INTERACTIVE, GatewayChatModel, LLMGateway, RateLimiter, RateLimitTimeout, llm_priority,
+)
+
+
+def test_identical_inflight_prompts_share_one_provider_call():
+    inner = ScriptedChatModel(responses=["shared answer"], latency_s=0.2)
+    gateway = LLMGateway("fake")
+    llm = GatewayChatModel(inner=inner, gateway=gateway)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        answers = list(pool.map(lambda _: llm.invoke("same question").content, range(8)))
+    assert answers == ["shared answer"] * 8
+    assert inner.calls == 1 and gateway.stats["coalesced"] == 7
+
+    llm.invoke("another question")
+    assert inner.calls == 2                                   # nothing is cached after completion
+
+
+def test_interactive_calls_overtake_queued_batch_calls():
+    limiter = RateLimiter(requests_per_minute=600, burst_requests=1)   # one admission per 100 ms
+    limiter.acquire()
+    order = []
+
+    def call(name, priority):
+        limiter.acquire(priority=priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=call, args=(f"batch{i}", BATCH)) for i in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.03)
+    threads.append(threading.Thread(target=call, args=("interactive", INTERACTIVE)))
+    threads[-1].start()
+    for t in threads:
+        t.join()
+    assert order[0] == "interactive" and sorted(order[1:]) == ["batch0", "batch1", "batch2"]
+
+
+def test_token_bucket_times_out_and_priority_context_reaches_gateway():
+    limiter = RateLimiter(tokens_per_minute=60)               # 1 token per second
+    limiter.acquire(tokens=60)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(tokens=10, timeout=0.05)
+
+    seen = []
+    gateway = LLMGateway("fake")
+    gateway._admit_and_run = lambda tokens, fn, priority: seen.append(priority)
+    with llm_priority(INTERACTIVE):
+        gateway.call("k1", 1, lambda: None)
+    gateway.call("k2", 1, lambda: None)
+    assert seen == [INTERACTIVE, BATCH]
+
+
+def test_provider_429_pauses_the_limiter():
+    class RateLimited(Exception):
+        status_code = 429
+
+    limiter = RateLimiter(requests_per_minute=6000)
+    gateway = LLMGateway("fake", limiter)
+
+    def boom():
+        raise RateLimited("slow down")
+
+    with pytest.raises(RateLimited):
+        gateway.call("k", 1, boom)
+    assert gateway.stats["rate_limited"] == 1
+    assert limiter.acquire(timeout=5) >= 0.9                  # default Retry-After of 1 s honoured
+
+
+def test_model_loader_wraps_provider_client_against_stub(monkeypatch):
+    from benchmarks.stub_server import StubBehaviour, start_stub_server
+    from utils.model_loader import ModelLoader
+
+    server, provider, base_url = start_stub_server(StubBehaviour(latency_ms=200))
+    try:
+        for key, value in {"LLM_PROVIDER": "openai", "LLM_FALLBACK_PROVIDERS": "", "OPENAI_BASE_URL": base_url,
+                           "OPENAI_API_KEY": "stub", "GOOGLE_API_KEY": "stub", "GROQ_API_KEY": "stub"}.items():
+            monkeypatch.setenv(key, value)
+        llm = ModelLoader().load_llm()
+        assert isinstance(llm, GatewayChatModel)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            replies = list(pool.map(lambda _: llm.invoke("What changed in the contract?").content, range(4)))
+        assert len(set(replies)) == 1 and provider.counters["chat"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+from langchain_core.outputs import ChatResult
+
+from benchmarks.fakes import ScriptedChatModel
+from utils.llm_router import LLMRouter, ProviderHealth, RoutedChatModel
+
+
+class FailingChatModel(ScriptedChatModel):
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        raise ConnectionError("provider down")
+
+
+def _routed(models, **hedge):
+    router = LLMRouter(list(models), hedge={"enabled": True, "min_delay_ms": 50, "initial_delay_ms": 50, **hedge},
+                       breaker={"failure_threshold": 2, "cooldown_s": 0.2})
+    return RoutedChatModel(models=models, primary=list(models)[0], router=router), router
+
+
+def test_stalled_primary_is_hedged_to_second_provider():
+    slow = ScriptedChatModel(responses=["slow"], latency_s=1.0)
+    fast = ScriptedChatModel(responses=["fast"], latency_s=0.01)
+    llm, router = _routed({"groq": slow, "google": fast})
+    started = time.monotonic()
+    assert llm.invoke("question").content == "fast"
+    assert time.monotonic() - started < 0.5
+    assert router.stats["hedged"] == 1 and router.stats["hedge_wins"] == 1
+
+
+def test_fast_primary_is_not_hedged():
+    llm, router = _routed({"groq": ScriptedChatModel(responses=["primary"]), "google": ScriptedChatModel()})
+    assert llm.invoke("question").content == "primary"
+    assert router.stats["hedged"] == 0 and llm.models["google"].calls == 0
+
+
+def test_errors_fail_over_and_trip_the_breaker():
+    broken = FailingChatModel()
+    backup = ScriptedChatModel(responses=["backup"])
+    llm, router = _routed({"groq": broken, "google": backup}, enabled=False)
+    for _ in range(3):
+        assert llm.invoke("question").content == "backup"
+    assert broken.calls == 2 and router.health["groq"].state == "open"   # third call skipped the open breaker
+    assert router.stats["failovers"] == 2
+
+    time.sleep(0.25)                                                     # cooldown over: one half-open probe
+    assert llm.invoke("question").content == "backup"
+    assert broken.calls == 3 and router.health["groq"].state == "open"
+
+
+def test_all_providers_failing_raises_last_error():
+    llm, _ = _routed({"groq": FailingChatModel(), "google": FailingChatModel()})
+    with pytest.raises(ConnectionError):
+        llm.invoke("question")
+
+
+def test_hedge_delay_tracks_observed_p95():
+    router = LLMRouter(["groq"], hedge={"min_delay_ms": 10, "max_delay_ms": 1000, "min_samples": 5})
+    assert router.hedge_delay("groq") == 1.0                           # too few samples: initial delay, clamped
+    for latency in (0.1, 0.1, 0.1, 0.1, 0.5):
+        router.health["groq"].record_success(latency)
+    assert 0.1 < router.hedge_delay("groq") < 0.5
+
+
+def test_provider_health_half_open_admits_one_probe():
+    health = ProviderHealth("groq", failure_threshold=1, cooldown_s=0.0)
+    health.record_failure()
+    assert health.allow() and not health.allow()
+    health.record_success(0.2)
+    assert health.state == "closed" and health.allow()
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_store import SegmentedIndexStore
+from utils.batching import MicroBatcher
+from utils.local_embeddings import LocalEmbeddings
+
+
+class _CountingEncoder:
+    def __init__(self, dim=16, latency_s=0.02):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        time.sleep(self.latency_s)
+        return HashingEmbeddings(dim=self.dim).embed_documents(texts)
+
+
+def test_concurrent_queries_are_batched_onto_bounded_workers():
+    encoder = _CountingEncoder()
+    emb = LocalEmbeddings("fake-model", batch_size=32, max_wait_ms=10, workers=1, encoder=encoder)
+    queries = [f"question {i} about supplier risk" for i in range(40)]
+    with ThreadPoolExecutor(max_workers=40) as pool:
+        vectors = list(pool.map(emb.embed_query, queries))
+    assert len(encoder.batch_sizes) < 10 and max(encoder.batch_sizes) <= 32
+    expected = HashingEmbeddings(dim=16).embed_query(queries[7])
+    assert np.allclose(vectors[7], expected, atol=1e-6)
+
+
+def test_large_document_batch_is_split_and_reassembled_in_order():
+    encoder = _CountingEncoder(latency_s=0)
+    emb = LocalEmbeddings("fake-model", batch_size=8, workers=2, encoder=encoder)
+    texts = [f"chunk {i}" for i in range(21)]
+    out = emb.embed_documents(texts)
+    assert sorted(encoder.batch_sizes) == [5, 8, 8]
+    assert np.allclose(out, HashingEmbeddings(dim=16).embed_documents(texts), atol=1e-6)
+
+
+def test_batch_failure_reaches_every_caller():
+    def boom(items):
+        raise RuntimeError("model crashed")
+
+    with pytest.raises(RuntimeError, match="model crashed"):
+        MicroBatcher(boom).map(["a", "b"])
+
+
+def test_index_records_embedding_and_refuses_a_different_model(tmp_path):
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    assert SegmentedIndexStore(tmp_path).read_manifest()["embedding"] == {"backend": "hashing", "model": "hashing-32"}
+
+    other = FaissManager(tmp_path, FakeModelLoader(embedding_dim=32))
+    other.emb = LocalEmbeddings("fake-model", encoder=_CountingEncoder(dim=32, latency_s=0))
+    other.load_or_create()
+    with pytest.raises(ValueError, match=r"(built|written) with"):
+        other.add_documents([Document(page_content="mixed in", metadata={"source": "x.pdf"})])
+
+
+def test_only_the_selected_providers_need_api_keys(monkeypatch):
+    from utils.model_loader import ModelLoader
+
+    monkeypatch.setattr("utils.model_loader.load_dotenv", lambda *a, **k: None)
+    for key in ("GOOGLE_API_KEY", "GROQ_API_KEY", "OPENAI_API_KEY"):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "huggingface")
+    monkeypatch.setenv("LLM_PROVIDER", "groq")
+    monkeypatch.setenv("GROQ_API_KEY", "gsk-test")
+    assert ModelLoader().api_keys["GROQ_API_KEY"] == "gsk-test"          # no Google key needed
+
+    monkeypatch.setenv("LLM_PROVIDER", "google")
+    with pytest.raises(Exception):
+        ModelLoader()
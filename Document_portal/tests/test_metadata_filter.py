@@ -0,0 +1,50 @@
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_chat.query_scheduler import QueryScheduler
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_cache import SharedIndexRetriever, get_shared_index
+from src.document_ingestion.metadata_index import build_filter, matches
+
+
+def _fill(path):
+    fm = FaissManager(path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=["seed text"])
+    for n, (name, uploaded_at) in enumerate([("lease.pdf", 1000.0), ("loan.docx", 2000.0), ("memo.txt", 3000.0)]):
+        fm.add_documents([Document(page_content=f"{name} termination notice period clause {p}",
+                                   metadata={"doc_id": name, "source": f"/tmp/{n}", "page": p,
+                                             "file_type": name.rsplit(".", 1)[1], "uploaded_at": uploaded_at})
+                          for p in range(10)])
+    return fm
+
+
+def test_filtered_search_only_sees_matching_chunks(tmp_path):
+    fm = _fill(tmp_path)
+    flt = build_filter(sources="lease.pdf, memo.txt", page_from=3, page_to=4)
+    assert flt == {"doc_id": ["lease.pdf", "memo.txt"], "page": [2, 3]}
+    assert fm.metadata_index.select(flt).size == 4
+
+    retriever = SharedIndexRetriever(index=get_shared_index(tmp_path, HashingEmbeddings(dim=32)),
+                                     search_kwargs={"k": 10}, metadata_filter=flt)
+    docs = retriever.invoke("loan.docx termination notice period clause 7")
+    assert len(docs) == 4 and all(matches(d.metadata, flt) for d in docs)
+
+    newer = build_filter(file_types="docx,.TXT", uploaded_after="2500")
+    assert {d.metadata["doc_id"] for d in retriever.model_copy(update={"metadata_filter": newer}).invoke(
+        "termination notice")} == {"memo.txt"}
+
+    mmr = retriever.model_copy(update={"search_type": "mmr", "search_kwargs": {"k": 3, "fetch_k": 30}})
+    assert all(matches(d.metadata, flt) for d in mmr.invoke("termination notice"))
+
+
+def test_scheduler_groups_queries_by_filter_and_index_follows_deletes(tmp_path):
+    fm = _fill(tmp_path)
+    shared = get_shared_index(tmp_path, HashingEmbeddings(dim=32))
+    scheduler = QueryScheduler(HashingEmbeddings(dim=32), max_wait_ms=1)
+    only_loan = SharedIndexRetriever(index=shared, search_kwargs={"k": 3}, scheduler=scheduler,
+                                     metadata_filter=build_filter(sources="loan.docx"))
+    assert {d.metadata["doc_id"] for d in only_loan.invoke("lease.pdf termination clause 1")} == {"loan.docx"}
+
+    fm.delete_source("loan.docx")
+    assert only_loan.invoke("lease.pdf termination clause 1") == []
+    assert fm.metadata_index.select({"doc_id": ["memo.txt"]}).size == 10
@@ -0,0 +1,40 @@
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader
+from src.document_chat.mmr import mmr_select
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.data_ingestion import FaissManager
+
+
+def test_mmr_select_matches_langchain_reference():
+    rng = np.random.default_rng(0)
+    for lambda_mult in (0.0, 0.3, 0.5, 1.0):
+        query, candidates = rng.normal(size=16).astype(np.float32), rng.normal(size=(40, 16)).astype(np.float32)
+        expected = maximal_marginal_relevance(query, list(candidates), lambda_mult=lambda_mult, k=8)
+        assert mmr_select(query, candidates, 8, lambda_mult).tolist() == expected
+
+
+def test_chat_retriever_mmr_skips_near_duplicate_chunks(tmp_path):
+    # the same rent clause copied into five files, plus distinct clauses on other topics
+    docs = [Document(page_content="rent is due monthly on the first day, payable to the landlord",
+                     metadata={"source": f"copy{i}.pdf", "page": 0, "doc_id": f"copy{i}.pdf"}) for i in range(5)]
+    docs += [Document(page_content=text, metadata={"source": "lease.pdf", "page": i, "doc_id": "lease.pdf"})
+             for i, text in enumerate(["late rent incurs a fee after five days",
+                                       "the landlord repairs heating and plumbing",
+                                       "the deposit is returned within thirty days"])]
+    fm = FaissManager(tmp_path, FakeModelLoader(embedding_dim=64))
+    fm.load_or_create(texts=[d.page_content for d in docs], metadatas=[d.metadata for d in docs])
+
+    def retrieve(**kwargs):
+        rag = ConversationalRAG(session_id="s", model_loader=FakeModelLoader(embedding_dim=64))
+        return rag.load_retriever_from_faiss(str(tmp_path), k=3, **kwargs).invoke("when is rent due to the landlord")
+
+    plain = retrieve()
+    diverse = retrieve(search_type="mmr", fetch_k=8, lambda_mult=0.5)
+    assert len({d.page_content for d in plain}) == 1                  # three copies of one passage
+    assert len({d.page_content for d in diverse}) == 3
+    assert diverse[0].page_content == plain[0].page_content           # still starts with the best match
+    filtered = retrieve(search_type="mmr", fetch_k=8, metadata_filter={"doc_id": ["lease.pdf"]})
+    assert {d.metadata["doc_id"] for d in filtered} == {"lease.pdf"} and len(filtered) == 3
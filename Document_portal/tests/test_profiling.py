@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from utils.profiling import Profiler, ProfilingMiddleware, profiled, profiled_stream
+
+
+def _busy_parsing_pdf(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(i * i for i in range(500))
+
+
+def _app(profiler):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    @app.get("/slow")
+    @profiled
+    def slow():
+        _busy_parsing_pdf(0.15)
+        return {"ok": True}
+
+    @app.get("/stream")
+    @profiled
+    def stream():
+        def lines():
+            for i in range(3):
+                _busy_parsing_pdf(0.05)
+                yield f"{i}\n"
+        return StreamingResponse(profiled_stream(lines()), media_type="text/plain")
+
+    return app
+
+
+def test_request_with_token_is_profiled_to_speedscope(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path), token="s3cret", interval_ms=2)
+    client = TestClient(_app(profiler))
+
+    assert "x-profile-file" not in client.get("/slow").headers
+    assert "x-profile-file" not in client.get("/slow", headers={"X-Profile": "guess"}).headers
+    resp = client.get("/slow", headers={"X-Profile": "s3cret"})
+    name = resp.headers["x-profile-file"]
+
+    doc = json.loads((tmp_path / name).read_text())
+    frames = [f["name"] for f in doc["shared"]["frames"]]
+    (profile,) = doc["profiles"]
+    hot = sum(w for stack, w in zip(profile["samples"], profile["weights"])
+              if "_busy_parsing_pdf" in [frames[i] for i in stack])
+    assert "slow" in frames and hot >= 0.5 * profile["endValue"] > 0
+    assert profiler.stats["requests"] == 1 and profiler.stats["unauthorized"] == 1
+    assert [f.name for f in profiler.files()] == [name]
+
+
+def test_streamed_body_is_sampled_after_the_handler_returns(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path), token="s3cret", interval_ms=2, fmt="collapsed")
+    resp = TestClient(_app(profiler)).get("/stream", headers={"X-Profile": "s3cret"})
+    assert resp.text == "0\n1\n2\n"
+    lines = (tmp_path / resp.headers["x-profile-file"]).read_text().splitlines()
+    assert any("lines" in line and "_busy_parsing_pdf" in line for line in lines)
+    assert TestClient(_app(profiler)).get("/stream").text == "0\n1\n2\n"
+
+
+def test_disabled_profiler_leaves_requests_alone(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path))
+    resp = TestClient(_app(profiler)).get("/slow", headers={"X-Profile": ""})
+    assert resp.status_code == 200 and "x-profile-file" not in resp.headers
+    assert not profiler.enabled and profiler.files() == [] and profiler.stats["samples"] == 0
+
+
+def test_window_profiles_all_threads_as_capped_collapsed_stacks(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path), token="t", interval_ms=2, max_files=2, fmt="collapsed")
+    worker = threading.Thread(target=_busy_parsing_pdf, args=(1.0,), name="pdf-worker")
+    worker.start()
+    for _ in range(3):
+        profile = profiler.start("window", label="window", seconds=0.1)
+        while not profile.finished:
+            time.sleep(0.02)
+    worker.join()
+
+    files = profiler.files()
+    assert len(files) == 2 and profiler.stats["files_pruned"] == 1
+    lines = profile.path.read_text().splitlines()
+    assert any(line.startswith("pdf-worker;") and "_busy_parsing_pdf" in line for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profile.samples
+
+    profiler.max_file_bytes = 10                                  # too small for any stack: totals survive
+    assert profiler._write(profile).read_text() == f"(truncated) {profile.samples}\n"
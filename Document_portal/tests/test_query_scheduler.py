@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeModelLoader, HashingEmbeddings
+from src.document_chat.query_scheduler import QueryScheduler
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_cache import SharedIndexRetriever, get_shared_index
+
+
+class _CountingEmbeddings(HashingEmbeddings):
+    def __init__(self, dim=32):
+        super().__init__(dim=dim, latency_s=0.01)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+        return super().embed_documents(texts)
+
+
+def _index(path, topic):
+    fm = FaissManager(path, FakeModelLoader(embedding_dim=32))
+    fm.load_or_create(texts=[f"{topic} seed"])
+    fm.add_documents([Document(page_content=f"{topic} clause {i} on payment schedule {i}",
+                               metadata={"source": f"{topic}.pdf", "page": i}) for i in range(20)])
+    return fm.vs
+
+
+def test_concurrent_queries_share_embedding_calls_and_match_single_searches(tmp_path):
+    indexes = [_index(tmp_path / "a", "lease"), _index(tmp_path / "b", "loan")]
+    emb = _CountingEmbeddings()
+    scheduler = QueryScheduler(emb, max_batch_size=32, max_wait_ms=20, workers=1)
+    jobs = [(indexes[i % 2], f"clause {i % 10} payment schedule", 3 + i % 3) for i in range(40)]
+
+    with ThreadPoolExecutor(max_workers=40) as pool:
+        results = list(pool.map(lambda job: scheduler.search(*job), jobs))
+
+    for (vs, query, k), docs in zip(jobs, results):
+        assert [d.page_content for d in docs] == [d.page_content for d in vs.similarity_search(query, k=k)]
+    assert emb.calls < 10
+    assert scheduler.stats["queries"] == 40 and scheduler.stats["distinct_queries"] < 40
+    assert scheduler.stats["index_searches"] < 20
+
+
+def test_retriever_batches_similarity_and_mmr_but_not_thresholds(tmp_path):
+    _index(tmp_path, "lease")
+    shared = get_shared_index(tmp_path, HashingEmbeddings(dim=32))
+    scheduler = QueryScheduler(HashingEmbeddings(dim=32), max_wait_ms=1)
+
+    plain = SharedIndexRetriever(index=shared, search_kwargs={"k": 2}, scheduler=scheduler)
+    assert plain.invoke("lease clause 4 payment")[0].metadata["page"] == 4
+    mmr = SharedIndexRetriever(index=shared, search_type="mmr", search_kwargs={"k": 2}, scheduler=scheduler)
+    assert len(mmr.invoke("lease clause 4 payment")) == 2
+    threshold = SharedIndexRetriever(index=shared, search_type="similarity_score_threshold",
+                                     search_kwargs={"k": 2, "score_threshold": 0.0}, scheduler=scheduler)
+    threshold.invoke("lease clause 4 payment")
+    assert scheduler.stats["queries"] == 2 and scheduler.stats["mmr_queries"] == 1
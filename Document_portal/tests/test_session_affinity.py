@@ -0,0 +1,87 @@
+import httpx
+from fastapi import FastAPI, Form
+from fastapi.testclient import TestClient
+
+from utils.session_affinity import HashRing, SessionAffinityMiddleware, SessionRouter
+
+NODES = ["http://node-a", "http://node-b", "http://node-c"]
+
+
+def test_ring_moves_only_the_sessions_of_a_joining_or_leaving_node():
+    keys = [f"session_{i}" for i in range(4000)]
+    ring = HashRing(NODES)
+    before = {k: ring.owner(k) for k in keys}
+    shares = [sum(o == n for o in before.values()) / len(keys) for n in NODES]
+    assert max(shares) - min(shares) < 0.12
+
+    ring.add("http://node-d")
+    joined = {k: ring.owner(k) for k in keys}
+    moved = [k for k in keys if joined[k] != before[k]]
+    assert all(joined[k] == "http://node-d" for k in moved) and 0.15 < len(moved) / len(keys) < 0.35
+
+    ring.remove("http://node-b")
+    left = {k: ring.owner(k) for k in keys}
+    assert all(left[k] == joined[k] for k in keys if joined[k] != "http://node-b")
+
+
+class _Cluster(httpx.AsyncBaseTransport):
+    """Routes by host to in-process node apps; hosts in ``down`` refuse connections."""
+    def __init__(self):
+        self.apps = {}
+        self.down = set()
+
+    async def handle_async_request(self, request):
+        if request.url.host in self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        return await httpx.ASGITransport(app=self.apps[request.url.host]).handle_async_request(request)
+
+
+def _node(url, cluster, mode="forward"):
+    router = SessionRouter(NODES, self_url=url, mode=mode, transport=cluster, down_for_s=60)
+    app = FastAPI()
+    app.add_middleware(SessionAffinityMiddleware, router=router)
+
+    @app.post("/chat/query")
+    def query(question: str = Form(...), session_id: str = Form(None)):
+        return {"node": url, "session_id": session_id, "question": question}
+
+    @app.post("/chat/index")
+    def index(session_id: str = Form(None)):
+        return {"node": url, "session_id": session_id or router.new_session_id()}
+
+    cluster.apps[url.split("//")[1]] = app
+    return router, TestClient(app)
+
+
+def test_requests_reach_the_session_owner_from_any_node():
+    cluster = _Cluster()
+    nodes = {url: _node(url, cluster) for url in NODES}
+    router_a, client_a = nodes["http://node-a"]
+
+    # a new session is minted on the node that receives it, and owned by it
+    session = client_a.post("/chat/index", files={"files": ("a.txt", b"x")}).json()["session_id"]
+    assert router_a.ring.owner(session) == "http://node-a"
+
+    foreign = next(s for s in (f"s{i}" for i in range(100)) if router_a.ring.owner(s) == "http://node-c")
+    for url, (_, client) in nodes.items():
+        resp = client.post("/chat/query", data={"question": "rent?", "session_id": foreign})
+        assert resp.json() == {"node": "http://node-c", "session_id": foreign, "question": "rent?"}
+        assert resp.headers["x-served-by"] == "http://node-c"
+    resp = client_a.post("/chat/query", data={"question": "q"}, headers={"X-Session-Id": session})
+    assert resp.headers["x-served-by"] == "http://node-a" and router_a.stats["local"] >= 1
+
+    # the owner goes away: its sessions fall to the next node on the ring
+    cluster.down.add("node-c")
+    fallback = router_a.ring.owners(foreign)[1]
+    resp = client_a.post("/chat/query", data={"question": "q", "session_id": foreign})
+    assert resp.json()["node"] == fallback and router_a.stats["failovers"] == 1
+    assert router_a.report()["down"] == ["http://node-c"]
+
+
+def test_redirect_mode_points_the_client_at_the_owner():
+    cluster = _Cluster()
+    router, client = _node("http://node-a", cluster, mode="redirect")
+    foreign = next(s for s in (f"s{i}" for i in range(100)) if router.ring.owner(s) == "http://node-b")
+    resp = client.post("/chat/query?k=3", data={"question": "q", "session_id": foreign}, follow_redirects=False)
+    assert resp.status_code == 307 and resp.headers["location"] == "http://node-b/chat/query?k=3"
+    assert SessionRouter().enabled is False and SessionRouter().owns("anything")
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from model.models import Metadata, SummaryResponse
+from utils import structured_output
+from utils.llm_gateway import GatewayChatModel, LLMGateway
+from utils.structured_output import TolerantJsonParser, provider_output_kwargs, repair_json, structured_llm
+
+METADATA = {"Summary": ["Lease terms"], "Title": "Lease", "Author": ["A. Smith"], "DateCreated": "2024-01-01",
+            "LastModifiedDate": "2024-02-01", "Publisher": "Acme", "Language": "English",
+            "PageCount": 12, "SentimentTone": "Neutral"}
+
+
+@pytest.mark.parametrize("text, kinds", [
+    ("<think>the user wants JSON</think>\n```json\n" + json.dumps(METADATA) + "\n```", {"think_block"}),
+    ("Here is the result: " + json.dumps(METADATA) + " Hope this helps!", {"surrounding_text"}),
+    (json.dumps(METADATA).replace('"Title"', "Title").replace('"Neutral"}', "'Neutral',}"),
+     {"unquoted_keys", "single_quotes", "trailing_commas"}),
+    (json.dumps(METADATA).replace("12", "None").replace(', "Title"', ' "Title"'),
+     {"python_literals", "missing_commas"}),
+    (json.dumps(METADATA)[:-20], {"truncated"}),
+])
+def test_repairs_common_llm_defects_locally(text, kinds):
+    value, repairs = repair_json(text, expect="object")
+    assert kinds <= set(repairs)
+    assert value["Title"] == "Lease" and value["Summary"] == ["Lease terms"]
+
+
+def test_parser_validates_counts_fixups_and_unwraps_arrays():
+    structured_output.stats.update(calls=0, clean=0, repaired=0, failed=0, repairs={}, schemas={})
+    parser = TolerantJsonParser(pydantic_object=SummaryResponse)
+    assert parser.parse('[{"Page": "1", "Changes": "NO CHANGE"}]') == [{"Page": "1", "Changes": "NO CHANGE"}]
+    assert parser.parse('{"changes": [{"Page": "2", "Changes": "Rent "raised" to 1200"},]}') == [
+        {"Page": "2", "Changes": 'Rent "raised" to 1200'}]
+    assert parser.parse('{"changes": [{"Page": "3", "Changes": "NO CHANGE"}]}')[0]["Page"] == "3"
+    with pytest.raises(OutputParserException):
+        parser.parse('[{"Page": "4"}]')
+    assert structured_output.fixup_rates()["SummaryResponse"] == {"calls": 4, "repaired": 0.5, "failed": 0.25}
+    assert {"unescaped_quotes", "trailing_commas", "unwrapped"} <= set(structured_output.stats["repairs"])
+
+
+def test_schema_is_sent_to_the_provider_through_the_gateway():
+    seen = {}
+
+    class Recording(FakeListChatModel):
+        def _call(self, messages, stop=None, run_manager=None, **kwargs):
+            seen.update(kwargs)
+            return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    llm = GatewayChatModel(inner=Recording(responses=[json.dumps(METADATA)]), gateway=LLMGateway("fake", None),
+                           provider="openai", structured_output="json_schema")
+    chain = structured_llm(llm, Metadata) | TolerantJsonParser(pydantic_object=Metadata)
+    assert chain.invoke("analyze") == METADATA
+    assert seen["response_format"]["json_schema"]["name"] == "Metadata"
+
+    assert structured_llm(Recording(responses=["{}"]), Metadata).__class__ is Recording   # not gateway-wrapped
+    array = structured_output.json_schema_spec(SummaryResponse)
+    assert provider_output_kwargs("openai", "json_schema", array) == {}
+    assert provider_output_kwargs("google", "json_mode", array) == {"response_mime_type": "application/json"}
@@ -0,0 +1,51 @@
+import numpy as np
+
+from benchmarks.fakes import FakeModelLoader
+from src.document_analyzer.data_analysis import DocumentAnalyzer
+from src.document_analyzer.text_compressor import ExtractiveCompressor, textrank
+from utils.tokens import count_tokens
+
+TOPICS = ["solar capacity", "grid storage", "wind turbines", "transmission lines", "hydrogen pilots"]
+
+
+def _report(pages=60):
+    out = []
+    for p in range(pages):
+        lines = ["ACME ENERGY - CONFIDENTIAL", f"Annual Energy Outlook Report: Page {p + 1} of {pages}"]
+        if p == 0:
+            lines += ["Annual Energy Outlook 2024", "Prepared by Jane Doe and Omar Khan",
+                      "Published by Acme Research Press on March 3, 2024."]
+        for i in range(12):
+            topic = TOPICS[(p + i) % len(TOPICS)]
+            lines.append(f"In region {p}-{i} the {topic} programme improved {topic} output "
+                         f"while the wider energy transition kept costs of {topic} falling.")
+        out.append(f"\n--- Page {p + 1} ---\n" + "\n".join(lines))
+    return "\n".join(out)
+
+
+def test_compression_fits_budget_and_keeps_metadata_cues():
+    text = _report()
+    compressed = ExtractiveCompressor(token_budget=1500).compress(text)
+
+    assert count_tokens(text) > 5 * count_tokens(compressed) and count_tokens(compressed) <= 1500
+    assert "Prepared by Jane Doe and Omar Khan" in compressed
+    assert "Published by Acme Research Press on March 3, 2024." in compressed
+    assert "CONFIDENTIAL" not in compressed and "Page 7 of 60" not in compressed
+    assert compressed.startswith("[Extract of a 60-page document]")
+    assert ExtractiveCompressor(token_budget=10 ** 6).compress(text) is text
+
+
+def test_textrank_prefers_central_sentences():
+    sentences = [f"The lease sets rent, deposit and payment terms for tenant {i}." for i in range(6)]
+    sentences.append("Bananas are yellow.")
+    scores = textrank(sentences)
+    assert np.isclose(scores.sum(), 1.0) and scores.argmin() == 6
+
+
+def test_analyzer_sends_the_compressed_text():
+    analyzer = DocumentAnalyzer(model_loader=FakeModelLoader())
+    analyzer.compressor.token_budget = 1500
+    seen = []
+    analyzer.compressor.compress = lambda text, inner=analyzer.compressor.compress: seen.append(inner(text)) or seen[-1]
+    assert analyzer.analyze_document(_report())["Title"]
+    assert count_tokens(seen[0]) <= 1500
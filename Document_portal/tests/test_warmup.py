@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+import api.main
+from benchmarks.fakes import FakeModelLoader
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.index_cache import _SHARED
+from utils.warmup import Warmup
+
+
+def test_app_import_defers_provider_sdks_and_heavy_modules():
+    code = ("import sys, api.main; print(','.join(m for m in ('langchain_groq', 'langchain_openai', "
+            "'langchain_google_genai', 'pandas', 'fitz', 'faiss', 'langchain_community') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1:] in ([], [""])
+
+
+def test_ready_reports_503_until_warmup_preloaded_indexes(tmp_path, monkeypatch):
+    for session in ("old", "new"):
+        fm = FaissManager(tmp_path / session, FakeModelLoader(embedding_dim=32))
+        fm.load_or_create(texts=[f"{session} seed"])
+        fm.add_documents([Document(page_content=f"{session} clause", metadata={"source": "a.pdf", "page": 0})])
+    (tmp_path / "empty").mkdir()
+
+    loader = FakeModelLoader(embedding_dim=32)
+    loader.config = {**loader.config, "warmup": {**loader.config["warmup"], "preload_indexes": 1}}
+    warmup = Warmup(faiss_base=str(tmp_path), model_loader=loader)
+    monkeypatch.setattr(api.main, "warmup", warmup)
+    client = TestClient(api.main.app)
+    assert client.get("/ready").status_code == 503
+    assert client.get("/health").status_code == 200
+
+    report = warmup.run()
+    assert report["status"] == "ready" and set(report["steps"]) == {"imports", "clients", "indexes"}
+    assert report["preloaded_indexes"] == [str(tmp_path / "new")]
+    assert any(key[0] == str((tmp_path / "new").resolve()) for key in _SHARED)
+    assert client.get("/ready").json()["status"] == "ready"
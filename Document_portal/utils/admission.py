@@ -0,0 +1,280 @@
+"""
+Admission control for the LLM-bound endpoints.
+
+Each endpoint in ``admission.endpoints`` gets a concurrency limit, a bounded
+wait queue, a start deadline and a priority class; ``total_concurrency``
+caps all of them together. When a slot frees up, waiters are admitted in
+(priority, arrival) order, skipping those whose own endpoint is full, so
+interactive ``/chat/query`` overtakes queued ``/analyze`` and ``/compare``
+work while batch traffic still gets the slots interactive traffic leaves.
+
+A request is answered ``429`` with ``Retry-After`` instead of waiting when
+
+* its endpoint's queue is full,
+* the expected wait (queue ahead / concurrency x observed service time,
+  an EWMA per endpoint) exceeds its ``deadline_s``, or
+* it is still queued when ``deadline_s`` runs out.
+
+Waiting happens on the event loop, before the request reaches the
+threadpool, so queued requests hold no worker thread. ``report()`` gives
+per-endpoint in-flight count, queue depth, wait-time percentiles and
+rejections; ``GET /metrics`` serves it with the other load counters.
+"""
+from __future__ import annotations
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from logger.custom_logger import CustomLogger
+
+# same ordering as utils.llm_gateway.INTERACTIVE / BATCH (lower is served first)
+PRIORITY_CLASSES = {"interactive": 0, "batch": 10}
+
+
+class Rejected(Exception):
+    """Not admitted: ``reason`` is queue_full, deadline or timeout; retry after ``retry_after_s``."""
+    def __init__(self, endpoint: str, reason: str, retry_after_s: float):
+        super().__init__(f"{endpoint} is overloaded ({reason}); retry after {retry_after_s:.0f}s")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class _Endpoint:
+    def __init__(self, name: str, path: Optional[str] = None, max_concurrency: int = 4, max_queue: int = 16,
+                 deadline_s: float = 30.0, priority: str = "batch", service_s: Optional[float] = None):
+        self.name = name
+        self.path = path
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.deadline_s = float(deadline_s)
+        self.priority = PRIORITY_CLASSES.get(priority, priority) if isinstance(priority, str) else int(priority)
+        self.service_s = service_s          # EWMA of admitted requests' service time; None until observed
+        self.in_flight = 0
+        self.queued = 0
+        self.waits: deque = deque(maxlen=1024)
+        self.counts = {"admitted": 0, "completed": 0, "queue_full": 0, "deadline": 0, "timeout": 0}
+
+
+class _Waiter:
+    __slots__ = ("key", "endpoint", "loop", "future", "granted")
+
+    def __init__(self, key, endpoint: _Endpoint, loop, future):
+        self.key = key
+        self.endpoint = endpoint
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+def _grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    def __init__(self, endpoints: Dict[str, Dict[str, Any]], total_concurrency: Optional[int] = None,
+                 ewma_alpha: float = 0.2, enabled: bool = True):
+        self.log = CustomLogger().get_logger(__name__)
+        self.enabled = enabled
+        self.endpoints = {name: _Endpoint(name, **cfg) for name, cfg in endpoints.items()}
+        self.total_concurrency = int(total_concurrency) if total_concurrency else None
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = 0
+        self._waiters: List[_Waiter] = []         # sorted by (priority, arrival)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "AdmissionController":
+        cfg = (config or {}).get("admission", {}) or {}
+        return cls(cfg.get("endpoints", {}) or {}, total_concurrency=cfg.get("total_concurrency"),
+                   ewma_alpha=float(cfg.get("ewma_alpha", 0.2)), enabled=bool(cfg.get("enabled", True)))
+
+    def endpoint_for(self, path: str) -> Optional[str]:
+        for ep in self.endpoints.values():
+            if ep.path == path:
+                return ep.name
+        return None
+
+    # ---------- Scheduling (caller holds _lock) ----------
+
+    def _full(self) -> bool:
+        return self.total_concurrency is not None and self.in_flight >= self.total_concurrency
+
+    def _dispatch(self) -> List[_Waiter]:
+        granted = []
+        for w in list(self._waiters):
+            if self._full():
+                break
+            ep = w.endpoint
+            if ep.in_flight >= ep.max_concurrency:
+                continue
+            self._waiters.remove(w)
+            ep.queued -= 1
+            ep.in_flight += 1
+            self.in_flight += 1
+            w.granted = True
+            granted.append(w)
+        return granted
+
+    def _expected_wait(self, ep: _Endpoint, ahead: int) -> Optional[float]:
+        """Seconds until a request with ``ahead`` same-endpoint requests queued before it could start."""
+        if ep.service_s is None:
+            return None
+        return math.ceil((ahead + 1) / ep.max_concurrency) * ep.service_s
+
+    def _retry_after(self, ep: _Endpoint) -> float:
+        wait = self._expected_wait(ep, ep.queued)
+        return float(max(1, math.ceil(wait))) if wait is not None else 1.0
+
+    # ---------- Public ----------
+
+    async def acquire(self, name: str) -> float:
+        """Wait for a slot of endpoint ``name``; returns the seconds waited or raises ``Rejected``."""
+        ep = self.endpoints[name]
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with self._lock:
+            busy = ep.in_flight >= ep.max_concurrency or self._full() or bool(self._waiters)
+            if busy:
+                if ep.queued >= ep.max_queue:
+                    ep.counts["queue_full"] += 1
+                    raise Rejected(name, "queue_full", self._retry_after(ep))
+                expected = self._expected_wait(ep, ep.queued) if ep.in_flight >= ep.max_concurrency else None
+                if expected is not None and expected > ep.deadline_s:
+                    ep.counts["deadline"] += 1
+                    raise Rejected(name, "deadline", self._retry_after(ep))
+            waiter = _Waiter((ep.priority, next(self._seq)), ep, loop, loop.create_future())
+            bisect.insort(self._waiters, waiter)
+            ep.queued += 1
+            granted = self._dispatch()
+        for w in granted:
+            if w is not waiter:
+                w.loop.call_soon_threadsafe(_grant, w.future)
+        if not waiter.granted:
+            try:
+                await asyncio.wait({waiter.future}, timeout=max(0.0, ep.deadline_s - (time.monotonic() - started)))
+            except BaseException:           # client went away while queued
+                with self._lock:
+                    granted, queued = waiter.granted, waiter in self._waiters
+                    if queued:
+                        self._waiters.remove(waiter)
+                        ep.queued -= 1
+                if granted:
+                    self.release(name)
+                raise
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    ep.queued -= 1
+                    ep.counts["timeout"] += 1
+                    raise Rejected(name, "timeout", self._retry_after(ep))
+        waited = time.monotonic() - started
+        with self._lock:
+            ep.counts["admitted"] += 1
+            ep.waits.append(waited)
+        return waited
+
+    def release(self, name: str, service_s: Optional[float] = None):
+        ep = self.endpoints[name]
+        with self._lock:
+            ep.in_flight -= 1
+            self.in_flight -= 1
+            ep.counts["completed"] += 1
+            if service_s is not None:
+                ep.service_s = service_s if ep.service_s is None else \
+                    (1 - self.ewma_alpha) * ep.service_s + self.ewma_alpha * service_s
+            granted = self._dispatch()
+        for w in granted:
+            w.loop.call_soon_threadsafe(_grant, w.future)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"enabled": self.enabled, "in_flight": self.in_flight, "total_concurrency": self.total_concurrency,
+                   "queued": len(self._waiters), "endpoints": {}}
+            for name, ep in self.endpoints.items():
+                waits = sorted(ep.waits)
+                pct = lambda q: round(1000 * waits[min(len(waits) - 1, int(q * len(waits)))], 1) if waits else 0.0
+                out["endpoints"][name] = {
+                    "path": ep.path, "priority": ep.priority, "in_flight": ep.in_flight,
+                    "max_concurrency": ep.max_concurrency, "queued": ep.queued, "max_queue": ep.max_queue,
+                    "deadline_s": ep.deadline_s, "wait_p50_ms": pct(0.5), "wait_p95_ms": pct(0.95),
+                    "wait_max_ms": round(1000 * waits[-1], 1) if waits else 0.0,
+                    "service_ewma_ms": round(1000 * ep.service_s, 1) if ep.service_s is not None else None,
+                    **ep.counts}
+        return out
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an ``AdmissionController`` to the paths of its endpoints."""
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        name = self.controller.endpoint_for(scope["path"]) if scope["type"] == "http" else None
+        if name is None or not self.controller.enabled:
+            return await self.app(scope, receive, send)
+        try:
+            waited = await self.controller.acquire(name)
+        except Rejected as e:
+            self.controller.log.warning("Request rejected by admission control", endpoint=name, reason=e.reason,
+                                        retry_after_s=e.retry_after_s)
+            body = json.dumps({"detail": str(e), "endpoint": name, "reason": e.reason}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 429,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode()),
+                                    (b"retry-after", str(int(e.retry_after_s)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_wait(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-queue-wait-ms", str(round(1000 * waited)).encode())]}
+            await send(message)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_with_wait)
+        finally:
+            self.controller.release(name, time.monotonic() - started)
+
+
+def process_metrics(controller: Optional[AdmissionController] = None) -> Dict[str, Any]:
+    """Admission queues plus the counters of the gateways, router, batchers and writers loaded in this process."""
+    out: Dict[str, Any] = {}
+    if controller is not None:
+        out["admission"] = controller.report()
+    gateway = sys.modules.get("utils.llm_gateway")
+    if gateway is not None:
+        out["llm_gateways"] = {name: dict(gw.stats) for name, gw in list(gateway._GATEWAYS.items())}
+    router = sys.modules.get("utils.llm_router")
+    if router is not None and router._ROUTER is not None:
+        out["llm_router"] = router._ROUTER.snapshot()
+    scheduler = sys.modules.get("src.document_chat.query_scheduler")
+    if scheduler is not None:
+        out["query_schedulers"] = {"/".join(map(str, key)): {**s.stats, "batcher": dict(s.batcher.stats)}
+                                   for key, s in list(scheduler._SCHEDULERS.items())}
+    local = sys.modules.get("utils.local_embeddings")
+    if local is not None:
+        out["embedding_batchers"] = {emb.model_name: dict(emb.batcher.stats)
+                                     for emb in list(local._LOCAL_MODELS.values())}
+    writer = sys.modules.get("src.document_ingestion.index_writer")
+    if writer is not None:
+        out["index_writers"] = {path: dict(w.stats) for path, w in list(writer._WRITERS.items())}
+    structured = sys.modules.get("utils.structured_output")
+    if structured is not None:
+        out["structured_output"] = structured.fixup_rates()
+    return out
@@ -0,0 +1,127 @@
+"""
+Dynamic micro-batching for expensive per-batch calls (model inference, embedding requests).
+
+Callers ``submit`` a list of items and get a Future for the matching list of
+results. A dispatcher thread packs whatever is pending into batches of up to
+``max_batch_size`` items, waiting at most ``max_wait_ms`` for a batch to fill,
+and runs them on a bounded pool of ``workers`` threads. While every worker is
+busy the dispatcher keeps accumulating, so batches grow with load.
+"""
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Sequence, Tuple
+
+from logger.custom_logger import CustomLogger
+
+
+@dataclass
+class _Request:
+    items: List[Any]
+    future: Future = field(default_factory=Future)
+    results: List[Any] = field(default_factory=list)
+    remaining: int = 0
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = 64,
+                 max_wait_ms: float = 5.0, workers: int = 1, name: str = "batcher"):
+        self.log = CustomLogger().get_logger(__name__)
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.stats = {"requests": 0, "items": 0, "batches": 0}
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._slots = threading.Semaphore(max(1, int(workers)))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix=f"{name}-worker")
+        self._stats_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, name=f"{name}-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    # ---------- Public API ----------
+
+    def submit(self, items: Sequence[Any]) -> Future:
+        req = _Request(list(items))
+        req.results = [None] * len(req.items)
+        req.remaining = len(req.items)
+        if not req.items:
+            req.future.set_result([])
+            return req.future
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["items"] += len(req.items)
+        self._queue.put(req)
+        return req.future
+
+    def map(self, items: Sequence[Any]) -> List[Any]:
+        return self.submit(items).result()
+
+    # ---------- Internals ----------
+
+    def _dispatch(self):
+        carry: List[Tuple[_Request, int]] = []          # (request, next item offset) not yet batched
+        while True:
+            if not carry:
+                req = self._queue.get()
+                carry.append((req, 0))
+            self._slots.acquire()                        # wait for a free worker; pending work keeps piling up
+            deadline = time.monotonic() + self.max_wait_s
+            while self._pending(carry) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    carry.append((self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait(), 0))
+                except queue.Empty:
+                    break
+            batch, carry = self._take(carry)
+            self._pool.submit(self._run, batch)
+
+    @staticmethod
+    def _pending(carry: List[Tuple[_Request, int]]) -> int:
+        return sum(len(req.items) - offset for req, offset in carry)
+
+    def _take(self, carry: List[Tuple[_Request, int]]):
+        """Cut up to ``max_batch_size`` items off the front; a large request may span batches."""
+        batch: List[Tuple[_Request, int, int]] = []      # (request, start, end)
+        room = self.max_batch_size
+        rest: List[Tuple[_Request, int]] = []
+        for req, offset in carry:
+            if room == 0:
+                rest.append((req, offset))
+                continue
+            end = min(len(req.items), offset + room)
+            batch.append((req, offset, end))
+            room -= end - offset
+            if end < len(req.items):
+                rest.append((req, end))
+        return batch, rest
+
+    def _run(self, batch: List[Tuple[_Request, int, int]]):
+        try:
+            items = [item for req, start, end in batch for item in req.items[start:end]]
+            try:
+                out = list(self.fn(items))
+                if len(out) != len(items):
+                    raise RuntimeError(f"{self.name}: batch function returned {len(out)} results for {len(items)} items")
+            except Exception as e:
+                self.log.error("Batch failed", batcher=self.name, size=len(items), error=str(e))
+                for req, _, _ in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                return
+            with self._stats_lock:
+                self.stats["batches"] += 1
+            pos = 0
+            for req, start, end in batch:
+                req.results[start:end] = out[pos:pos + end - start]
+                pos += end - start
+                with self._stats_lock:
+                    req.remaining -= end - start
+                    finished = req.remaining == 0
+                if finished and not req.future.done():
+                    req.future.set_result(req.results)
+        finally:
+            self._slots.release()
@@ -3,9 +3,7 @@ from pathlib import Path
 from typing import Iterable, List
 from fastapi import UploadFile
 
-import fitz  # PyMuPDF
-from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_core.documents import Document
 from logger.custom_logger import CustomLogger
 from exceptions.custom_exception import DocumentPortalException
 
@@ -18,6 +16,8 @@ def load_documents(paths: Iterable[Path]) -> List[Document]:
     """Load docs using appropriate loader based on extension."""
     docs: List[Document] = []
     try:
+        # langchain_community's loader package is slow to import; only ingestion needs it
+        from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
         log = CustomLogger().get_logger(__name__)
         for p in paths:
             ext = p.suffix.lower()
@@ -4,7 +4,7 @@ import re
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional
 from logger.custom_logger import CustomLogger
 from exceptions.custom_exception import DocumentPortalException
 
@@ -17,8 +17,13 @@ def generate_session_id(prefix: str = "session") -> str:
     ist = ZoneInfo("Asia/Kolkata")
     return f"{prefix}_{datetime.now(ist).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
-    """Save uploaded files (Streamlit-like) and return local paths."""
+def save_uploaded_files(uploaded_files: Iterable, target_dir: Path,
+                        names: Optional[Dict[str, str]] = None) -> List[Path]:
+    """
+    Save uploaded files (Streamlit-like) and return local paths. Files are
+    stored under random names; pass ``names`` to get saved path -> uploaded
+    file name back (the stable document id used for replace/delete).
+    """
     try:
         log = CustomLogger().get_logger(__name__)
         target_dir.mkdir(parents=True, exist_ok=True)
@@ -40,6 +45,8 @@ def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path
                 else:
                     f.write(uf.getbuffer())  # fallback
             saved.append(out)
+            if names is not None:
+                names[str(out)] = Path(name).name
             log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
         return saved
     except Exception as e:
@@ -0,0 +1,280 @@
+"""
+Process-wide gateway in front of the LLM provider clients.
+
+``ModelLoader.load_llm`` wraps the provider client in a ``GatewayChatModel``;
+every call then goes through the provider's ``LLMGateway``:
+
+* single-flight: identical prompts already in flight share one provider call,
+* rate limiting: request and token buckets per provider (``llm.<provider>.rate_limit``),
+* priority: calls queued at the limiter are served lowest ``priority`` first, so
+  interactive traffic (``with llm_priority(INTERACTIVE): ...``) overtakes batch work.
+"""
+from __future__ import annotations
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+
+from logger.custom_logger import CustomLogger
+from utils.structured_output import provider_output_kwargs
+from utils.tokens import count_tokens
+
+INTERACTIVE = 0
+BATCH = 10
+
+_PRIORITY: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=BATCH)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Run LLM calls made inside the block (and in LangChain's worker threads) at ``priority``."""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class RateLimitTimeout(TimeoutError):
+    """A call waited longer than ``max_queue_wait_s`` for its provider's rate limit."""
+
+
+class RateLimiter:
+    """
+    Request + token buckets for one provider, refilled continuously at the
+    configured per-minute rates. Waiters are admitted strictly in
+    (priority, arrival) order.
+    """
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 burst_requests: Optional[float] = None):
+        self.req_rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.tok_rate = tokens_per_minute / 60.0 if tokens_per_minute else None
+        self.req_capacity = float(burst_requests or requests_per_minute or 0)
+        self.tok_capacity = float(tokens_per_minute or 0)
+        self._req = self.req_capacity
+        self._tok = self.tok_capacity
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        elapsed = now - self._stamp
+        self._stamp = now
+        if self.req_rate:
+            self._req = min(self.req_capacity, self._req + elapsed * self.req_rate)
+        if self.tok_rate:
+            self._tok = min(self.tok_capacity, self._tok + elapsed * self.tok_rate)
+
+    def _delay(self, tokens: float, now: float) -> float:
+        """Seconds until the head waiter could be admitted (0 = now)."""
+        delay = max(0.0, self._blocked_until - now)
+        if self.req_rate and self._req < 1:
+            delay = max(delay, (1 - self._req) / self.req_rate)
+        if self.tok_rate and self._tok < tokens:
+            delay = max(delay, (tokens - self._tok) / self.tok_rate)
+        return delay
+
+    def acquire(self, tokens: float = 0, priority: int = BATCH, timeout: Optional[float] = None) -> float:
+        """Block until admitted; returns the seconds spent waiting."""
+        tokens = min(float(tokens), self.tok_capacity) if self.tok_rate else 0.0
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._delay(tokens, now) if self._waiters[0] == entry else None
+                    if delay == 0:
+                        heapq.heappop(self._waiters)
+                        if self.req_rate:
+                            self._req -= 1
+                        self._tok -= tokens
+                        self._cond.notify_all()
+                        return now - started
+                    if deadline is not None and now >= deadline:
+                        raise RateLimitTimeout(f"rate limit wait exceeded {timeout}s")
+                    waits = [w for w in (delay, None if deadline is None else deadline - now) if w is not None]
+                    self._cond.wait(min(waits) if waits else None)
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def charge(self, tokens: float):
+        """Account for tokens only known after the call (completion); the bucket may go negative."""
+        if self.tok_rate and tokens > 0:
+            with self._cond:
+                self._refill(time.monotonic())
+                self._tok -= tokens
+
+    def penalize(self, retry_after_s: float):
+        """The provider answered 429: admit nobody for ``retry_after_s``."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after_s)
+            self._cond.notify_all()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share the first caller's result (or exception)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            return future.result(), True
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result(), False
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429 or "RateLimit" in type(e).__name__ or "ResourceExhausted" in type(e).__name__
+
+
+def _retry_after(e: Exception, default: float = 1.0) -> float:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or default)
+    except (TypeError, ValueError):
+        return default
+
+
+class LLMGateway:
+    def __init__(self, name: str, limiter: Optional[RateLimiter] = None, coalesce: bool = True,
+                 max_queue_wait_s: Optional[float] = 60.0):
+        self.log = CustomLogger().get_logger(__name__)
+        self.name = name
+        self.limiter = limiter
+        self.coalesce = coalesce
+        self.max_queue_wait_s = max_queue_wait_s
+        self.singleflight = SingleFlight()
+        self.stats = {"calls": 0, "coalesced": 0, "provider_calls": 0, "rate_limited": 0, "queue_wait_s": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, value: float = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def call(self, key: str, prompt_tokens: int, fn: Callable[[], ChatResult],
+             priority: Optional[int] = None) -> ChatResult:
+        self._count("calls")
+        priority = _PRIORITY.get() if priority is None else priority
+        if not self.coalesce:
+            return self._admit_and_run(prompt_tokens, fn, priority)
+        result, shared = self.singleflight.do(key, lambda: self._admit_and_run(prompt_tokens, fn, priority))
+        if shared:
+            self._count("coalesced")
+        return result
+
+    def _admit_and_run(self, prompt_tokens: int, fn: Callable[[], ChatResult], priority: int) -> ChatResult:
+        if self.limiter is not None:
+            waited = self.limiter.acquire(prompt_tokens, priority=priority, timeout=self.max_queue_wait_s)
+            self._count("queue_wait_s", waited)
+        self._count("provider_calls")
+        try:
+            result = fn()
+        except Exception as e:
+            if self.limiter is not None and _is_rate_limit(e):
+                self._count("rate_limited")
+                self.limiter.penalize(_retry_after(e))
+                self.log.warning("Provider rate limited", provider=self.name, error=str(e))
+            raise
+        if self.limiter is not None:
+            self.limiter.charge(_completion_tokens(result))
+        return result
+
+
+def _completion_tokens(result: ChatResult) -> int:
+    total = 0
+    for gen in result.generations:
+        usage = getattr(gen.message, "usage_metadata", None) or {}
+        total += usage.get("output_tokens") or count_tokens(gen.text or "")
+    return total
+
+
+def prompt_key(model: BaseChatModel, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+    payload = json.dumps([model._llm_type, model._identifying_params, [(m.type, m.content) for m in messages],
+                          stop, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Chat model that routes every generation of ``inner`` through an ``LLMGateway``.
+    A ``json_schema`` call kwarg (``utils.structured_output.structured_llm``)
+    becomes the provider's own JSON/schema option per ``structured_output``.
+    """
+    inner: BaseChatModel
+    gateway: Any
+    provider: Optional[str] = None
+    structured_output: Optional[str] = None
+
+    @property
+    def accepts_json_schema(self) -> bool:
+        return True
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway:{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"gateway": self.gateway.name, **self.inner._identifying_params}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        spec = kwargs.pop("json_schema", None)
+        if spec:
+            kwargs.update(provider_output_kwargs(self.provider, self.structured_output, spec))
+        tokens = sum(count_tokens(str(m.content)) for m in messages)
+        return self.gateway.call(prompt_key(self.inner, messages, stop, kwargs), tokens,
+                                 lambda: self.inner._generate(messages, stop=stop, **kwargs))
+
+
+_GATEWAYS: Dict[str, LLMGateway] = {}
+_GATEWAYS_GUARD = threading.Lock()
+
+
+def get_gateway(provider_key: str, llm_config: Dict[str, Any], gateway_config: Optional[Dict[str, Any]] = None) -> LLMGateway:
+    """The process-wide gateway for one ``llm.<provider_key>`` block, created on first use."""
+    with _GATEWAYS_GUARD:
+        gateway = _GATEWAYS.get(provider_key)
+        if gateway is None:
+            gateway_config = gateway_config or {}
+            limits = llm_config.get("rate_limit") or {}
+            limiter = RateLimiter(limits.get("requests_per_minute"), limits.get("tokens_per_minute"),
+                                  limits.get("burst_requests")) if limits else None
+            gateway = LLMGateway(provider_key, limiter, coalesce=gateway_config.get("coalesce", True),
+                                 max_queue_wait_s=gateway_config.get("max_queue_wait_s", 60))
+            _GATEWAYS[provider_key] = gateway
+        return gateway
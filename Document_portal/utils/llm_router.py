@@ -0,0 +1,239 @@
+"""
+Latency-aware routing across the configured LLM providers.
+
+``RoutedChatModel`` sends each call to the primary provider (``LLM_PROVIDER``).
+With ``hedge.enabled`` (off by default: it can double provider spend), if no
+answer arrives within that provider's observed p95 latency (clamped to
+``hedge.min_delay_ms``..``hedge.max_delay_ms``), a hedged duplicate goes to
+the next healthy provider and the first valid response wins. Errors fail over
+to the next provider immediately. Each provider has a circuit breaker: after
+``failure_threshold`` consecutive failures it is skipped for ``cooldown_s``,
+then a single probe call decides whether it closes again.
+
+Health is tracked per process and shared by every model the loader hands out.
+"""
+from __future__ import annotations
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+
+from logger.custom_logger import CustomLogger
+
+
+class ProviderHealth:
+    """Rolling latency/error window plus a closed -> open -> half-open circuit breaker."""
+    def __init__(self, name: str, window: int = 100, failure_threshold: int = 5, cooldown_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a call be sent now? In half-open state only one probe is let through."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"
+                self._probe_inflight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_inflight:
+                self._probe_inflight = True
+                return True
+            return False
+
+    def record_success(self, latency_s: float):
+        with self._lock:
+            self.latencies.append(latency_s)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self._probe_inflight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+            self._probe_inflight = False
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self.latencies)
+        return float(np.quantile(samples, q)) if samples else None
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.latency_quantile(0.95)
+        return {"state": self.state, "error_rate": round(self.error_rate, 4), "samples": len(self.latencies),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1)}
+
+
+def _valid(result: ChatResult) -> bool:
+    return any(g.text.strip() or getattr(g.message, "tool_calls", None) for g in result.generations)
+
+
+class LLMRouter:
+    def __init__(self, providers: List[str], hedge: Optional[Dict[str, Any]] = None,
+                 breaker: Optional[Dict[str, Any]] = None, max_workers: int = 32):
+        self.log = CustomLogger().get_logger(__name__)
+        hedge = hedge or {}
+        breaker = breaker or {}
+        self.providers = list(providers)
+        self.hedge_enabled = bool(hedge.get("enabled", False))
+        self.hedge_quantile = float(hedge.get("quantile", 0.95))
+        self.min_delay_s = float(hedge.get("min_delay_ms", 300)) / 1000.0
+        self.max_delay_s = float(hedge.get("max_delay_ms", 5000)) / 1000.0
+        self.initial_delay_s = float(hedge.get("initial_delay_ms", 2000)) / 1000.0
+        self.min_samples = int(hedge.get("min_samples", 20))
+        self.max_hedges = int(hedge.get("max_hedges", 1))
+        self.health = {name: ProviderHealth(name, window=int(breaker.get("window", 100)),
+                                            failure_threshold=int(breaker.get("failure_threshold", 5)),
+                                            cooldown_s=float(breaker.get("cooldown_s", 30)))
+                       for name in self.providers}
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-route")
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self, name: str) -> float:
+        health = self.health[name]
+        q = health.latency_quantile(self.hedge_quantile) if len(health.latencies) >= self.min_samples else None
+        return min(self.max_delay_s, max(self.min_delay_s, self.initial_delay_s if q is None else q))
+
+    def _order(self, primary: str, available: List[str]) -> List[str]:
+        """Primary first, then the others by error rate and tail latency."""
+        others = [n for n in self.providers if n != primary and n in available]
+        others.sort(key=lambda n: (self.health[n].error_rate, self.health[n].latency_quantile(0.95) or float("inf")))
+        return ([primary] if primary in available else []) + others
+
+    def _timed(self, name: str, call: Callable[[str], ChatResult]) -> ChatResult:
+        started = time.monotonic()
+        try:
+            result = call(name)
+        except Exception:
+            self.health[name].record_failure()
+            raise
+        if _valid(result):
+            self.health[name].record_success(time.monotonic() - started)
+        else:
+            self.health[name].record_failure()
+        return result
+
+    def generate(self, primary: str, available: List[str], call: Callable[[str], ChatResult]) -> ChatResult:
+        self._count("calls")
+        remaining = self._order(primary, available)
+        pending: Dict[Future, str] = {}
+        errors: List[BaseException] = []
+        fallback: Optional[ChatResult] = None
+        hedges = 0
+        hedge_at: Optional[float] = None
+
+        def launch(force: bool = False) -> Optional[str]:
+            nonlocal hedge_at
+            while remaining:
+                name = remaining.pop(0)
+                if force or self.health[name].allow():
+                    ctx = contextvars.copy_context()    # keep llm_priority for the gateway
+                    pending[self._pool.submit(ctx.run, self._timed, name, call)] = name
+                    hedge_at = time.monotonic() + self.hedge_delay(name)
+                    return name
+            return None
+
+        if launch() is None:
+            # every breaker is open: try the primary anyway rather than fail outright
+            remaining.append(primary)
+            launch(force=True)
+
+        while pending:
+            can_hedge = self.hedge_enabled and hedges < self.max_hedges and remaining
+            timeout = max(0.0, hedge_at - time.monotonic()) if can_hedge and hedge_at is not None else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                name = launch()
+                if name is not None:
+                    hedges += 1
+                    self._count("hedged")
+                    self.log.info("Hedging LLM call", provider=name, primary=primary)
+                continue
+            for fut in done:
+                name = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    errors.append(e)
+                    self.log.warning("LLM provider failed", provider=name, error=str(e))
+                    continue
+                if _valid(result):
+                    if hedges and name != primary:
+                        self._count("hedge_wins")
+                    return result
+                fallback = fallback or result
+            if not pending and launch() is not None:
+                self._count("failovers")
+        if fallback is not None:
+            return fallback
+        self._count("errors")
+        raise errors[-1] if errors else RuntimeError("no LLM provider available")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"stats": dict(self.stats), "providers": {n: h.snapshot() for n, h in self.health.items()}}
+
+
+class RoutedChatModel(BaseChatModel):
+    """One chat model per provider behind an ``LLMRouter``; ``primary`` is tried first."""
+    models: Dict[str, BaseChatModel]
+    primary: str
+    router: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def accepts_json_schema(self) -> bool:
+        return all(getattr(m, "accepts_json_schema", False) for m in self.models.values())
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"primary": self.primary, "providers": sorted(self.models)}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return self.router.generate(self.primary, list(self.models),
+                                    lambda name: self.models[name]._generate(messages, stop=stop, **kwargs))
+
+
+_ROUTER: Optional[LLMRouter] = None
+_ROUTER_GUARD = threading.Lock()
+
+
+def get_router(routing_config: Dict[str, Any], providers: List[str]) -> LLMRouter:
+    """The process-wide router; health survives across the per-request ModelLoader instances."""
+    global _ROUTER
+    with _ROUTER_GUARD:
+        if _ROUTER is None or _ROUTER.providers != list(providers):
+            _ROUTER = LLMRouter(providers, hedge=routing_config.get("hedge"), breaker=routing_config.get("breaker"))
+        return _ROUTER
@@ -0,0 +1,116 @@
+"""
+Local CPU embedding backend (sentence-transformers), selected with
+EMBEDDING_PROVIDER=huggingface.
+
+The model is loaded once per process and shared. Every ``embed_documents`` /
+``embed_query`` call goes through one ``MicroBatcher``, so concurrent uploads
+and queries are packed into batches and run on a bounded pool of inference
+threads. ``quantize: true`` applies PyTorch dynamic int8 quantization to the
+model's Linear layers (smaller, ~2x faster on CPU, slight accuracy loss).
+
+sentence-transformers (and torch) are optional: they are imported only when
+this backend is first used.
+"""
+from __future__ import annotations
+import importlib.util
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+from utils.batching import MicroBatcher
+
+
+def _load_sentence_transformer(model_name: str, device: str, quantize: bool):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise ImportError("The local embedding backend needs sentence-transformers: "
+                          "pip install sentence-transformers") from e
+    model = SentenceTransformer(model_name, device=device)
+    if quantize:
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Batched local embeddings. ``encoder`` (texts -> 2-D array) replaces the
+    sentence-transformers model, e.g. in tests.
+    """
+    backend = "local"
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: str = "cpu", quantize: bool = False,
+                 batch_size: int = 64, max_wait_ms: float = 5.0, workers: int = 2, normalize: bool = True,
+                 encoder: Optional[Callable[[List[str]], Any]] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.model_name = model_name
+        self.device = device
+        self.quantize = quantize
+        self.normalize = normalize
+        self._encoder = encoder
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._encode_batch, max_batch_size=batch_size, max_wait_ms=max_wait_ms,
+                                    workers=workers, name=f"embed:{model_name}")
+
+    @property
+    def model(self) -> str:
+        """Identity recorded in index manifests; the quantized variant is a different model."""
+        return f"{self.model_name}-int8" if self.quantize else self.model_name
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        if self._encoder is not None:
+            vectors = np.asarray(self._encoder(texts), dtype=np.float32)
+        else:
+            vectors = self._st_model().encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                              normalize_embeddings=False, show_progress_bar=False)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors
+
+    def _st_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self.log.info("Loading local embedding model", model=self.model_name, device=self.device,
+                                  quantize=self.quantize)
+                    self._model = _load_sentence_transformer(self.model_name, self.device, self.quantize)
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [v.tolist() for v in self.batcher.map(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.map([text])[0].tolist()
+
+
+_LOCAL_MODELS: Dict[Tuple[Any, ...], LocalEmbeddings] = {}
+_LOCAL_GUARD = threading.Lock()
+
+
+def get_local_embeddings(emb_config: Dict[str, Any]) -> LocalEmbeddings:
+    """One shared instance (model + batcher) per distinct configuration in this process."""
+    if importlib.util.find_spec("sentence_transformers") is None:
+        raise ImportError("EMBEDDING_PROVIDER=huggingface needs sentence-transformers: pip install sentence-transformers")
+    key = tuple(sorted((k, str(v)) for k, v in emb_config.items()))
+    with _LOCAL_GUARD:
+        emb = _LOCAL_MODELS.get(key)
+        if emb is None:
+            emb = LocalEmbeddings(
+                model_name=emb_config.get("model_name", "all-MiniLM-L6-v2"),
+                device=emb_config.get("device", "cpu"),
+                quantize=bool(emb_config.get("quantize", False)),
+                batch_size=int(emb_config.get("batch_size", 64)),
+                max_wait_ms=float(emb_config.get("max_wait_ms", 5)),
+                workers=int(emb_config.get("workers", 2)),
+                normalize=bool(emb_config.get("normalize", True)),
+            )
+            _LOCAL_MODELS[key] = emb
+        return emb
+
@@ -1,64 +1,160 @@
 import os
 import sys
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 from utils.config_loader import load_config
 from logger import custom_logger
 from exceptions.custom_exception import DocumentPortalException
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
+# Provider SDKs (langchain_groq, langchain_openai, langchain_google_genai) are
+# imported inside the branch that selects them: each costs hundreds of ms at
+# start-up and a deployment normally uses one or two of them.
+from utils.llm_gateway import GatewayChatModel, get_gateway
+from utils.llm_router import RoutedChatModel, get_router
+from utils.local_embeddings import get_local_embeddings
 
 #log=custom_logger.CustomLogger().get_logger(__name__)
 
+_PROVIDER_API_KEYS={"google":"GOOGLE_API_KEY","groq":"GROQ_API_KEY","openai":"OPENAI_API_KEY"}
+
+
+def describe_embeddings(embeddings: Any) -> Dict[str, Optional[str]]:
+    """``{"backend", "model"}`` of an embeddings object, as recorded in index manifests."""
+    backend = getattr(embeddings, "backend", None)
+    if backend is None:
+        name = type(embeddings).__name__
+        backend = {"GoogleGenerativeAIEmbeddings": "google", "OpenAIEmbeddings": "openai",
+                   "HuggingFaceEmbeddings": "huggingface"}.get(name, name)
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return {"backend": str(backend), "model": None if model is None else str(model)}
+
 class ModelLoader:
     """Configure embedding models and LLM."""
     def __init__(self):
         self.log=custom_logger.CustomLogger().get_logger(__name__)
         load_dotenv()
-        self._validate_env()
         self.config=load_config()
+        self._validate_env()
         self.log.info("Cufiguration loaded successfully", config_keys=list(self.config.keys()))
+    def _selected_providers(self) -> List[str]:
+        """Providers of the LLM (LLM_PROVIDER) and embedding model (EMBEDDING_PROVIDER) in use."""
+        llm=(self.config.get("llm",{}) or {}).get(self.llm_provider_key()) or {}
+        emb=(self.config.get("embedding_model",{}) or {}).get(os.getenv("EMBEDDING_PROVIDER","google")) or {}
+        return [p for p in (llm.get("provider"),emb.get("provider")) if p]
     def _validate_env(self):
         """
         validate necessary environment variables.
-        Ensure that API keys are exist.
+        Only the API keys of the selected google/groq providers are required:
+        huggingface embeddings run locally and OpenAI-compatible servers may
+        not need one. Other keys are read if present (fallback providers).
         """
-        required_vars=["GOOGLE_API_KEY","GROQ_API_KEY"]
+        selected=self._selected_providers()
+        required_vars=sorted({_PROVIDER_API_KEYS[p] for p in selected if p in ("google","groq")})
+        optional_vars=[k for k in _PROVIDER_API_KEYS.values() if k not in required_vars]
         self.api_keys={key:os.getenv(key) for key in required_vars}
         missing=[k for k,v in self.api_keys.items() if not v]
+        self.api_keys.update({key:os.getenv(key) for key in optional_vars})
 
         if missing:
-            self.log.error("Missing environment variables",missing_vars=missing)
+            self.log.error("Missing environment variables",missing_vars=missing,providers=selected)
             raise DocumentPortalException("Missing Environment Variables",sys)
         self.log.info("Environment variables validated",available_keys=[k for k in self.api_keys if self.api_keys[k]])
     def load_embeddings(self):
         """
-        Load and return the embedding model.
+        Load and return the embedding model selected by EMBEDDING_PROVIDER (default: google).
         """
         try:
-            self.log.info("Loading embedding model....")
-            model_name=self.config["embedding_model"]["google"]["model_name"]
-            return GoogleGenerativeAIEmbeddings(model=model_name)
+            embedding_block=self.config["embedding_model"]
+            provider_key=os.getenv("EMBEDDING_PROVIDER","google")
+            if provider_key not in embedding_block:
+                raise ValueError(f"Embedding provider '{provider_key}' not found in config.")
+
+            emb_config=embedding_block[provider_key]
+            provider=emb_config.get("provider")
+            model_name=emb_config.get("model_name")
+            self.log.info("Loading embedding model....",provider=provider,model=model_name)
+
+            if provider=="google":
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                return GoogleGenerativeAIEmbeddings(model=model_name)
+            elif provider=="huggingface":
+                # local CPU inference, shared per process; no API key or network needed
+                return get_local_embeddings(emb_config)
+            elif provider=="openai":
+                from langchain_openai import OpenAIEmbeddings
+                base_url=os.getenv("OPENAI_BASE_URL") or emb_config.get("base_url")
+                return OpenAIEmbeddings(
+                    model=model_name,
+                    api_key=self.api_keys["OPENAI_API_KEY"],
+                    base_url=base_url,
+                    # OpenAI-compatible servers expect raw strings, not tiktoken ids
+                    check_embedding_ctx_length=base_url is None
+                )
+            raise ValueError(f"Unsupported embedding provider: {provider}")
         except Exception as e:
             self.log.error("Error in loading Embedding model",error=str(e))
             raise DocumentPortalException("Failed to load embedding model",sys)
-    def load_llm(self):
+    def llm_provider_key(self) -> str:
+        return os.getenv("LLM_PROVIDER",'google')
+    def get_llm_config(self,provider_key:Optional[str]=None) -> dict:
         """
-        Load and return the LLM , LLM will be load dynamically.
+        Return the config block of the LLM provider selected by LLM_PROVIDER (default: google).
         """
         llm_block=self.config["llm"]
-
-        self.log.info("Loading LLM...")
-
-        provider_key=os.getenv("LLM_PROVIDER",'google')
+        provider_key=provider_key or self.llm_provider_key()
 
         if provider_key not in llm_block:
-            self.self.log.error("LLM provider not found in config",provider_key=provider_key)
+            self.log.error("LLM provider not found in config",provider_key=provider_key)
             raise ValueError(f"Provider '{provider_key}' not found in config.")
-        
-        llm_config=llm_block[provider_key]
+        return llm_block[provider_key]
+    def fallback_providers(self) -> List[str]:
+        """
+        Providers to hedge/fail over to after the primary: LLM_FALLBACK_PROVIDERS
+        (comma separated, empty = none) or llm_routing.fallbacks, keeping only
+        those configured and with credentials.
+        """
+        routing=self.config.get("llm_routing",{}) or {}
+        if not routing.get("enabled",True):
+            return []
+        env=os.getenv("LLM_FALLBACK_PROVIDERS")
+        names=[n.strip() for n in env.split(",") if n.strip()] if env is not None else list(routing.get("fallbacks",[]))
+        primary=self.llm_provider_key()
+        return [n for n in names
+                if n!=primary and n in self.config["llm"] and self.api_keys.get(_PROVIDER_API_KEYS.get(n,""))]
+    def load_llm(self):
+        """
+        Load and return the LLM , LLM will be load dynamically.
+        Unless llm_gateway.enabled is false each client is wrapped in its
+        provider's gateway (single-flight + rate limit + priority); with
+        fallback providers the result is a RoutedChatModel (hedging + failover).
+        """
+        self.log.info("Loading LLM...")
+
+        primary=self.llm_provider_key()
+        llm=self._load_provider_llm(primary)
+        fallbacks=self.fallback_providers()
+        if not fallbacks:
+            return llm
+        models={primary:llm}
+        for name in fallbacks:
+            try:
+                models[name]=self._load_provider_llm(name)
+            except Exception as e:
+                self.log.warning("Skipping fallback LLM provider",provider=name,error=str(e))
+        if len(models)==1:
+            return llm
+        routing=self.config.get("llm_routing",{}) or {}
+        self.log.info("LLM routing enabled",primary=primary,fallbacks=list(models)[1:])
+        return RoutedChatModel(models=models,primary=primary,router=get_router(routing,list(models)))
+    def _load_provider_llm(self,provider_key:str):
+        llm_config=self.get_llm_config(provider_key)
+        llm=self._create_llm(llm_config)
+        gateway_config=self.config.get("llm_gateway",{}) or {}
+        if not gateway_config.get("enabled",True):
+            return llm
+        return GatewayChatModel(inner=llm,gateway=get_gateway(provider_key,llm_config,gateway_config),
+                                provider=llm_config.get("provider"),
+                                structured_output=llm_config.get("structured_output"))
+    def _create_llm(self,llm_config:dict):
         provider=llm_config.get("provider")
         model_name=llm_config.get("model_name")
         temperature=llm_config.get("temperature",0.2)
@@ -66,6 +162,7 @@ class ModelLoader:
 
         self.log.info("Loading LLM",provider=provider,model=model_name,temperature=temperature,max_tokens=max_tokens)
         if provider=='google':
+            from langchain_google_genai import ChatGoogleGenerativeAI
             llm=ChatGoogleGenerativeAI(
                 model=model_name,
                 temperature=temperature,
@@ -73,6 +170,7 @@ class ModelLoader:
             )
             return llm
         elif provider=='groq':
+            from langchain_groq import ChatGroq
             llm=ChatGroq(
                 model=model_name,
                 api_key=self.api_keys["GROQ_API_KEY"],
@@ -80,9 +178,11 @@ class ModelLoader:
             )
             return llm
         elif provider=='openai':
+            from langchain_openai import ChatOpenAI
             llm=ChatOpenAI(
                 model=model_name,
                 api_key=self.api_keys["OPENAI_API_KEY"],
+                base_url=os.getenv("OPENAI_BASE_URL") or llm_config.get("base_url"),
                 temperature=temperature,
                 max_tokens=max_tokens
             )
@@ -0,0 +1,386 @@
+"""
+On-demand sampling profiles of live requests.
+
+Off unless the token named by ``profiling.token_env`` (PROFILING_TOKEN) is
+set. Then:
+
+* a request to a ``@profiled`` handler carrying ``X-Profile: <token>`` is
+  sampled on the thread running the handler for as long as it runs (and
+  while a ``profiled_stream`` body produces its chunks); the response names
+  the file in ``X-Profile-File``,
+* ``Profiler.start("window", seconds=...)`` (``POST /admin/profile``)
+  samples every thread of the process for a time window, which also covers
+  work the handler fans out to pools (embedding batches, bulk compare).
+
+A single sampler thread wakes every ``interval_ms`` while a profile is
+active and reads the stacks of the target threads with
+``sys._current_frames()``, so the profiled code is not instrumented and
+runs at full speed. Identical stacks are aggregated as they are sampled.
+With no profile active the only cost is a header lookup in the middleware
+and a ``ContextVar.get()`` per ``@profiled`` call.
+
+Profiles are written to ``profiling.dir`` as speedscope JSON
+(https://www.speedscope.app) or collapsed stacks (``flamegraph.pl``,
+speedscope, ...). A file is capped at ``max_file_bytes`` by dropping the
+rarest stacks (their samples are kept as one ``(truncated)`` stack, so the
+totals stay right) and only the newest ``max_files`` profiles are kept.
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+
+FORMATS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+_TRUNCATED = ("(truncated)", "", 0)
+
+_ACTIVE: ContextVar[Optional["Profile"]] = ContextVar("document_portal_profile", default=None)
+
+
+def _short_path(filename: str) -> str:
+    cut = filename.rfind("site-packages" + os.sep)
+    if cut >= 0:
+        return filename[cut + len("site-packages") + 1:]
+    try:
+        return os.path.relpath(filename)
+    except ValueError:                      # another drive on Windows
+        return filename
+
+
+class Profile:
+    """Aggregated samples of one request or time window."""
+    def __init__(self, name: str, kind: str, label: str, fmt: str, interval_s: float, max_seconds: float):
+        self.name = name
+        self.kind = kind
+        self.label = label
+        self.format = fmt
+        self.interval_s = interval_s
+        self.started = time.monotonic()
+        self.deadline = self.started + max_seconds
+        self.wall_started = time.time()
+        self.threads: Dict[int, str] = {}       # request profiles: handler threads being sampled
+        self.stacks: Counter = Counter()        # (thread name, frame ids root -> leaf) -> samples
+        self.frames: Dict[Any, int] = {}        # code object -> frame id
+        self.frame_info: List[Tuple[str, str, int]] = []
+        self.samples = 0
+        self.finished = False
+        self.path: Optional[Path] = None
+
+    def thread(self):
+        """Context manager adding the calling thread to a request profile."""
+        return _ThreadScope(self)
+
+    def record(self, thread: str, frame) -> None:
+        ids = []
+        while frame is not None:
+            code = frame.f_code
+            fid = self.frames.get(code)
+            if fid is None:
+                fid = self.frames[code] = len(self.frame_info)
+                self.frame_info.append((code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+            ids.append(fid)
+            frame = frame.f_back
+        ids.reverse()
+        self.stacks[(thread, tuple(ids))] += 1
+        self.samples += 1
+
+
+class _ThreadScope:
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.ident = threading.get_ident()
+
+    def __enter__(self):
+        self.profile.threads[self.ident] = threading.current_thread().name
+        return self.profile
+
+    def __exit__(self, *exc):
+        self.profile.threads.pop(self.ident, None)
+        return False
+
+
+def profiled(func):
+    """Let a sync handler be sampled when its request asked for a profile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _ACTIVE.get()
+        if profile is None or profile.finished:
+            return func(*args, **kwargs)
+        with profile.thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def profiled_stream(chunks: Iterable[Any]) -> Iterator[Any]:
+    """
+    Wrap a ``StreamingResponse`` body made in a ``@profiled`` handler so each
+    chunk is produced under the request's profile: the body runs after the
+    handler returned, on whichever threadpool thread pulls the next chunk.
+    """
+    profile = _ACTIVE.get()
+    if profile is None:
+        return iter(chunks)
+
+    def stream():
+        it = iter(chunks)
+        while True:
+            if profile.finished:
+                yield from it
+                return
+            with profile.thread():
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    return
+            yield chunk
+    return stream()
+
+
+class Profiler:
+    def __init__(self, out_dir: str = "profiles", token: Optional[str] = None, interval_ms: float = 5.0,
+                 max_seconds: float = 60.0, max_active: int = 2, max_files: int = 50,
+                 max_file_bytes: int = 5_000_000, fmt: str = "speedscope"):
+        self.log = CustomLogger().get_logger(__name__)
+        if fmt not in FORMATS:
+            raise ValueError(f"profile format must be one of {sorted(FORMATS)}")
+        self.out_dir = Path(out_dir)
+        self.token = token or None
+        self.interval_s = max(0.001, float(interval_ms) / 1000.0)
+        self.max_seconds = float(max_seconds)
+        self.max_active = max(1, int(max_active))
+        self.max_files = max(1, int(max_files))
+        self.max_file_bytes = int(max_file_bytes)
+        self.format = fmt
+        self._active: List[Profile] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self.stats = {"requests": 0, "windows": 0, "busy": 0, "unauthorized": 0, "samples": 0,
+                      "files_written": 0, "files_pruned": 0, "truncated": 0}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "Profiler":
+        cfg = (config or {}).get("profiling", {}) or {}
+        return cls(out_dir=os.getenv("PROFILE_DIR") or cfg.get("dir", "profiles"),
+                   token=os.getenv(cfg.get("token_env", "PROFILING_TOKEN")),
+                   interval_ms=float(cfg.get("interval_ms", 5)), max_seconds=float(cfg.get("max_seconds", 60)),
+                   max_active=int(cfg.get("max_active", 2)), max_files=int(cfg.get("max_files", 50)),
+                   max_file_bytes=int(cfg.get("max_file_bytes", 5_000_000)), fmt=cfg.get("format", "speedscope"))
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None
+
+    def authorized(self, token: Optional[str]) -> bool:
+        ok = self.enabled and token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+        if not ok and token is not None:
+            self.stats["unauthorized"] += 1
+        return ok
+
+    # ---------- Profiles ----------
+
+    def start(self, kind: str = "request", label: str = "", seconds: Optional[float] = None,
+              fmt: Optional[str] = None) -> Optional[Profile]:
+        """
+        Begin a ``request`` profile (add threads with ``profile.thread()``, end
+        with ``finish``) or a ``window`` over all threads that finishes by
+        itself after ``seconds``. None when ``max_active`` profiles run.
+        """
+        fmt = fmt if fmt in FORMATS else self.format
+        seconds = min(self.max_seconds, float(seconds)) if seconds else self.max_seconds
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:40] or kind
+        name = f"profile-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{slug}-{uuid.uuid4().hex[:6]}{FORMATS[fmt]}"
+        profile = Profile(name, kind, label, fmt, self.interval_s, seconds)
+        with self._lock:
+            if len(self._active) >= self.max_active:
+                self.stats["busy"] += 1
+                return None
+            self._active.append(profile)
+            self.stats["requests" if kind == "request" else "windows"] += 1
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        self.log.info("Profiling started", profile=name, kind=kind, label=label, seconds=seconds)
+        return profile
+
+    def finish(self, profile: Profile) -> Optional[Path]:
+        with self._lock:
+            if profile.finished:
+                return profile.path
+            profile.finished = True
+            if profile in self._active:
+                self._active.remove(profile)
+        try:
+            profile.path = self._write(profile)
+        except OSError as e:
+            self.log.error("Failed to write profile", profile=profile.name, error=str(e))
+            return None
+        self._prune()
+        return profile.path
+
+    def _sample(self):
+        me = threading.get_ident()
+        names: Dict[int, str] = {}
+        while True:
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                with self._lock:
+                    if not self._active:
+                        self._sampler = None
+                        return
+                continue
+            now = time.monotonic()
+            frames = sys._current_frames()
+            for profile in active:
+                if now >= profile.deadline:
+                    if profile.kind == "window":
+                        self.finish(profile)
+                    continue
+                if profile.kind == "window":
+                    targets = [tid for tid in frames if tid != me]
+                    if any(tid not in names for tid in targets):
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                else:
+                    targets = list(profile.threads)
+                for tid in targets:
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        profile.record(profile.threads.get(tid) or names.get(tid, str(tid)), frame)
+                        self.stats["samples"] += 1
+            del frames
+            time.sleep(max(0.0, self.interval_s - (time.monotonic() - now)))
+
+    # ---------- Files ----------
+
+    def _frame_name(self, profile: Profile, fid: int) -> str:
+        name, path, line = profile.frame_info[fid] if fid >= 0 else _TRUNCATED
+        return f"{name} ({path}:{line})" if path else name
+
+    def _capped(self, profile: Profile, size) -> Tuple[List[Tuple[Tuple[str, tuple], int]], int]:
+        """Most frequent stacks that fit in ``max_file_bytes`` (``size(stack)`` bytes each), samples dropped."""
+        kept, used, dropped = [], 0, 0
+        for key, count in profile.stacks.most_common():
+            cost = size(key)
+            if used + cost > self.max_file_bytes:
+                dropped += count
+                continue
+            kept.append((key, count))
+            used += cost
+        return kept, dropped
+
+    def _write(self, profile: Profile) -> Path:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / profile.name
+        interval_ms = round(profile.interval_s * 1000, 3)
+        if profile.format == "collapsed":
+            lines = {}
+
+            def size(key):
+                thread, ids = key
+                lines[key] = ";".join([thread, *(self._frame_name(profile, f) for f in ids)])
+                return len(lines[key].encode("utf-8")) + 12
+
+            kept, dropped = self._capped(profile, size)
+            body = "".join(f"{lines[key]} {count}\n" for key, count in kept)
+            if dropped:
+                body += f"{_TRUNCATED[0]} {dropped}\n"
+        else:
+            kept, dropped = self._capped(profile, lambda key: 8 * len(key[1]) + 16)
+            used = sorted({f for (_, ids), _ in kept for f in ids})
+            remap = {f: i for i, f in enumerate(used)}
+            frames = [{"name": n, "file": p, "line": ln} for n, p, ln in (profile.frame_info[f] for f in used)]
+            by_thread: Dict[str, Tuple[list, list]] = {}
+            for (thread, ids), count in kept:
+                samples, weights = by_thread.setdefault(thread, ([], []))
+                samples.append([remap[f] for f in ids])
+                weights.append(round(count * interval_ms, 3))
+            if dropped:
+                frames.append({"name": _TRUNCATED[0]})
+                samples, weights = by_thread.setdefault(_TRUNCATED[0], ([], []))
+                samples.append([len(frames) - 1])
+                weights.append(round(dropped * interval_ms, 3))
+            body = json.dumps({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "exporter": "document-portal", "name": f"{profile.kind} {profile.label}".strip(),
+                "activeProfileIndex": 0, "shared": {"frames": frames},
+                "profiles": [{"type": "sampled", "name": thread, "unit": "milliseconds", "startValue": 0,
+                              "endValue": round(sum(weights), 3), "samples": samples, "weights": weights}
+                             for thread, (samples, weights) in by_thread.items()],
+            })
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(body, encoding="utf-8")
+        os.replace(tmp, path)
+        self.stats["files_written"] += 1
+        self.stats["truncated"] += bool(dropped)
+        self.log.info("Profile written", profile=profile.name, kind=profile.kind, label=profile.label,
+                      samples=profile.samples, stacks=len(profile.stacks), dropped_samples=dropped,
+                      seconds=round(time.monotonic() - profile.started, 3), bytes=path.stat().st_size)
+        return path
+
+    def _prune(self):
+        files = sorted(self.files(), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in files[self.max_files:]:
+            try:
+                old.unlink()
+                self.stats["files_pruned"] += 1
+            except FileNotFoundError:
+                pass
+
+    def files(self) -> List[Path]:
+        if not self.out_dir.is_dir():
+            return []
+        return [p for p in self.out_dir.iterdir()
+                if p.name.startswith("profile-") and p.name.endswith(tuple(FORMATS.values()))]
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            active = [{"profile": p.name, "kind": p.kind, "label": p.label, "samples": p.samples}
+                      for p in self._active]
+        files = sorted(self.files(), key=lambda p: p.stat().st_mtime, reverse=True)
+        return {"enabled": self.enabled, "dir": str(self.out_dir), "active": active, **self.stats,
+                "files": [{"name": p.name, "bytes": p.stat().st_size} for p in files]}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware starting a request profile for requests with a valid ``X-Profile`` header."""
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.enabled:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or ())
+        token = headers.get(b"x-profile")
+        if token is None or not self.profiler.authorized(token.decode("latin-1")):
+            return await self.app(scope, receive, send)
+        fmt = headers.get(b"x-profile-format", b"").decode("latin-1") or None
+        profile = self.profiler.start("request", label=f"{scope.get('method', '')} {scope['path']}", fmt=fmt)
+        if profile is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_name(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-file", profile.name.encode())]}
+            await send(message)
+
+        reset = _ACTIVE.set(profile)
+        try:
+            await self.app(scope, receive, send_with_name)
+        finally:
+            _ACTIVE.reset(reset)
+            await asyncio.get_running_loop().run_in_executor(None, self.profiler.finish, profile)
@@ -0,0 +1,315 @@
+"""
+Session affinity across several ``api.main:app`` nodes.
+
+A session's FAISS index lives on the local disk of the node that built it,
+so every node runs the same ``SessionRouter``: a consistent-hash ring over
+``CLUSTER_NODES`` (comma-separated base URLs, identical on every node; this
+node is ``NODE_URL``). ``SessionAffinityMiddleware`` looks up the owner of
+each ``/chat/index``, ``/chat/query`` and ``DELETE /chat/index/documents``
+request by its ``session_id`` (``X-Session-Id`` header, query string or form
+field) and
+
+* serves it locally when this node owns the session,
+* otherwise proxies it to the owner (``mode: forward``) or answers
+  ``307`` with the owner's URL (``mode: redirect``).
+
+``/chat/index`` without a session id is served locally with a new id that
+hashes to this node, so the index is built where later queries land.
+
+Each node sits on ``vnodes`` points of the ring; adding or removing a node
+only moves the sessions on the arcs it gains or loses (about 1/N of them).
+An owner that refuses connections is skipped for ``down_for_s`` and its
+sessions fall to the next node on the ring until it answers again.
+Forwarded requests carry ``X-Affinity-Hop`` and are never forwarded twice;
+every response says which node served it in ``X-Served-By``.
+"""
+from __future__ import annotations
+import asyncio
+import bisect
+import hashlib
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs
+
+from logger.custom_logger import CustomLogger
+from utils.file_io import generate_session_id
+
+if TYPE_CHECKING:
+    import httpx
+
+ROUTED_PATHS = {"/chat/index", "/chat/query", "/chat/index/documents"}
+SHARED_KEY = "__shared_index__"          # use_session_dirs=false: one index, one owner
+HOP_HEADER = "x-affinity-hop"
+SERVED_BY_HEADER = "x-served-by"
+SESSION_HEADER = "x-session-id"
+# never copied between client, this node and the owner
+_HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+               "transfer-encoding", "upgrade", "host", "content-length"}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring with ``vnodes`` points per node."""
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def _rebuild(self):
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self._points = [p for p, _ in ring]
+        self._owners = [n for _, n in ring]
+
+    def add(self, node: str):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._rebuild()
+
+    def remove(self, node: str):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+
+    def owners(self, key: str) -> List[str]:
+        """Distinct nodes in ring order starting at ``key``'s point: the owner first, then its fallbacks."""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        seen: List[str] = []
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in seen:
+                seen.append(node)
+                if len(seen) == len(self.nodes):
+                    break
+        return seen
+
+    def owner(self, key: str) -> Optional[str]:
+        owners = self.owners(key)
+        return owners[0] if owners else None
+
+
+class SessionRouter:
+    def __init__(self, nodes: Iterable[str] = (), self_url: Optional[str] = None, vnodes: int = 160,
+                 mode: str = "forward", timeout_s: float = 300.0, down_for_s: float = 10.0,
+                 transport: Optional["httpx.AsyncBaseTransport"] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        nodes = [n.rstrip("/") for n in nodes if n.strip()]
+        self.self_url = (self_url or "").rstrip("/") or None
+        if self.self_url and nodes and self.self_url not in nodes:
+            raise ValueError(f"NODE_URL {self.self_url} is not one of CLUSTER_NODES {nodes}")
+        self.ring = HashRing(nodes, vnodes=vnodes)
+        if mode not in ("forward", "redirect"):
+            raise ValueError(f"Unknown session_affinity mode: {mode}")
+        self.mode = mode
+        self.timeout_s = timeout_s
+        self.down_for_s = down_for_s
+        self.transport = transport
+        self._down: Dict[str, float] = {}       # node -> monotonic time it may be tried again
+        self._clients: Dict[Any, "httpx.AsyncClient"] = {}
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "forwarded": 0, "redirected": 0, "failovers": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, config: Optional[Dict[str, Any]] = None) -> "SessionRouter":
+        """Router for ``CLUSTER_NODES``/``NODE_URL``; disabled (everything local) when they are unset."""
+        cfg = (config or {}).get("session_affinity", {}) or {}
+        nodes = os.getenv("CLUSTER_NODES", "").split(",")
+        return cls(nodes, self_url=os.getenv("NODE_URL"), vnodes=int(cfg.get("vnodes", 160)),
+                   mode=os.getenv("AFFINITY_MODE", cfg.get("mode", "forward")),
+                   timeout_s=float(cfg.get("timeout_s", 300)), down_for_s=float(cfg.get("down_for_s", 10)))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.self_url) and len(self.ring.nodes) > 1
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def mark_down(self, node: str):
+        with self._lock:
+            self._down[node] = time.monotonic() + self.down_for_s
+        self.log.warning("Cluster node unreachable; routing around it", node=node, seconds=self.down_for_s)
+
+    def _is_up(self, node: str) -> bool:
+        with self._lock:
+            until = self._down.get(node)
+            if until is not None and time.monotonic() >= until:
+                del self._down[node]
+                until = None
+        return until is None
+
+    def owner(self, session_id: str) -> Optional[str]:
+        """First reachable node for the session (this node counts as always reachable)."""
+        for node in self.ring.owners(session_id):
+            if node == self.self_url or self._is_up(node):
+                return node
+        return self.self_url
+
+    def owns(self, session_id: str) -> bool:
+        return not self.enabled or self.owner(session_id) == self.self_url
+
+    def new_session_id(self, max_tries: int = 1000) -> str:
+        """A fresh ``generate_session_id()`` value this node owns on the full ring (down nodes included)."""
+        session_id = generate_session_id()
+        for _ in range(max_tries):
+            if not self.enabled or self.ring.owner(session_id) == self.self_url:
+                return session_id
+            session_id = generate_session_id()
+        return session_id
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            down = sorted(n for n, until in self._down.items() if until > time.monotonic())
+        return {"enabled": self.enabled, "self": self.self_url, "nodes": list(self.ring.nodes), "down": down,
+                "mode": self.mode, "vnodes": self.ring.vnodes, **self.stats}
+
+    def client(self) -> "httpx.AsyncClient":
+        """One pooled client per event loop (the server's, or each test client's)."""
+        import httpx
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                for closed in [lp for lp in self._clients if lp.is_closed()]:
+                    del self._clients[closed]
+                client = httpx.AsyncClient(transport=self.transport, timeout=self.timeout_s,
+                                           limits=httpx.Limits(max_connections=256, max_keepalive_connections=64))
+                self._clients[loop] = client
+        return client
+
+
+async def _read_body(receive) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("client disconnected")
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _replay(body: bytes):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+    return receive
+
+
+async def _form_fields(scope, body: bytes) -> Dict[str, str]:
+    """String fields of a urlencoded or multipart body (uploads are parsed but not kept)."""
+    from starlette.requests import Request
+    headers = dict(scope["headers"])
+    ctype = headers.get(b"content-type", b"").decode("latin-1")
+    if not ctype.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        return {}
+    async with Request(scope, _replay(body)).form() as form:
+        return {k: v for k, v in form.items() if isinstance(v, str)}
+
+
+def _session_key(fields: Dict[str, str]) -> Optional[str]:
+    if str(fields.get("use_session_dirs", "true")).lower() in ("false", "0", "no", "off"):
+        return SHARED_KEY
+    return fields.get("session_id") or None
+
+
+class SessionAffinityMiddleware:
+    """ASGI middleware sending session-scoped chat requests to the session's owner node."""
+    def __init__(self, app, router: SessionRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        router = self.router
+        if scope["type"] != "http" or not router.enabled:
+            return await self.app(scope, receive, send)
+        served_by = router.self_url.encode("latin-1")
+
+        async def send_tagged(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (SERVED_BY_HEADER.encode(), served_by)]}
+            await send(message)
+
+        headers = dict(scope["headers"])
+        if scope["path"] not in ROUTED_PATHS or HOP_HEADER.encode() in headers:
+            return await self.app(scope, receive, send_tagged)
+
+        body = await _read_body(receive)
+        fields = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        if SESSION_HEADER.encode() in headers:
+            fields["session_id"] = headers[SESSION_HEADER.encode()].decode("latin-1")
+        elif "session_id" not in fields and scope["method"] == "POST":
+            fields.update(await _form_fields(scope, body))
+        key = _session_key(fields)
+
+        while key is not None:
+            owner = router.owner(key)
+            if owner is None or owner == router.self_url:
+                break
+            if router.mode == "redirect":
+                router._count("redirected")
+                return await self._redirect(scope, send, owner)
+            try:
+                return await self._forward(scope, body, send, owner)
+            except _Unreachable:
+                router.mark_down(owner)
+                router._count("failovers")
+        router._count("local")
+        await self.app(scope, _replay(body), send_tagged)
+
+    @staticmethod
+    def _target(scope, owner: str) -> str:
+        query = scope.get("query_string", b"").decode("latin-1")
+        return f"{owner}{scope['path']}" + (f"?{query}" if query else "")
+
+    async def _redirect(self, scope, send, owner: str):
+        await send({"type": "http.response.start", "status": 307,
+                    "headers": [(b"location", self._target(scope, owner).encode("latin-1")),
+                                (b"content-length", b"0"),
+                                (SERVED_BY_HEADER.encode(), self.router.self_url.encode("latin-1"))]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _forward(self, scope, body: bytes, send, owner: str):
+        import httpx
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]
+                   if k.decode("latin-1").lower() not in _HOP_BY_HOP]
+        headers.append((HOP_HEADER, self.router.self_url))
+        client = self.router.client()
+        request = client.build_request(scope["method"], self._target(scope, owner), headers=headers, content=body)
+        try:
+            response = await client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise _Unreachable(owner) from e
+        self.router._count("forwarded")
+        try:
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": [(k, v) for k, v in response.headers.raw
+                                    if k.decode("latin-1").lower() not in _HOP_BY_HOP - {"content-length"}]})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except httpx.HTTPError as e:
+            self.router._count("errors")
+            self.router.log.error("Forwarding to session owner failed", owner=owner, path=scope["path"], error=str(e))
+            raise
+        finally:
+            await response.aclose()
+
+
+class _Unreachable(Exception):
+    pass
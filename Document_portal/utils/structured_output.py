@@ -0,0 +1,379 @@
+"""
+Structured LLM output without a second model call.
+
+Two layers replace ``OutputFixingParser`` (which sent every malformed reply
+back to the LLM for a rewrite):
+
+* generation-time constraints: ``structured_llm(llm, Model)`` asks providers
+  that support it for JSON output (``llm.<provider>.structured_output``:
+  ``json_schema`` sends the pydantic schema, ``json_mode`` only forces JSON);
+* ``TolerantJsonParser`` repairs what still comes back malformed, locally:
+  ``<think>`` blocks, code fences and surrounding prose, comments, trailing or
+  missing commas, single quotes, unquoted keys, Python literals, raw newlines
+  in strings and output truncated mid-object.
+
+Every parse is counted in ``stats`` (per schema and per repair kind), so the
+fix-up rate of each provider/prompt can be watched (``fixup_rates()``).
+"""
+from __future__ import annotations
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from pydantic import ValidationError
+
+from logger.custom_logger import CustomLogger
+
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.S | re.I)
+_FENCE_RE = re.compile(r"```[A-Za-z]*[ \t]*\n?(.*?)(?:```|$)", re.S)
+_WORD_RE = re.compile(r"[A-Za-z_$][\w$.-]*")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null",
+             "NaN": "null", "Infinity": "null", "undefined": "null"}
+_ESCAPES = set('"\\/bfnrtu')
+
+log = CustomLogger().get_logger(__name__)
+
+stats: Dict[str, Any] = {"calls": 0, "clean": 0, "repaired": 0, "failed": 0, "repairs": {}, "schemas": {}}
+_stats_lock = threading.Lock()
+
+
+def _read_string(text: str, i: int, fix) -> Tuple[str, int]:
+    """JSON string literal starting at the quote ``text[i]``; returns (literal, index after it)."""
+    quote, n = text[i], len(text)
+    buf: List[str] = []
+    j = i + 1
+    while j < n:
+        ch = text[j]
+        if ch == "\\":
+            nxt = text[j + 1] if j + 1 < n else ""
+            if nxt == "'" and quote == "'":
+                buf.append("'")
+            elif nxt in _ESCAPES:
+                buf.append(ch + nxt)
+            else:
+                buf.append("\\\\" + nxt)
+                fix("escapes")
+            j += 2
+            continue
+        if ch == quote:
+            # a quote only closes the string where JSON could continue after it
+            rest = text[j + 1:j + 64].lstrip()
+            if not rest or rest[0] in ",:}]":
+                return '"' + "".join(buf) + '"', j + 1
+            fix("unescaped_quotes")
+            buf.append('\\"' if ch == '"' else ch)
+        elif ch == '"':
+            buf.append('\\"')
+        elif ch in "\n\r\t":
+            buf.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+            fix("control_chars")
+        elif ord(ch) < 0x20:
+            buf.append(f"\\u{ord(ch):04x}")
+            fix("control_chars")
+        else:
+            buf.append(ch)
+        j += 1
+    fix("truncated")
+    return '"' + "".join(buf) + '"', n
+
+
+def _normalize(text: str, start: int) -> Tuple[str, List[str], int]:
+    """
+    Rewrite the JSON-ish value starting at ``text[start]`` into strict JSON.
+    Returns (json text, repair kinds applied, index after the value).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: List[str] = []
+    last = None                 # "open" | "value" | "comma" | "colon"
+    pending_comma = False
+    key_mark = None             # output length before an object key still waiting for its ":"
+    i, n = start, len(text)
+
+    def fix(kind: str):
+        if kind not in repairs:
+            repairs.append(kind)
+
+    def drop_dangling_key():
+        nonlocal key_mark
+        if key_mark is not None:
+            del out[key_mark:]
+            key_mark = None
+            fix("missing_values")
+
+    def begin_value():
+        nonlocal pending_comma, key_mark
+        if stack and stack[-1] == "}" and last != "colon":
+            key_mark = len(out)
+        if pending_comma:
+            out.append(",")
+            pending_comma = False
+        elif last == "value":
+            out.append(",")
+            fix("missing_commas")
+
+    while i < n:
+        c = text[i]
+        if c in " \t\r\n":
+            i += 1
+        elif text.startswith("//", i) or text.startswith("#", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            fix("comments")
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            fix("comments")
+        elif c in "{[":
+            begin_value()
+            out.append(c)
+            stack.append("}" if c == "{" else "]")
+            last = "open"
+            i += 1
+        elif c in "}]":
+            i += 1
+            if c not in stack:
+                fix("stray_characters")
+                continue
+            if pending_comma:
+                pending_comma = False
+                fix("trailing_commas")
+            drop_dangling_key()
+            if last == "colon":
+                out.append("null")
+                fix("missing_values")
+            while stack[-1] != c:
+                out.append(stack.pop())
+                fix("unbalanced")
+            out.append(stack.pop())
+            last = "value"
+            if not stack:
+                return "".join(out), repairs, i
+        elif c == ",":
+            if last in ("open", "comma", "colon") or pending_comma:
+                fix("extra_commas")
+            else:
+                pending_comma = True
+                last = "comma"
+            i += 1
+        elif c == ":":
+            key_mark = None
+            out.append(":")
+            last = "colon"
+            i += 1
+        elif c in "\"'":
+            if c == "'":
+                fix("single_quotes")
+            begin_value()
+            literal, i = _read_string(text, i, fix)
+            out.append(literal)
+            last = "value"
+        elif _NUMBER_RE.match(text, i):
+            token = _NUMBER_RE.match(text, i).group(0)
+            begin_value()
+            try:
+                json.loads(token)
+                out.append(token)
+            except ValueError:
+                out.append(repr(float(token)))
+                fix("numbers")
+            i += len(token)
+            last = "value"
+        elif _WORD_RE.match(text, i):
+            word = _WORD_RE.match(text, i).group(0)
+            begin_value()
+            if stack[-1] == "}" and last != "colon":
+                out.append(json.dumps(word))
+                fix("unquoted_keys")
+                i += len(word)
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+                if word not in ("true", "false", "null"):
+                    fix("python_literals")
+                i += len(word)
+            else:
+                end = i
+                while end < n and text[end] not in ",}]\n":
+                    end += 1
+                out.append(json.dumps(text[i:end].strip()))
+                fix("bare_strings")
+                i = end
+            last = "value"
+        else:
+            fix("stray_characters")
+            i += 1
+
+    if pending_comma:
+        fix("trailing_commas")
+    drop_dangling_key()
+    if last == "colon":
+        out.append("null")
+    if stack:
+        out.extend(reversed(stack))
+        fix("truncated")
+    return "".join(out), repairs, n
+
+
+def _body(text: str) -> Tuple[str, List[str]]:
+    """Strip reasoning blocks and code fences; returns (candidate text, repairs)."""
+    repairs: List[str] = []
+    stripped = _THINK_RE.sub("", text)
+    if stripped != text:
+        repairs.append("think_block")
+    for block in _FENCE_RE.findall(stripped):
+        if "{" in block or "[" in block:
+            return block.strip(), repairs
+    return stripped.strip(), repairs
+
+
+def _start(body: str, expect: Optional[str]) -> int:
+    first = {"object": "{", "array": "["}.get(expect or "")
+    if first and body.find(first) >= 0:
+        return body.find(first)
+    candidates = [p for p in (body.find("{"), body.find("[")) if p >= 0]
+    return min(candidates) if candidates else -1
+
+
+def _reshape(value: Any, expect: Optional[str], repairs: List[str]) -> Any:
+    """Unwrap a single-key object around the expected list (or a one-item list around the object)."""
+    if expect == "array" and isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            repairs.append("unwrapped")
+            return lists[0]
+    if expect == "object" and isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+        repairs.append("unwrapped")
+        return value[0]
+    return value
+
+
+def repair_json(text: str, expect: Optional[str] = None) -> Tuple[Any, List[str]]:
+    """
+    Parse the JSON value in an LLM reply, repairing it if needed.
+    ``expect`` ("object"/"array") picks the value to extract when both occur.
+    Returns (value, repair kinds; empty = parsed as-is). Raises ValueError
+    when nothing usable is found.
+    """
+    body, repairs = _body(text)
+    try:
+        return _reshape(json.loads(body), expect, repairs), repairs
+    except ValueError:
+        pass
+    start = _start(body, expect)
+    if start < 0:
+        raise ValueError("no JSON object or array in output")
+    try:
+        value, end = json.JSONDecoder().raw_decode(body, start)
+        if body[:start].strip() or body[end:].strip():
+            repairs.append("surrounding_text")
+        return _reshape(value, expect, repairs), repairs
+    except ValueError:
+        pass
+    normalized, fixed, end = _normalize(body, start)
+    if body[:start].strip() or body[end:].strip():
+        repairs.append("surrounding_text")
+    repairs.extend(fixed)
+    return _reshape(json.loads(normalized), expect, repairs), repairs
+
+
+def _expected_shape(schema: Dict[str, Any]) -> Optional[str]:
+    kind = schema.get("type")
+    return kind if kind in ("object", "array") else None
+
+
+def _record(schema: str, repairs: Optional[List[str]]):
+    """``repairs`` None = failed."""
+    with _stats_lock:
+        per = stats["schemas"].setdefault(schema, {"calls": 0, "clean": 0, "repaired": 0, "failed": 0})
+        outcome = "failed" if repairs is None else ("repaired" if repairs else "clean")
+        for bucket in (stats, per):
+            bucket["calls"] += 1
+            bucket[outcome] += 1
+        for kind in repairs or ():
+            stats["repairs"][kind] = stats["repairs"].get(kind, 0) + 1
+
+
+def fixup_rates() -> Dict[str, Dict[str, float]]:
+    """Share of parses needing local repair / failing, overall and per schema."""
+    with _stats_lock:
+        buckets = {"all": stats, **stats["schemas"]}
+        return {name: {"calls": b["calls"],
+                       "repaired": round(b["repaired"] / b["calls"], 4) if b["calls"] else 0.0,
+                       "failed": round(b["failed"] / b["calls"], 4) if b["calls"] else 0.0}
+                for name, b in buckets.items()}
+
+
+class TolerantJsonParser(JsonOutputParser):
+    """
+    ``JsonOutputParser`` that repairs malformed replies locally (see
+    ``repair_json``) and validates them against ``pydantic_object``.
+    Returns the parsed JSON, like the parser it replaces.
+    """
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        text = result[0].text
+        schema = self._get_schema(self.pydantic_object) if self.pydantic_object else {}
+        expect = _expected_shape(schema)
+        if partial:
+            try:
+                return repair_json(text, expect)[0]
+            except ValueError:
+                return None
+        name = getattr(self.pydantic_object, "__name__", "json")
+        try:
+            value, repairs = repair_json(text, expect)
+            if self.pydantic_object is not None:
+                self.pydantic_object.model_validate(value)
+        except (ValueError, ValidationError) as e:
+            _record(name, None)
+            log.warning("Structured output could not be parsed", schema=name, error=str(e)[:300])
+            raise OutputParserException(f"Invalid {name} output: {e}", llm_output=text) from e
+        _record(name, repairs)
+        if repairs:
+            log.info("Structured output repaired locally", schema=name, repairs=repairs)
+        return value
+
+
+def json_schema_spec(pydantic_object) -> Dict[str, Any]:
+    """Provider-neutral description of the expected output, passed as the ``json_schema`` call kwarg."""
+    schema = pydantic_object.model_json_schema()
+    return {"name": pydantic_object.__name__, "schema": schema, "type": _expected_shape(schema)}
+
+
+def provider_output_kwargs(provider: Optional[str], mode: Optional[str], spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generation kwargs constraining ``provider`` to ``spec``. OpenAI/Groq JSON
+    modes only produce top-level objects, so array schemas stay unconstrained
+    there and rely on the tolerant parser.
+    """
+    if mode not in ("json_schema", "json_mode"):
+        return {}
+    if provider == "google":
+        kwargs = {"response_mime_type": "application/json"}
+        if mode == "json_schema":
+            kwargs["response_schema"] = spec["schema"]
+        return kwargs
+    if provider in ("openai", "groq") and spec.get("type") == "object":
+        if mode == "json_schema" and provider == "openai":
+            return {"response_format": {"type": "json_schema",
+                                        "json_schema": {"name": spec["name"], "schema": spec["schema"],
+                                                        "strict": False}}}
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def structured_llm(llm, pydantic_object):
+    """
+    ``llm`` bound to produce ``pydantic_object`` JSON where the provider can
+    enforce it. Only gateway-wrapped models (which know their provider and
+    translate ``json_schema``) are constrained; others are returned as-is.
+    """
+    if not getattr(llm, "accepts_json_schema", False):
+        return llm
+    return llm.bind(json_schema=json_schema_spec(pydantic_object))
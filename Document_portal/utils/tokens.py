@@ -0,0 +1,28 @@
+"""
+Cheap token estimates for prompt budgeting.
+
+Uses the ~4 characters per token rule of thumb for English BPE vocabularies,
+so no tokenizer has to be downloaded or loaded on the request path.
+"""
+import math
+
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly ``max_tokens``, preferring a sentence end, then a word boundary."""
+    limit = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"), cut.rfind("? "), cut.rfind("! "))
+    if sentence_end >= limit // 2:
+        return cut[:sentence_end + 1]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut
@@ -0,0 +1,145 @@
+"""
+Start-up warmup behind the ``/ready`` probe.
+
+``api.main`` imports only what serving ``/health`` needs; the pipeline
+modules, provider SDKs, FAISS and LangChain loaders are imported on first
+use. ``Warmup`` does that first use ahead of traffic, in order:
+
+1. ``imports``: import ``warmup.modules`` (the request handlers' dependencies),
+2. ``clients``: build the LLM (gateway/router included) and embedding clients,
+3. ``restore``: with ``snapshots.restore_dir`` set, import the index
+   snapshots found there that are missing under ``FAISS_BASE``,
+4. ``indexes``: load the ``warmup.preload_indexes`` most recently written
+   indexes under ``FAISS_BASE`` into the shared index cache.
+
+``/health`` answers as soon as the process serves HTTP (liveness);
+``/ready`` answers 200 only once warmup finished (readiness), so an
+autoscaler routes traffic to a new replica only when it is hot. A failing
+import or client build marks warmup failed; an unreadable index is skipped.
+"""
+from __future__ import annotations
+import importlib
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger.custom_logger import CustomLogger
+
+DEFAULT_MODULES = [
+    "src.document_analyzer.data_analysis",
+    "src.document_ingestion.data_ingestion",
+    "src.document_compare.document_comparator",
+    "src.document_chat.retrieval",
+    "fitz",
+    "pandas",
+]
+
+
+class Warmup:
+    def __init__(self, faiss_base: str = "faiss_index", model_loader=None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.faiss_base = Path(faiss_base)
+        self.model_loader = model_loader
+        self.status = "pending"             # pending | warming | ready | failed
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {}   # step -> seconds
+        self.preloaded: List[str] = []
+        self.restored: List[str] = []
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def report(self) -> Dict[str, Any]:
+        return {"status": self.status, "error": self.error, "steps": dict(self.steps),
+                "preloaded_indexes": list(self.preloaded), "restored_indexes": list(self.restored),
+                "uptime_s": round(time.monotonic() - self._started, 3)}
+
+    def start(self) -> threading.Thread:
+        """Run warmup on a daemon thread (once); the server keeps serving ``/health`` meanwhile."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+                self._thread.start()
+            return self._thread
+
+    def skip(self):
+        """Declare the process ready without warming; everything loads on first use."""
+        self.status = "ready"
+
+    def _step(self, name: str, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.steps[name] = round(time.perf_counter() - started, 3)
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        self.status = "warming"
+        try:
+            from utils.model_loader import ModelLoader
+            loader = self.model_loader or ModelLoader()
+            cfg = loader.config.get("warmup", {}) or {}
+            if not cfg.get("enabled", True):
+                self.status = "ready"
+                return self.report()
+            self._step("imports", lambda: [importlib.import_module(m) for m in cfg.get("modules", DEFAULT_MODULES)])
+            embeddings = None
+            if cfg.get("build_clients", True):
+                embeddings = self._step("clients", lambda: self._build_clients(loader))
+            restore_dir = (loader.config.get("snapshots", {}) or {}).get("restore_dir")
+            if restore_dir:
+                self._step("restore", lambda: self._restore(loader, embeddings, Path(restore_dir)))
+            if int(cfg.get("preload_indexes", 0)) > 0:
+                self._step("indexes", lambda: self._preload(loader, embeddings, int(cfg["preload_indexes"])))
+            self.status = "ready"
+            self.log.info("Warmup finished", **self.report())
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            self.log.error("Warmup failed", error=str(e), steps=self.steps)
+        return self.report()
+
+    @staticmethod
+    def _build_clients(loader):
+        loader.load_llm()
+        return loader.load_embeddings()
+
+    def _candidates(self, limit: int) -> List[Path]:
+        from src.document_ingestion.index_store import SegmentedIndexStore
+        if not self.faiss_base.is_dir():
+            return []
+        dirs = [self.faiss_base] + [p for p in self.faiss_base.iterdir() if p.is_dir()]
+        found = [d for d in dirs if SegmentedIndexStore(d).exists()]
+        found.sort(key=lambda d: max((f.stat().st_mtime for f in d.iterdir()), default=0.0), reverse=True)
+        return found[:limit]
+
+    def _restore(self, loader, embeddings, restore_dir: Path):
+        from src.document_ingestion.index_snapshot import SNAPSHOT_SUFFIX, import_snapshot
+        from src.document_ingestion.index_store import SegmentedIndexStore
+        from utils.model_loader import describe_embeddings
+        embedding = describe_embeddings(embeddings or loader.load_embeddings())
+        for archive in sorted(restore_dir.glob(f"*{SNAPSHOT_SUFFIX}")):
+            target = self.faiss_base / archive.name[:-len(SNAPSHOT_SUFFIX)]
+            if SegmentedIndexStore(target).exists():
+                continue
+            try:
+                import_snapshot(archive, target, embedding=embedding)
+                self.restored.append(str(target))
+            except Exception as e:
+                self.log.warning("Skipping index snapshot in warmup", archive=str(archive), error=str(e))
+
+    def _preload(self, loader, embeddings, limit: int):
+        from src.document_ingestion.index_cache import get_shared_index
+        embeddings = embeddings or loader.load_embeddings()
+        store_cfg = loader.config.get("index_store", {}) or {}
+        for index_dir in self._candidates(min(limit, int(store_cfg.get("max_cached_indexes", 32)))):
+            try:
+                get_shared_index(index_dir, embeddings, mmap=bool(store_cfg.get("mmap", True)),
+                                 max_cached=int(store_cfg.get("max_cached_indexes", 32))).current()
+                self.preloaded.append(str(index_dir))
+            except Exception as e:
+                self.log.warning("Skipping index in warmup", index_dir=str(index_dir), error=str(e))